@@ -8,7 +8,7 @@ from backend.app.models.building_manager import BuildingManager
 from backend.app.models.resident import Resident
 from backend.app.models.accountant import Accountant
 from backend.app.schemas.account import AccountCreate, AccountUpdate, AccountRead
-from backend.app.core.security import create_access_token, hash_password, verify_password
+from backend.app.core.security import create_access_token, hash_password, revoke_username, verify_password
 # Import Auth
 from backend.app.api.auth import get_current_manager
 from backend.app.schemas.auth import TokenData
@@ -102,6 +102,8 @@ def delete_account(
     
     try:
         db.commit()
+        # Token đã cấp bị từ chối ngay
+        revoke_username(username)
     except IntegrityError as e:
         db.rollback()
         raise HTTPException(
@@ -8,6 +8,7 @@ from typing import List
 from sqlalchemy.exc import IntegrityError
 
 from backend.app.core.db import get_db
+from backend.app.core.security import revoke_username
 from backend.app.models.accountant import Accountant
 from backend.app.models.bill import Bill
 from backend.app.schemas.accountant import (AccountantCreate, AccountantUpdate, AccountantRead)
@@ -210,9 +211,12 @@ def delete_accountant(
             setattr(account, 'isActive', False)
     
     # Xóa Accountant
+    username = accountant.username
     try:
         db.delete(accountant)
         db.commit()
+        if username is not None:
+            revoke_username(username)
     except IntegrityError as e:
         db.rollback()
         raise HTTPException(
@@ -1,22 +1,33 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+import asyncio
+import json
+from fastapi import APIRouter, Depends, File, Form, HTTPException, Query, UploadFile, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from pydantic import BaseModel
 
-from backend.app.core.db import get_db
+from backend.app.core.db import get_db, SessionLocal
 from backend.app.api.auth import get_current_accountant
 from backend.app.models.accountant import Accountant
 from backend.app.schemas.service_fee import ServiceFeeCreate
 from backend.app.schemas.bill import BillRead, BillCreate
+from backend.app.schemas.tariff import TariffScheduleCreate, TariffScheduleRead
 from backend.app.services.accounting_services import AccountingService
+from backend.app.services.billing_job_service import BillingJobService, FINAL_STATUSES
+from backend.app.services.meter_import_service import MeterImportService
+from backend.app.services.meter_reading_service import MeterReadingService
+from backend.app.services.sepay_reconciliation_service import SepayReconciliationService
+from backend.app.services.tariff_service import TariffService
 
 class MeterReadingCreate(BaseModel):
     apartmentID: str
     month: int
     year: int
-    oldElectricity: float
+    # Bỏ trống chỉ số cũ: tự lấy chỉ số mới của kỳ trước
+    oldElectricity: Optional[float] = None
     newElectricity: float
-    oldWater: float
+    oldWater: Optional[float] = None
     newWater: float
 
 class CalculateRequest(BaseModel):
@@ -24,13 +35,24 @@ class CalculateRequest(BaseModel):
     year: int
     deadline_day: int = 10
     overwrite: bool = False
+    building_ids: Optional[List[str]] = None
+    sharded: bool = False
 
 router = APIRouter()
 
 @router.post("/meter-readings", summary="0. Nhập chỉ số điện nước (Dữ liệu nguồn)")
 def record_meter_reading(data: MeterReadingCreate, db: Session = Depends(get_db), accountant: Accountant = Depends(get_current_accountant)):
     from backend.app.models.meter_reading import MeterReading
-    
+
+    values = data.model_dump()
+    baseline = MeterReadingService.baselines(db, [data.apartmentID], data.month, data.year).get(data.apartmentID)
+    anomalies = MeterReadingService.prepare(values, baseline)
+    if MeterReadingService.is_blocking(anomalies):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="; ".join(anomaly["message"] for anomaly in anomalies)
+        )
+
     db.query(MeterReading).filter(
         MeterReading.apartmentID == data.apartmentID,
         MeterReading.month == data.month,
@@ -38,37 +60,175 @@ def record_meter_reading(data: MeterReadingCreate, db: Session = Depends(get_db)
     ).delete()
 
     new_reading = MeterReading(
-        **data.dict(),
+        **values,
         accountantID=accountant.accountantID
     )
     db.add(new_reading)
+    MeterReadingService.refresh_latest(db, [values])
     db.commit()
-    return {"message": f"Đã nhập chỉ số cho căn hộ {data.apartmentID}"}
+
+    # Kỳ đã có hóa đơn: chỉ tính lại hóa đơn của căn hộ này
+    rebill = AccountingService.rebill_apartment(
+        db, data.apartmentID, data.month, data.year, accountant.accountantID
+    )
+    return {
+        "message": f"Đã nhập chỉ số cho căn hộ {data.apartmentID}",
+        "oldElectricity": values["oldElectricity"],
+        "oldWater": values["oldWater"],
+        "anomalies": anomalies,
+        "rebill": rebill
+    }
+
+@router.post("/meter-readings/import", summary="0b. Nhập chỉ số điện nước hàng loạt từ file CSV/XLSX")
+def import_meter_readings(
+    month: int = Form(...),
+    year: int = Form(...),
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db),
+    accountant: Accountant = Depends(get_current_accountant)
+):
+    """
+    File có dòng tiêu đề với các cột apartmentID, newElectricity, newWater
+    (tùy chọn oldElectricity, oldWater; bỏ trống thì lấy chỉ số mới tháng trước).
+    Dòng hợp lệ được ghi (ghi đè nếu kỳ đã có chỉ số), dòng lỗi trả về trong errors.
+    """
+    report = MeterImportService.import_readings(
+        db, file.file, file.filename, month, year, accountant.accountantID
+    )
+
+    # Kỳ đã có hóa đơn: tính lại tăng dần cho các căn hộ vừa nhập
+    apartment_ids = report.pop("apartment_ids")
+    report["rebill"] = AccountingService.rebill_apartments(
+        db, apartment_ids, month, year, accountant.accountantID
+    )
+    return report
 
 @router.post("/service-fees", summary="1. Thiết lập đơn giá phí")
 def set_service_fee(data: ServiceFeeCreate, db: Session = Depends(get_db)):
     msg = AccountingService.create_or_update_fee(db, data, data.buildingID)
     return {"message": msg}
 
-@router.post("/bills/calculate", summary="2. Tính phí (3 luồng: Điện, Nước, Dịch vụ)")
+@router.get("/tariffs", response_model=List[TariffScheduleRead], summary="Xem các biểu giá điện/nước")
+def get_tariffs(
+    tariff_type: Optional[str] = None,
+    building_id: Optional[str] = None,
+    db: Session = Depends(get_db),
+    accountant: Accountant = Depends(get_current_accountant)
+):
+    return TariffService.list_schedules(db, tariff_type, building_id)
+
+@router.post("/tariffs", response_model=TariffScheduleRead, summary="1b. Thiết lập biểu giá bậc thang theo ngày hiệu lực")
+def set_tariff(
+    data: TariffScheduleCreate,
+    db: Session = Depends(get_db),
+    accountant: Accountant = Depends(get_current_accountant)
+):
+    """
+    Tạo/cập nhật biểu giá điện hoặc nước cho một tòa nhà (hoặc chung nếu bỏ trống buildingID).
+    Kỳ hóa đơn dùng biểu giá có ngày hiệu lực gần nhất không sau ngày đầu tháng của kỳ.
+    """
+    return TariffService.upsert_schedule(db, data)
+
+@router.delete("/tariffs/{schedule_id}", summary="Xóa biểu giá")
+def delete_tariff(
+    schedule_id: int,
+    db: Session = Depends(get_db),
+    accountant: Accountant = Depends(get_current_accountant)
+):
+    return {"success": True, "message": TariffService.delete_schedule(db, schedule_id)}
+
+@router.post("/bills/calculate", status_code=status.HTTP_202_ACCEPTED, summary="2. Tính phí (3 luồng: Điện, Nước, Dịch vụ)")
 def calculate_bills(
     payload: CalculateRequest,
     db: Session = Depends(get_db),
     accountant: Accountant = Depends(get_current_accountant)
 ):
-    try:
-        count = AccountingService.calculate_monthly_bills(
-            db=db, 
-            month=payload.month, 
-            year=payload.year, 
-            accountant_id=accountant.accountantID, 
-            deadline_day=payload.deadline_day, 
-            overwrite=payload.overwrite
-        )
-        return {"status": "SUCCESS", "message": f"Đã tạo {count} hóa đơn và gửi thông báo.", "count": count}
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=400, detail=str(e))
+    """
+    Đưa lượt tính hóa đơn vào hàng đợi và trả về job_id ngay.
+    building_ids: chỉ tính cho các tòa nhà này; sharded: tính song song mỗi tòa nhà một shard.
+    Theo dõi tiến độ qua GET /bills/jobs/{job_id} hoặc SSE /bills/jobs/{job_id}/events.
+    """
+    job = BillingJobService.enqueue(
+        db=db,
+        month=payload.month,
+        year=payload.year,
+        accountant_id=accountant.accountantID,
+        deadline_day=payload.deadline_day,
+        overwrite=payload.overwrite,
+        building_ids=payload.building_ids,
+        sharded=payload.sharded
+    )
+    return {
+        "status": job.status,
+        "message": f"Đã đưa lượt tính hóa đơn tháng {payload.month}/{payload.year} vào hàng đợi.",
+        "job_id": job.jobID
+    }
+
+@router.get("/bills/jobs/{job_id}", summary="3. Xem tiến độ tính phí")
+def get_billing_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    accountant: Accountant = Depends(get_current_accountant)
+):
+    return BillingJobService.to_dict(BillingJobService.get_job(db, job_id))
+
+@router.post("/bills/jobs/{job_id}/cancel", summary="Hủy lượt tính phí")
+def cancel_billing_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    accountant: Accountant = Depends(get_current_accountant)
+):
+    return BillingJobService.to_dict(BillingJobService.cancel(db, job_id))
+
+@router.post("/reconciliation/sepay", summary="Đối soát sao kê SePay với giao dịch")
+def reconcile_sepay(
+    since_id: Optional[int] = Query(None, description="Bỏ trống: đọc tiếp sau lượt đối soát gần nhất"),
+    db: Session = Depends(get_db),
+    accountant: Accountant = Depends(get_current_accountant)
+):
+    """
+    Tải sao kê SePay, đưa các khoản tiền về chưa có webhook vào hàng đợi gạch nợ
+    và trả về báo cáo chênh lệch.
+    """
+    return SepayReconciliationService.run(db, since_id)
+
+@router.get("/reconciliation/sepay/{run_id}", summary="Xem kết quả một lượt đối soát")
+def get_sepay_reconciliation(
+    run_id: int,
+    db: Session = Depends(get_db),
+    accountant: Accountant = Depends(get_current_accountant)
+):
+    return SepayReconciliationService.get(db, run_id)
+
+@router.get("/bills/jobs/{job_id}/events", summary="Theo dõi tiến độ tính phí (Server-Sent Events)")
+async def stream_billing_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    accountant: Accountant = Depends(get_current_accountant)
+):
+    # Kiểm tra job tồn tại (404) trong threadpool, không chặn event loop
+    await run_in_threadpool(BillingJobService.get_job, db, job_id)
+
+    def read_progress():
+        session = SessionLocal()
+        try:
+            return BillingJobService.to_dict(BillingJobService.get_job(session, job_id))
+        finally:
+            session.close()
+
+    async def event_stream():
+        last = None
+        while True:
+            progress = await run_in_threadpool(read_progress)
+            data = json.dumps(progress, default=str)
+            if data != last:
+                yield f"event: progress\ndata: {data}\n\n"
+                last = data
+            if progress["status"] in FINAL_STATUSES:
+                break
+            await asyncio.sleep(1)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
 
 @router.post("/bills/manual", summary="4. Tạo hóa đơn lẻ")
 def create_manual_bill(
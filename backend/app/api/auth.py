@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 
@@ -6,10 +6,13 @@ from backend.app.core.db import get_db
 from backend.app.core.security import create_access_token, decode_access_token, verify_password
 from backend.app.models.account import Account
 from backend.app.models.accountant import Accountant
-from backend.app.schemas.auth import LoginRequest, LoginResponse, MeResponse, TokenData
+from backend.app.schemas.auth import LoginRequest, LoginResponse, MeResponse, PrincipalContext, TokenData
+from backend.app.services.principal_service import PrincipalService
 
 router = APIRouter()
 security = HTTPBearer()
+# Kết nối SSE (EventSource) không gửi được header: cho phép token qua query ?token=
+security_optional = HTTPBearer(auto_error=False)
 
 
 @router.post("/login", response_model=LoginResponse, summary="Đăng nhập")
@@ -51,7 +54,8 @@ def login(payload: LoginRequest, db: Session = Depends(get_db)) -> LoginResponse
     # Tạo JWT token
     access_token = create_access_token(
         username=str(user.username),
-        role=str(user.role)
+        role=str(user.role),
+        resident_id=PrincipalService.lookup_resident_id(db, str(user.username))
     )
 
     # Trả về response
@@ -71,7 +75,26 @@ def get_current_user(
 
     Err `401`: Token không hợp lệ hoặc đã hết hạn
     """
-    token = credentials.credentials
+    return user_from_token(credentials.credentials)
+
+
+def get_current_user_stream(
+    credentials: HTTPAuthorizationCredentials | None = Depends(security_optional),
+    token: str | None = Query(None, description="JWT cho kết nối EventSource")
+) -> TokenData:
+    """Như get_current_user nhưng nhận token từ header hoặc query ?token= (dùng cho SSE)"""
+    raw = credentials.credentials if credentials else token
+    if not raw:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Thiếu token",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+    return user_from_token(raw)
+
+
+def user_from_token(token: str) -> TokenData:
+    """Xác thực JWT và trả về TokenData; token sai/hết hạn -> 401"""
     payload = decode_access_token(token)
 
     if not payload:
@@ -91,7 +114,23 @@ def get_current_user(
             headers={"WWW-Authenticate": "Bearer"}
         )
 
-    return TokenData(username=username, role=role)
+    return TokenData(username=username, role=role, residentID=payload.get("residentID"), iat=payload.get("iat"))
+
+
+def get_current_principal(
+    db: Session = Depends(get_db),
+    current_user: TokenData = Depends(get_current_user)
+) -> PrincipalContext:
+    """Ngữ cảnh cư dân (residentID, apartmentID, buildingID) của user hiện tại, có cache"""
+    return PrincipalService.get(db, current_user)
+
+
+def get_current_resident_id(
+    db: Session = Depends(get_db),
+    current_user: TokenData = Depends(get_current_user)
+) -> int | None:
+    """residentID của user hiện tại (lấy từ claim của token, không cần đọc DB); None nếu không phải cư dân"""
+    return PrincipalService.resident_id(db, current_user)
 
 
 @router.get("/me", response_model=MeResponse, summary="Lấy thông tin user hiện tại")
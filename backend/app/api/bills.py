@@ -5,22 +5,21 @@ from typing import List
 from backend.app.core.db import get_db
 from backend.app.schemas.bill import BillRead
 from backend.app.models.bill import Bill
-from backend.app.models.resident import Resident 
+from backend.app.schemas.auth import PrincipalContext
 
-from backend.app.api.auth import get_current_user
+from backend.app.api.auth import get_current_principal
 
 router = APIRouter()
 
 @router.get("/my-bills", response_model=List[BillRead])
 def get_bills_data(
     db: Session = Depends(get_db),
-    current_user = Depends(get_current_user)
+    principal: PrincipalContext = Depends(get_current_principal)
 ):
-    resident = db.query(Resident).filter(current_user.username==Resident.username).first()
-    if not resident:
+    if not principal.apartmentID:
         return []
 
-    my_bills = db.query(Bill).filter(Bill.apartmentID==resident.apartmentID).all()
+    my_bills = db.query(Bill).filter(Bill.apartmentID==principal.apartmentID).all()
     return my_bills
 
 @router.get("/bills-unpaid", response_model=List[BillRead])
@@ -8,6 +8,7 @@ from sqlalchemy.exc import IntegrityError
 from typing import List
 
 from backend.app.core.db import get_db
+from backend.app.core.security import revoke_username
 from backend.app.models.building_manager import BuildingManager
 from backend.app.models.account import Account
 from backend.app.models.building import Building
@@ -234,9 +235,12 @@ def delete_building_manager(
             setattr(account, 'isActive', False)
     
     # Xóa BuildingManager
+    username = manager.username
     try:
         db.delete(manager)
         db.commit()
+        if username is not None:
+            revoke_username(username)
     except IntegrityError as e:
         db.rollback()
         raise HTTPException(
@@ -5,6 +5,7 @@ from backend.app.core.db import get_db
 from backend.app.api.auth import get_current_accountant
 from backend.app.models.meter_reading import MeterReading
 from backend.app.schemas.meter_reading import MeterReadingCreate, MeterReadingRead
+from backend.app.services.meter_reading_service import MeterReadingService
 
 router = APIRouter()
 
@@ -24,11 +25,18 @@ def record_meter(
     if exist:
         raise HTTPException(400, "Chỉ số tháng này đã được ghi nhận trước đó.")
 
+    values = payload.model_dump()
+    baseline = MeterReadingService.baselines(db, [payload.apartmentID], payload.month, payload.year).get(payload.apartmentID)
+    anomalies = MeterReadingService.prepare(values, baseline)
+    if MeterReadingService.is_blocking(anomalies):
+        raise HTTPException(400, "; ".join(anomaly["message"] for anomaly in anomalies))
+
     new_reading = MeterReading(
-        **payload.model_dump(),
+        **values,
         accountantID=accountant.accountantID
     )
     db.add(new_reading)
+    MeterReadingService.refresh_latest(db, [values])
     db.commit()
     db.refresh(new_reading)
     return new_reading
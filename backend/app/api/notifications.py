@@ -1,69 +1,134 @@
-from fastapi import APIRouter, Depends, status, HTTPException
+import asyncio
+import json
+from fastapi import APIRouter, Depends, status, HTTPException, Query, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 
-from backend.app.core.db import get_db
-from backend.app.models.notification import Notification
-from backend.app.models.resident import Resident
+from backend.app.core.db import get_db, SessionLocal
 # Lưu ý: Cần đảm bảo NotificationRead trong schemas có thêm trường electricity, water
-from backend.app.schemas.notification import NotificationRead, BroadcastRequest
+from backend.app.schemas.notification import NotificationRead, BroadcastRequest, MarkReadRequest, MarkReadUpToRequest
 from backend.app.services.notification_service import NotificationService 
-from backend.app.api.auth import get_current_user, get_current_manager
+from backend.app.services.notification_retention_service import NotificationRetentionService
+from backend.app.services.principal_service import PrincipalService
+from backend.app.services.push_hub import PushHub, HEARTBEAT_SECONDS
+from backend.app.utils.pagination import decode_cursor, set_next_cursor
+from backend.app.api.auth import get_current_manager, get_current_resident_id, get_current_user_stream
 router = APIRouter()
 
 @router.get("/my-notification", response_model=List[NotificationRead])
 def get_my_notifications(
-    skip: int = 0, limit: int = 50,
+    response: Response,
+    skip: int = 0, limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db),
-    current_user = Depends(get_current_user)
+    resident_id: int | None = Depends(get_current_resident_id)
 ):
     """
     Lấy danh sách thông báo của người dùng đang đăng nhập.
+    Trang kế: gửi lại giá trị header X-Next-Cursor qua ?cursor= (thay cho skip).
     """
-    resident = db.query(Resident).filter(Resident.username == current_user.username).first()
-    if not resident:
+    if resident_id is None:
         return []
 
-    return db.query(Notification)\
-        .filter(Notification.residentID == resident.residentID)\
-        .order_by(Notification.createdDate.desc())\
-        .offset(skip).limit(limit).all()
+    items = NotificationService.list_for_resident(
+        db, resident_id, skip, limit, decode_cursor(cursor) if cursor else None
+    )
+    set_next_cursor(response, items, limit, "createdDate", "notificationID")
+    return items
+
+@router.get("/stream", summary="Nhận thông báo realtime (Server-Sent Events)")
+async def stream_notifications(current_user = Depends(get_current_user_stream)):
+    """
+    Kết nối SSE thay cho việc poll my-notification / unread-count.
+    Token gửi qua header Authorization hoặc ?token= (EventSource không gửi được header).
+    Sự kiện: "notification" (thông báo mới), "resync" (client đọc chậm bị bỏ bớt sự
+    kiện, cần tải lại danh sách); dòng ": ping" định kỳ để giữ kết nối.
+    """
+    def find_resident():
+        session = SessionLocal()
+        try:
+            return PrincipalService.resident_id(session, current_user)
+        finally:
+            session.close()
+
+    # Token có claim residentID thì không cần đọc DB
+    resident_id = PrincipalService.resident_id(None, current_user)
+    if resident_id is None:
+        resident_id = await run_in_threadpool(find_resident)
+    if resident_id is None:
+        raise HTTPException(401, "Không xác định được cư dân")
+
+    subscription = PushHub.subscribe(resident_id)
+
+    async def event_stream():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+        finally:
+            PushHub.unsubscribe(subscription)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def _require_resident(resident_id: int | None = Depends(get_current_resident_id)) -> int:
+    if resident_id is None:
+        raise HTTPException(401, "Không xác định được cư dân")
+    return resident_id
+
+@router.put("/read-all")
+def mark_all_as_read(db: Session = Depends(get_db), resident_id: int = Depends(_require_resident)):
+    """Đánh dấu tất cả thông báo là 'Đã đọc'; trả về số chưa đọc mới"""
+    count = NotificationService.mark_read_many(db, resident_id)
+    return {"message": "Đã đánh dấu tất cả là đã đọc", "count": count}
+
+@router.put("/read-up-to")
+def mark_read_up_to(
+    payload: MarkReadUpToRequest,
+    db: Session = Depends(get_db),
+    resident_id: int = Depends(_require_resident)
+):
+    """Đánh dấu đã đọc mọi thông báo từ con trỏ trở về trước (tính cả thông báo của con trỏ)"""
+    count = NotificationService.mark_read_many(db, resident_id, cursor=decode_cursor(payload.cursor))
+    return {"message": "Đã đánh dấu đã đọc", "count": count}
+
+@router.put("/read")
+def mark_list_as_read(
+    payload: MarkReadRequest,
+    db: Session = Depends(get_db),
+    resident_id: int = Depends(_require_resident)
+):
+    """Đánh dấu đã đọc danh sách thông báo (id âm là thông báo chung)"""
+    count = NotificationService.mark_read_many(db, resident_id, ids=payload.ids)
+    return {"message": "Đã đánh dấu đã đọc", "count": count}
 
 @router.put("/{id}/read")
 def mark_as_read(
     id: int, 
     db: Session = Depends(get_db),
-    current_user = Depends(get_current_user)
+    resident_id: int = Depends(_require_resident)
 ):
     """Đánh dấu một thông báo là 'Đã đọc'"""
-    
-    resident = db.query(Resident).filter(Resident.username == current_user.username).first()
-    if not resident:
-        raise HTTPException(401, "Không xác định được cư dân")
-
-    noti = db.query(Notification).filter(Notification.notificationID == id).first()
-    if not noti: 
-        raise HTTPException(404, "Không tìm thấy thông báo")
-    
-    if noti.residentID != resident.residentID:
-        raise HTTPException(403, "Bạn không có quyền thao tác trên thông báo này")
-    
-    noti.isRead = True
-    db.commit()
+    NotificationService.mark_read(db, resident_id, id)
     return {"message": "Đã đánh dấu đã đọc"}
 
 @router.get("/unread-count")
-def count_unread(db: Session = Depends(get_db), current_user = Depends(get_current_user)):
+def count_unread(db: Session = Depends(get_db), resident_id: int | None = Depends(get_current_resident_id)):
     """Đếm số lượng thông báo chưa đọc (Dùng để hiển thị chấm đỏ trên icon chuông)"""
-    resident = db.query(Resident).filter(Resident.username == current_user.username).first()
-    if not resident: 
+    if resident_id is None:
         return {"count": 0}
     
-    count = db.query(Notification).filter(
-        Notification.residentID == resident.residentID, 
-        Notification.isRead == False 
-    ).count()
-    return {"count": count}
+    return {"count": NotificationService.count_unread(db, resident_id)}
 
 @router.post("/broadcast", status_code=status.HTTP_201_CREATED)
 def broadcast_notification(
@@ -77,3 +142,10 @@ def broadcast_notification(
     count = NotificationService.create_broadcast(db, payload.title, payload.content)
     
     return {"message": f"Đã gửi thông báo thành công đến {count} cư dân"}
+
+@router.get("/retention", summary="Số liệu lần lưu trữ thông báo gần nhất")
+def get_retention_metrics(manager = Depends(get_current_manager)):
+    return {
+        "retention_days": NotificationRetentionService.retention_days(),
+        "last_run": NotificationRetentionService.last_run,
+    }
@@ -4,23 +4,19 @@ from sqlalchemy.orm import Session
 from backend.app.core.db import get_db
 from backend.app.schemas.payment import PaymentCreateRequest, SePayWebhookPayload
 from backend.app.services.payment_service import PaymentService
+from backend.app.services.sepay_webhook_service import SepayWebhookService
 
 # Import Auth
-from backend.app.api.auth import get_current_user
-from backend.app.schemas.auth import TokenData
-from backend.app.models.resident import Resident
+from backend.app.api.auth import get_current_resident_id
 router = APIRouter()
 
 @router.post("/create-qr", summary="Create QR")
 def create_qr_code(
     payload: PaymentCreateRequest,
     db: Session = Depends(get_db),
-    token_data: TokenData = Depends(get_current_user)
+    resident_id: int | None = Depends(get_current_resident_id)
 ):
-    
-    resident = db.query(Resident).filter(Resident.username == token_data.username).first()
-    
-    if not resident:
+    if resident_id is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, 
             detail="Không tìm thấy thông tin cư dân"
@@ -28,7 +24,7 @@ def create_qr_code(
 
     return PaymentService.create_qr_transaction(
         db=db,
-        user_id=getattr(resident, 'residentID'),
+        user_id=resident_id,
         bill_ids=payload.bill_ids
     )
 
@@ -37,13 +33,13 @@ def receive_sepay_webhook(
     payload: SePayWebhookPayload,
     db: Session = Depends(get_db)
 ):
-    return PaymentService.process_sepay_webhook(
-        db=db,
-        content=payload.content,
-        amount_in=float(payload.transferAmount),
-        gateway_id=str(payload.id),
-        transaction_date=payload.transactionDate
-    )
+    """
+    Chỉ ghi payload vào inbox rồi trả lời SePay ngay; worker gạch nợ bất đồng bộ.
+    SePay gửi lại cùng id giao dịch thì không bị xử lý lần hai.
+    """
+    if SepayWebhookService.receive(db, payload.model_dump()):
+        return {"success": True, "message": "Đã nhận webhook"}
+    return {"success": True, "message": "Webhook đã được nhận trước đó"}
 
 @router.post("/check-expiry", summary="Quét và hủy giao dịch quá hạn")
 def check_expired_transactions(
@@ -1,25 +1,69 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 
 from backend.app.core.db import get_db
 from backend.app.schemas.payment import PaymentTransactionRead
 from backend.app.models.payment_transaction import PaymentTransaction
-from backend.app.models.resident import Resident
 
-from backend.app.api.auth import get_current_user
+from backend.app.api.auth import get_current_resident_id
+from backend.app.core.security import verify_link
+from backend.app.services.payment_core import PaymentCore
+from backend.app.services.payment_expiry_service import PAYMENT_TIMEOUT
+from backend.app.services.qr_image_service import MEDIA_TYPES, QrImageService
+from backend.app.utils.pagination import before_cursor, decode_cursor, set_next_cursor
 
 router = APIRouter()
 
 @router.get("/my-history", response_model=List[PaymentTransactionRead])
 def get_my_transaction_history(
+    response: Response,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db),
-    current_user = Depends(get_current_user)
+    resident_id: int | None = Depends(get_current_resident_id)
 ):
-    resident = db.query(Resident).filter(current_user.username==Resident.username).first()
-    if not resident:
+    """
+    Lịch sử giao dịch của cư dân, mới nhất trước, phân trang keyset.
+    Trang kế: gửi lại giá trị header X-Next-Cursor qua ?cursor=.
+    """
+    if resident_id is None:
         return []
-    
-    my_history = db.query(PaymentTransaction).filter(resident.residentID==PaymentTransaction.residentID).all()
 
-    return my_history
\ No newline at end of file
+    query = db.query(PaymentTransaction).filter(resident_id==PaymentTransaction.residentID)
+    if cursor:
+        query = query.filter(before_cursor(
+            PaymentTransaction.createdDate, PaymentTransaction.transID, decode_cursor(cursor)
+        ))
+    my_history = query.order_by(
+        PaymentTransaction.createdDate.desc(), PaymentTransaction.transID.desc()
+    ).limit(limit).all()
+
+    set_next_cursor(response, my_history, limit, "createdDate", "transID")
+    return my_history
+
+@router.get("/qr/{trans_id}", summary="Ảnh QR thanh toán của giao dịch")
+def get_payment_qr(
+    trans_id: int,
+    request: Request,
+    expires: int = Query(...),
+    signature: str = Query(...),
+    image_format: str = Query("png", alias="format", pattern="^(png|svg)$"),
+    db: Session = Depends(get_db),
+):
+    """
+    Ảnh VietQR do backend tự vẽ, cache theo nội dung. ETag là mã băm của nội dung QR
+    nên lần xem lại gửi If-None-Match được trả 304 mà không cần vẽ / đọc ảnh.
+    Chỉ mở được bằng link có chữ ký trả về khi tạo giao dịch (qr_url), trong thời gian chờ thanh toán.
+    """
+    if not verify_link(PaymentCore.qr_resource(trans_id), expires, signature):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Link ảnh QR không hợp lệ hoặc đã hết hạn")
+
+    payload = QrImageService.transaction_payload(db, trans_id)
+    etag = f'"{QrImageService.cache_key(payload, image_format)}"'
+    headers = {"ETag": etag, "Cache-Control": f"private, max-age={int(PAYMENT_TIMEOUT.total_seconds())}"}
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    _, image = QrImageService.image(payload, image_format)
+    return Response(content=image, media_type=MEDIA_TYPES[image_format], headers=headers)
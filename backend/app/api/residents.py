@@ -8,6 +8,7 @@ from backend.app.schemas.resident import ResidentBase, ResidentCreate, ResidentR
 from backend.app.models.apartment import Apartment
 
 from backend.app.core.db import get_db
+from backend.app.services.principal_service import PrincipalService
 from backend.app.api.auth import get_current_manager
 
 router = APIRouter()
@@ -42,6 +43,7 @@ def create_resident(
     try:
         db.commit()
         db.refresh(new_resident)
+        PrincipalService.invalidate(db, new_resident.username)
         return new_resident
 
     except IntegrityError as e:
@@ -86,6 +88,7 @@ def update_resident(
         raise HTTPException(status_code=404, detail="Không tìm thấy cư dân")
 
     update_data = resident_in.dict(exclude_unset=True)
+    old_username = resident.username
 
     for key, value in update_data.items():
         setattr(resident, key, value)
@@ -93,6 +96,7 @@ def update_resident(
     try:
         db.commit()
         db.refresh(resident)
+        PrincipalService.invalidate(db, old_username, resident.username)
     except IntegrityError:
         db.rollback()
         raise HTTPException(
@@ -117,6 +121,8 @@ def delete_resident(
     if apartment and apartment.numResident > 0:
         apartment.numResident -= 1
 
+    username = resident.username
     db.delete(resident)
     db.commit()
+    PrincipalService.invalidate(db, username)
     return None
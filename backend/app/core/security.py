@@ -1,14 +1,91 @@
 """
 Security utilities: JWT authentication & Password hashing
+
+Token đã xác thực được cache (LRU, TOKEN_CACHE_SIZE mục, khóa là sha256 của token) cùng
+thời điểm hết hạn nên request lặp lại không phải verify chữ ký. Khóa bí mật đọc một lần;
+đổi khóa: đặt khóa mới vào SECRET_KEY, khóa cũ vào SECRET_KEY_PREVIOUS rồi gọi
+rotate_secret_keys() (hoặc khởi động lại). Tài khoản bị vô hiệu hóa nằm trong danh sách
+thu hồi (set theo username) nên mọi token của tài khoản đó bị từ chối ngay.
+
+Link tài nguyên không gửi được header Authorization (thẻ <img>) được ký HMAC kèm hạn dùng
+(sign_link / verify_link), cũng bằng các khóa trên.
 """
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from jose import JWTError, jwt
+from jose import ExpiredSignatureError, JWTError, jwt
 import bcrypt
 from backend.app.core.db import get_secret_key
 
 # JWT Configuration
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_HOURS = 24
+# Số token đã xác thực giữ trong cache
+TOKEN_CACHE_SIZE = 4096
+
+_lock = threading.Lock()
+# (khóa ký, các khóa được chấp nhận khi verify)
+_secret_keys = None
+# sha256(token) -> (claims, exp)
+_token_cache: OrderedDict = OrderedDict()
+# username của các tài khoản đã bị vô hiệu hóa
+_revoked: frozenset = frozenset()
+
+
+def get_secret_keys() -> tuple[str, tuple[str, ...]]:
+    """Khóa ký token và các khóa được chấp nhận (khóa hiện tại + SECRET_KEY_PREVIOUS), đọc một lần"""
+    global _secret_keys
+    if _secret_keys is None:
+        current = get_secret_key()
+        previous = [key.strip() for key in os.getenv("SECRET_KEY_PREVIOUS", "").split(",") if key.strip()]
+        _secret_keys = (current, tuple([current] + [key for key in previous if key != current]))
+    return _secret_keys
+
+
+def rotate_secret_keys() -> None:
+    """Đọc lại khóa từ environment và bỏ cache token đã xác thực"""
+    global _secret_keys
+    with _lock:
+        _secret_keys = None
+        _token_cache.clear()
+    get_secret_keys()
+
+
+def set_revoked_usernames(usernames) -> None:
+    """Thay toàn bộ danh sách thu hồi (đồng bộ định kỳ từ ACCOUNT.isActive)"""
+    global _revoked
+    _revoked = frozenset(usernames)
+
+
+def revoke_username(username: str) -> None:
+    """Từ chối ngay mọi token của tài khoản (gọi khi vô hiệu hóa tài khoản)"""
+    global _revoked
+    with _lock:
+        _revoked = _revoked | {username}
+
+
+def _link_signature(secret_key: str, resource: str, expires: int) -> str:
+    message = f"{resource}:{expires}".encode("utf-8")
+    return hmac.new(secret_key.encode("utf-8"), message, hashlib.sha256).hexdigest()
+
+
+def sign_link(resource: str, expires: int) -> str:
+    """Chữ ký của link tới resource, dùng được tới thời điểm expires (epoch giây)"""
+    return _link_signature(get_secret_keys()[0], resource, expires)
+
+
+def verify_link(resource: str, expires: int, signature: str) -> bool:
+    """Chữ ký đúng (với một khóa được chấp nhận) và link chưa hết hạn"""
+    if expires < time.time():
+        return False
+    return any(
+        hmac.compare_digest(_link_signature(secret_key, resource, expires), signature)
+        for secret_key in get_secret_keys()[1]
+    )
 
 
 def hash_password(password: str) -> str:
@@ -46,30 +123,65 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
         return False
 
 
-def create_access_token(username: str, role: str) -> str:
+def create_access_token(username: str, role: str, resident_id: int | None = None) -> str:
     """
     Tạo JWT token cho user
-    Trả về chuỗi JWT token
+    Trả về chuỗi JWT token (kèm claim residentID nếu tài khoản là cư dân)
     """
-    secret_key = get_secret_key()  # Lazy load
+    secret_key = get_secret_keys()[0]
     expire = datetime.utcnow() + timedelta(hours=ACCESS_TOKEN_EXPIRE_HOURS)
     payload = {
         "username": username,
         "role": role,
+        "iat": int(time.time()),
         "exp": expire
     }
+    if resident_id is not None:
+        payload["residentID"] = resident_id
     token = jwt.encode(payload, secret_key, algorithm=ALGORITHM)
     return token
 
 
+def _verify(token: str) -> dict | None:
+    """Verify chữ ký với từng khóa được chấp nhận (khóa mới trước)"""
+    for secret_key in get_secret_keys()[1]:
+        try:
+            return jwt.decode(token, secret_key, algorithms=[ALGORITHM])
+        except ExpiredSignatureError:
+            return None
+        except JWTError:
+            continue
+    return None
+
+
 def decode_access_token(token: str) -> dict | None:
     """
     Decode và verify JWT token
-    Trả về Dict chứa username và role nếu token hợp lệ, None nếu invalid
+    Trả về Dict chứa username và role nếu token hợp lệ, None nếu invalid / hết hạn / đã bị thu hồi
     """
-    try:
-        secret_key = get_secret_key()  # Lazy load
-        payload = jwt.decode(token, secret_key, algorithms=[ALGORITHM])
-        return payload
-    except JWTError:
+    key = hashlib.sha256(token.encode("utf-8")).digest()
+    now = time.time()
+    with _lock:
+        cached = _token_cache.get(key)
+        if cached is not None:
+            _token_cache.move_to_end(key)
+
+    if cached is not None:
+        payload, expires = cached
+        if expires is not None and expires <= now:
+            with _lock:
+                _token_cache.pop(key, None)
+            return None
+    else:
+        payload = _verify(token)
+        if payload is None:
+            return None
+        expires = payload.get("exp")
+        with _lock:
+            _token_cache[key] = (payload, expires)
+            if len(_token_cache) > TOKEN_CACHE_SIZE:
+                _token_cache.popitem(last=False)
+
+    if payload.get("username") in _revoked:
         return None
+    return dict(payload)
@@ -9,6 +9,15 @@ from backend.app.models.bill import Bill
 from backend.app.models.service_fee import ServiceFee
 from backend.app.models.payment_transaction import PaymentTransaction
 from backend.app.models.transaction_detail import TransactionDetail
+from backend.app.models.tariff_schedule import TariffSchedule
+from backend.app.models.billing_job import BillingJob
+from backend.app.models.meter_reading_latest import MeterReadingLatest
+from backend.app.models.notification_broadcast import NotificationBroadcast
+from backend.app.models.notification_broadcast_read import NotificationBroadcastRead
+from backend.app.models.notification_counter import NotificationCounter
+from backend.app.models.notification_archive import NotificationArchive
+from backend.app.models.sepay_webhook_event import SepayWebhookEvent
+from backend.app.models.sepay_reconciliation import SepayReconciliation
 
 __all__ = [
     "Base",
@@ -22,4 +31,13 @@ __all__ = [
     "ServiceFee",
     "PaymentTransaction",
     "TransactionDetail",
+    "TariffSchedule",
+    "BillingJob",
+    "MeterReadingLatest",
+    "NotificationBroadcast",
+    "NotificationBroadcastRead",
+    "NotificationCounter",
+    "NotificationArchive",
+    "SepayWebhookEvent",
+    "SepayReconciliation",
 ]
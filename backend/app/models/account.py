@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Boolean
+from sqlalchemy import Column, String, Boolean, DateTime
 
 from backend.app.models.base import Base
 
@@ -10,3 +10,6 @@ class Account(Base):
     password = Column(String(255), nullable=False)
     role = Column(String(20))
     isActive = Column(Boolean, default=True, nullable=False)
+    # Lần gần nhất thông tin cư dân của tài khoản thay đổi: claim residentID của token cấp
+    # trước thời điểm này không còn được tin (PrincipalService)
+    principalChangedAt = Column(DateTime, nullable=True)
@@ -19,6 +19,10 @@ class Bill(Base):
     total = Column(DECIMAL(18, 0))
     status = Column(String(20), index=True)
     paymentMethod = Column(String(50))
+    # Dấu vân tay đầu vào (chỉ số, biểu giá, bộ phí) dùng cho tính lại tăng dần
+    inputHash = Column(String(40), nullable=True)
+    # Giao dịch đang giữ hóa đơn (chỉ có hiệu lực khi giao dịch còn chờ thanh toán)
+    reservedTransID = Column(Integer, nullable=True)
 
     # Relationships
     apartment = relationship("Apartment", back_populates="bills")
@@ -0,0 +1,37 @@
+import datetime as dt
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, ForeignKey
+from backend.app.models.base import Base
+
+
+class BillingJob(Base):
+    __tablename__ = "BILLING_JOB"
+
+    jobID = Column(Integer, primary_key=True, autoincrement=True)
+    month = Column(Integer, nullable=False)
+    year = Column(Integer, nullable=False)
+    deadlineDay = Column(Integer, nullable=False, default=10)
+    overwrite = Column(Boolean, nullable=False, default=False)
+    accountantID = Column(Integer, ForeignKey("ACCOUNTANT.accountantID"))
+    # JSON danh sách buildingID; NULL = toàn bộ tòa nhà
+    buildingIDs = Column(Text, nullable=True)
+    # True = chia theo tòa nhà, mỗi tòa nhà một shard chạy song song
+    sharded = Column(Boolean, nullable=False, default=False)
+
+    # Các trạng thái: 'QUEUED', 'RUNNING', 'SUCCEEDED', 'FAILED', 'CANCELLED'
+    status = Column(String(20), nullable=False, default="QUEUED", index=True)
+    cancelRequested = Column(Boolean, nullable=False, default=False)
+
+    totalApartments = Column(Integer, default=0)
+    processedApartments = Column(Integer, default=0)
+    billsCreated = Column(Integer, default=0)
+    # apartmentID cuối cùng đã xử lý xong; NULL = chưa bắt đầu, '' = đã dọn kỳ cũ
+    lastApartmentID = Column(String(10), nullable=True)
+    error = Column(Text, nullable=True)
+    # JSON kết quả từng shard (chế độ sharded)
+    report = Column(Text, nullable=True)
+
+    createdDate = Column(DateTime, default=dt.datetime.now)
+    startedDate = Column(DateTime, nullable=True)
+    finishedDate = Column(DateTime, nullable=True)
+    # Worker đang chạy job cập nhật sau mỗi lô; job RUNNING có heartbeat quá cũ sẽ được chạy tiếp
+    heartbeatAt = Column(DateTime, nullable=True)
@@ -0,0 +1,21 @@
+import datetime as dt
+from sqlalchemy import Column, Integer, String, DateTime, DECIMAL, ForeignKey
+from backend.app.models.base import Base
+
+
+class MeterReadingLatest(Base):
+    """Bản sao chỉ số mới nhất (theo kỳ) của mỗi căn hộ, cập nhật mỗi lần ghi METER_READING"""
+    __tablename__ = "METER_READING_LATEST"
+
+    apartmentID = Column(String(10), ForeignKey("APARTMENT.apartmentID"), primary_key=True)
+
+    # Kỳ của chỉ số mới nhất
+    month = Column(Integer, nullable=False)
+    year = Column(Integer, nullable=False)
+
+    oldElectricity = Column(DECIMAL(10, 2), nullable=False, default=0)
+    newElectricity = Column(DECIMAL(10, 2), nullable=False, default=0)
+    oldWater = Column(DECIMAL(10, 2), nullable=False, default=0)
+    newWater = Column(DECIMAL(10, 2), nullable=False, default=0)
+
+    updatedAt = Column(DateTime, default=dt.datetime.now, onupdate=dt.datetime.now)
@@ -1,9 +1,15 @@
 import datetime as dt
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text, DECIMAL
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text, DECIMAL, Index
 from backend.app.models.base import Base
 
 class Notification(Base):
     __tablename__ = "NOTIFICATION"
+    __table_args__ = (
+        # Đếm chưa đọc / đối soát bộ đếm theo cư dân
+        Index("IDX_NOTIFICATION_RESIDENT_READ", "residentID", "isRead"),
+        # Phân trang keyset danh sách thông báo (createdDate, notificationID) giảm dần
+        Index("IDX_NOTIFICATION_RESIDENT_CREATED", "residentID", "createdDate", "notificationID"),
+    )
 
     notificationID = Column(Integer, primary_key=True, index=True)
     residentID = Column(Integer, ForeignKey("RESIDENT.residentID"), nullable=False)
@@ -0,0 +1,29 @@
+import datetime as dt
+from sqlalchemy import Column, Integer, String, DateTime, Text, DECIMAL, Index
+from backend.app.models.base import Base
+
+
+class NotificationArchive(Base):
+    """
+    Thông báo riêng đã đọc và quá hạn lưu giữ, chuyển khỏi NOTIFICATION (giữ nguyên notificationID).
+    Không có khóa ngoại và createdDate nằm trong khóa chính để bảng có thể chia partition theo tháng.
+    """
+    __tablename__ = "NOTIFICATION_ARCHIVE"
+    __table_args__ = (
+        # Đọc tiếp danh sách thông báo của cư dân vào vùng lưu trữ (keyset)
+        Index("IDX_NOTIFICATION_ARCHIVE_RESIDENT_CREATED", "residentID", "createdDate", "notificationID"),
+    )
+
+    notificationID = Column(Integer, primary_key=True, autoincrement=False)
+    createdDate = Column(DateTime, primary_key=True, index=True)
+    residentID = Column(Integer, nullable=False)
+
+    title = Column(String(200), nullable=False)
+    content = Column(Text, nullable=True)
+    type = Column(String(50), nullable=False)
+    relatedID = Column(Integer, nullable=True)
+
+    electricity = Column(DECIMAL(10, 2), nullable=True)
+    water = Column(DECIMAL(10, 2), nullable=True)
+
+    archivedDate = Column(DateTime, default=dt.datetime.now)
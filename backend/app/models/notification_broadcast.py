@@ -0,0 +1,13 @@
+import datetime as dt
+from sqlalchemy import Column, Integer, String, DateTime, Text
+from backend.app.models.base import Base
+
+
+class NotificationBroadcast(Base):
+    """Thông báo chung (GENERAL) lưu một lần cho mọi cư dân, ghép vào danh sách thông báo khi đọc"""
+    __tablename__ = "NOTIFICATION_BROADCAST"
+
+    broadcastID = Column(Integer, primary_key=True, autoincrement=True)
+    title = Column(String(200), nullable=False)
+    content = Column(Text, nullable=True)
+    createdDate = Column(DateTime, default=dt.datetime.now, index=True)
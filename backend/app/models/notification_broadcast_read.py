@@ -0,0 +1,12 @@
+import datetime as dt
+from sqlalchemy import Column, Integer, DateTime, ForeignKey
+from backend.app.models.base import Base
+
+
+class NotificationBroadcastRead(Base):
+    """Đánh dấu cư dân đã đọc một thông báo chung (không có dòng = chưa đọc)"""
+    __tablename__ = "NOTIFICATION_BROADCAST_READ"
+
+    residentID = Column(Integer, ForeignKey("RESIDENT.residentID"), primary_key=True)
+    broadcastID = Column(Integer, ForeignKey("NOTIFICATION_BROADCAST.broadcastID"), primary_key=True)
+    readDate = Column(DateTime, default=dt.datetime.now)
@@ -0,0 +1,16 @@
+import datetime as dt
+from sqlalchemy import Column, Integer, DateTime, ForeignKey
+from backend.app.models.base import Base
+
+
+class NotificationCounter(Base):
+    """Bộ đếm thông báo chưa đọc của mỗi cư dân (ghi kèm mỗi lần tạo / đánh dấu đã đọc)"""
+    __tablename__ = "NOTIFICATION_COUNTER"
+
+    residentID = Column(Integer, ForeignKey("RESIDENT.residentID"), primary_key=True)
+    # Số thông báo riêng (NOTIFICATION) chưa đọc
+    unreadCount = Column(Integer, nullable=False, default=0)
+    # Số thông báo chung đã đọc; chưa đọc = tổng thông báo chung - giá trị này
+    broadcastReadCount = Column(Integer, nullable=False, default=0)
+
+    updatedAt = Column(DateTime, default=dt.datetime.now, onupdate=dt.datetime.now)
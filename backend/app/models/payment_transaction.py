@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, DECIMAL, Enum, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, DECIMAL, Enum, ForeignKey, Index
 from sqlalchemy.orm import relationship
 
 from backend.app.models.base import Base
@@ -6,6 +6,12 @@ from backend.app.models.base import Base
 
 class PaymentTransaction(Base):
     __tablename__ = "PAYMENT_TRANSACTION"
+    __table_args__ = (
+        # Phân trang keyset lịch sử giao dịch của cư dân
+        Index("IDX_PAYMENTTX_RESIDENT_CREATED", "residentID", "createdDate", "transID"),
+        # Job hủy giao dịch quá hạn đọc tiếp giao dịch Pending theo createdDate
+        Index("IDX_PAYMENTTX_STATUS_CREATED", "status", "createdDate"),
+    )
 
     transID = Column(Integer, primary_key=True, autoincrement=True)
     residentID = Column(Integer, ForeignKey(
@@ -0,0 +1,28 @@
+import datetime as dt
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Text
+from backend.app.models.base import Base
+
+
+class SepayReconciliation(Base):
+    """Một lượt đối soát sao kê SePay với PAYMENT_TRANSACTION"""
+    __tablename__ = "SEPAY_RECONCILIATION"
+
+    runID = Column(Integer, primary_key=True, autoincrement=True)
+    # Khoảng id giao dịch SePay đã đọc; lượt sau đọc tiếp từ lastID + 1
+    sinceID = Column(BigInteger, nullable=True)
+    lastID = Column(BigInteger, nullable=True)
+
+    # Các trạng thái: 'RUNNING', 'SUCCEEDED', 'FAILED'
+    status = Column(String(20), nullable=False, default="RUNNING", index=True)
+
+    fetchedLines = Column(Integer, default=0)
+    matchedLines = Column(Integer, default=0)
+    # Giao dịch có tiền về nhưng chưa nhận được webhook -> đã đưa vào inbox
+    enqueuedLines = Column(Integer, default=0)
+    discrepancies = Column(Integer, default=0)
+    # JSON danh sách chênh lệch
+    report = Column(Text, nullable=True)
+    error = Column(Text, nullable=True)
+
+    startedDate = Column(DateTime, default=dt.datetime.now)
+    finishedDate = Column(DateTime, nullable=True)
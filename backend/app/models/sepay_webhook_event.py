@@ -0,0 +1,32 @@
+import datetime as dt
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Text, Index
+from backend.app.models.base import Base
+
+
+class SepayWebhookEvent(Base):
+    """Inbox webhook SePay, khóa theo id giao dịch phía SePay để bỏ qua các lần gửi lại"""
+    __tablename__ = "SEPAY_WEBHOOK_EVENT"
+    __table_args__ = (
+        # Worker nhận việc theo thứ tự nhận
+        Index("IDX_SEPAYEVENT_STATUS_RECEIVED", "status", "receivedDate"),
+        # Worker nhận lại webhook lỗi tới lượt thử lại
+        Index("IDX_SEPAYEVENT_STATUS_NEXTATTEMPT", "status", "nextAttemptAt"),
+    )
+
+    sepayID = Column(BigInteger, primary_key=True, autoincrement=False)
+    # Payload gốc (JSON)
+    payload = Column(Text, nullable=False)
+
+    # Các trạng thái: 'RECEIVED' (chờ xử lý), 'PROCESSING' (worker đã nhận), 'PROCESSED', 'REJECTED' (không khớp / thiếu tiền / hết hạn), 'FAILED' (lỗi, được thử lại từ nextAttemptAt)
+    status = Column(String(20), nullable=False, default="RECEIVED")
+    transID = Column(Integer, nullable=True)
+    # Kết quả xử lý (message trả về của process_sepay_webhook / lỗi)
+    result = Column(String(255), nullable=True)
+
+    receivedDate = Column(DateTime, default=dt.datetime.now)
+    # Thời điểm worker nhận việc
+    claimedAt = Column(DateTime, nullable=True)
+    processedDate = Column(DateTime, nullable=True)
+    # Số lần xử lý bị lỗi và thời điểm được thử lại (None: không tự thử lại nữa)
+    attempts = Column(Integer, nullable=False, default=0)
+    nextAttemptAt = Column(DateTime, nullable=True)
@@ -0,0 +1,26 @@
+import datetime as dt
+from sqlalchemy import Column, Integer, String, Date, DateTime, DECIMAL, Text, ForeignKey, UniqueConstraint
+from backend.app.models.base import Base
+
+
+class TariffSchedule(Base):
+    __tablename__ = "TARIFF_SCHEDULE"
+    __table_args__ = (
+        UniqueConstraint("tariffType", "buildingID", "effectiveFrom", name="UQ_TARIFF_TYPE_BUILDING_DATE"),
+    )
+
+    scheduleID = Column(Integer, primary_key=True, autoincrement=True)
+    # 'ELECTRICITY' hoặc 'WATER'
+    tariffType = Column(String(20), nullable=False)
+    # NULL = biểu giá chung cho mọi tòa nhà
+    buildingID = Column(String(10), ForeignKey("BUILDING.buildingID"), nullable=True, index=True)
+    effectiveFrom = Column(Date, nullable=False)
+
+    # JSON: [[50, 1984], [50, 2050], ..., [null, 3460]] (null = bậc cuối không giới hạn)
+    tiers = Column(Text, nullable=False)
+    # Tổng thuế phí cộng thêm trên tiền gốc (%), VD: 8 cho điện, 15 cho nước
+    surchargePercent = Column(DECIMAL(5, 2), nullable=False, default=0)
+
+    # Tăng 1 sau mỗi lần sửa; sum(revision) nằm trong dấu phiên bản của cache (TariffService)
+    revision = Column(Integer, nullable=False, default=1)
+    updatedAt = Column(DateTime, default=dt.datetime.now, onupdate=dt.datetime.now)
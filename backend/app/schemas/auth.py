@@ -45,3 +45,15 @@ class TokenData(BaseModel):
     """Data được lưu trong JWT token"""
     username: str
     role: str
+    # Claim thêm khi đăng nhập (token cũ không có)
+    residentID: int | None = None
+    iat: int | None = None
+
+
+class PrincipalContext(BaseModel):
+    """Ngữ cảnh người dùng của request (cache theo username, xem PrincipalService)"""
+    username: str
+    role: str
+    residentID: int | None = None
+    apartmentID: str | None = None
+    buildingID: str | None = None
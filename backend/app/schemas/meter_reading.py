@@ -6,9 +6,10 @@ class MeterReadingBase(BaseModel):
     apartmentID: str
     month: int = Field(..., ge=1, le=12)
     year: int = Field(..., ge=2000)
-    oldElectricity: float = 0
+    # Bỏ trống chỉ số cũ: tự lấy chỉ số mới của kỳ trước
+    oldElectricity: Optional[float] = None
     newElectricity: float = 0
-    oldWater: float = 0
+    oldWater: Optional[float] = None
     newWater: float = 0
 
 class MeterReadingCreate(MeterReadingBase):
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
 from typing import Optional, List
 
@@ -17,6 +17,15 @@ class BroadcastRequest(BaseModel):
     title: str
     content: str
 
+# Schema đánh dấu đã đọc hàng loạt
+class MarkReadRequest(BaseModel):
+    # id âm là thông báo chung (-broadcastID)
+    ids: List[int] = Field(..., min_length=1, max_length=1000)
+
+class MarkReadUpToRequest(BaseModel):
+    # Giá trị header X-Next-Cursor / con trỏ của thông báo mới nhất đã xem
+    cursor: str
+
 # Schema trả về cho Frontend
 class NotificationRead(NotificationBase):
     notificationID: int
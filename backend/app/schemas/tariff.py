@@ -0,0 +1,60 @@
+"""
+Pydantic schemas cho biểu giá bậc thang (TariffSchedule)
+"""
+import datetime as dt
+import json
+from typing import Literal
+from pydantic import BaseModel, ConfigDict, Field, field_validator
+
+
+class TariffTier(BaseModel):
+    """Một bậc giá: hạn mức (None = không giới hạn) và đơn giá"""
+    limit: int | None = Field(default=None, gt=0, description="Hạn mức bậc (kWh/m3), None cho bậc cuối")
+    price: int = Field(..., ge=0, description="Đơn giá (VNĐ)")
+
+
+class TariffScheduleCreate(BaseModel):
+    """Schema cho tạo/cập nhật biểu giá theo ngày hiệu lực"""
+    tariffType: Literal["ELECTRICITY", "WATER"] = Field(..., description="Loại biểu giá")
+    buildingID: str | None = Field(
+        default=None, max_length=10, description="Mã tòa nhà (bỏ trống = áp dụng chung)")
+    effectiveFrom: dt.date = Field(..., description="Ngày bắt đầu hiệu lực")
+    tiers: list[TariffTier] = Field(..., min_length=1, description="Các bậc giá theo thứ tự")
+    surchargePercent: float = Field(default=0, ge=0, description="Tổng thuế phí (%)")
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "tariffType": "WATER",
+                "buildingID": None,
+                "effectiveFrom": "2026-01-01",
+                "tiers": [
+                    {"limit": 10, "price": 8500},
+                    {"limit": 10, "price": 9900},
+                    {"limit": 10, "price": 16000},
+                    {"limit": None, "price": 27000}
+                ],
+                "surchargePercent": 15
+            }
+        }
+
+
+class TariffScheduleRead(BaseModel):
+    """Schema cho response biểu giá"""
+    model_config = ConfigDict(from_attributes=True)
+
+    scheduleID: int
+    tariffType: str
+    buildingID: str | None
+    effectiveFrom: dt.date
+    tiers: list[TariffTier]
+    surchargePercent: float
+    updatedAt: dt.datetime | None = None
+
+    @field_validator("tiers", mode="before")
+    @classmethod
+    def parse_tiers(cls, v):
+        # Cột tiers lưu dạng JSON [[limit, price], ...]
+        if isinstance(v, str):
+            return [{"limit": limit, "price": price} for limit, price in json.loads(v)]
+        return v
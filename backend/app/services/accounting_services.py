@@ -1,163 +1,99 @@
-from datetime import datetime, date
+import calendar
+from datetime import datetime
 from decimal import Decimal, ROUND_HALF_UP
 from fastapi import HTTPException, status
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 from backend.app.models.service_fee import ServiceFee
-from backend.app.models.apartment import Apartment
 from backend.app.models.bill import Bill
 from backend.app.schemas.bill import BillCreate
-from backend.app.models.meter_reading import MeterReading
 
-from backend.app.models.transaction_detail import TransactionDetail
 from backend.app.services.notification_service import NotificationService
+from backend.app.utils.tariff_utils import ELECTRICITY_TIERS, WATER_TIERS
+
 
 class AccountingService:
-    
+
     @staticmethod
-    def calculate_electricity_cost(consumption: float) -> Decimal:
-        """Tính tiền điện sinh hoạt 6 bậc + 8% VAT"""
-        if consumption <= 0: return Decimal('0')
-        TIERS = [
-            (50, 1984), (50, 2050), (100, 2380), 
-            (100, 2998), (100, 3350), (float('inf'), 3460)
-        ]
+    def _tiered_base_amount(consumption, tiers) -> Decimal:
+        """Tiền gốc theo bậc thang, tính hoàn toàn bằng Decimal (không cộng dồn sai số float)"""
         base_amount = Decimal('0')
-        remaining = consumption
-        for limit, price in TIERS:
+        remaining = Decimal(str(consumption))
+        for limit, price in tiers:
             if remaining <= 0: break
-            usage_in_tier = min(remaining, limit)
-            base_amount += Decimal(str(usage_in_tier)) * Decimal(str(price))
+            usage_in_tier = remaining if limit == float('inf') else min(remaining, Decimal(limit))
+            base_amount += usage_in_tier * price
             remaining -= usage_in_tier
+        return base_amount
+
+    @staticmethod
+    def calculate_electricity_cost(consumption: float) -> Decimal:
+        """Tính tiền điện sinh hoạt 6 bậc + 8% VAT (bản tham chiếu từng chỉ số, xem ELECTRICITY_TARIFF)"""
+        if consumption <= 0: return Decimal('0')
+        base_amount = AccountingService._tiered_base_amount(consumption, ELECTRICITY_TIERS)
         return (base_amount * Decimal('1.08')).quantize(Decimal('1'), rounding=ROUND_HALF_UP)
 
     @staticmethod
     def calculate_water_cost(consumption: float) -> Decimal:
-        """Tính tiền nước sạch 4 bậc + 10% BVMT + 5% VAT (Tổng 15.5% thuế phí)"""
+        """Tính tiền nước sạch 4 bậc + 10% BVMT + 5% VAT (bản tham chiếu từng chỉ số, xem WATER_TARIFF)"""
         if consumption <= 0: return Decimal('0')
-        TIERS = [(10, 8500), (10, 9900), (10, 16000), (float('inf'), 27000)]
-        base_amount = Decimal('0')
-        remaining = consumption
-        for limit, price in TIERS:
-            if remaining <= 0: break
-            usage_in_tier = min(remaining, limit)
-            base_amount += Decimal(str(usage_in_tier)) * Decimal(str(price))
-            remaining -= usage_in_tier
-        
+        base_amount = AccountingService._tiered_base_amount(consumption, WATER_TIERS)
+
         # Tiền nước = Giá gốc + 10% phí BVMT + 5% VAT trên giá gốc
         total = base_amount + (base_amount * Decimal('0.10')) + (base_amount * Decimal('0.05'))
         return total.quantize(Decimal('1'), rounding=ROUND_HALF_UP)
 
     @staticmethod
     def calculate_monthly_bills(db: Session, month: int, year: int, accountant_id: int, deadline_day: int, overwrite: bool = False):
-        """Tính toán và tạo hóa đơn cho 3 luồng: Điện, Nước, Phí dịch vụ"""
-        if month==12: 
-            month_dl = 1
-            year_dl = year + 1
-        else:
-            month_dl=month
-            year_dl=year
-        
-        deadline_date = date(year_dl, month_dl, deadline_day)
+        """
+        Tính toán và tạo hóa đơn cho 3 luồng: Điện, Nước, Phí dịch vụ.
+        Ủy quyền cho BillingEngine (nạp dữ liệu 1 lần, INSERT nhiều dòng),
+        trả về báo cáo gồm số hóa đơn và thời gian từng pha.
+        """
+        from backend.app.services.billing_engine import BillingEngine
 
-        existing_bills = db.query(Bill).filter(
-            Bill.deadline == deadline_date,
-            Bill.typeOfBill.in_(["ELECTRICITY", "WATER", "SERVICE"])
+        return BillingEngine.run(
+            db=db,
+            month=month,
+            year=year,
+            accountant_id=accountant_id,
+            deadline_day=deadline_day,
+            overwrite=overwrite
         )
 
-        if existing_bills.count() > 0:
-            if not overwrite:
-                raise Exception(f"Đã có hóa đơn tháng {month}/{year}. Chọn 'Ghi đè' để tính lại.")
-            
-            bills_to_delete = existing_bills.all()
-            bill_ids = [b.billID for b in bills_to_delete]
-            
-            if bill_ids:
-                db.query(TransactionDetail).filter(
-                    TransactionDetail.billID.in_(bill_ids)
-                ).delete(synchronize_session=False)
-
-            existing_bills.delete(synchronize_session=False)
-            db.commit()
-
-        apartments = db.query(Apartment).all()
-        all_fees = db.query(ServiceFee).all()
-        bills_created = 0
-
-        readings = db.query(MeterReading).filter(
-            MeterReading.month == month,
-            MeterReading.year == year
-        ).all()
-
-        reading_map = {r.apartmentID: r for r in readings}
-
-        for apt in apartments:
-            reading = reading_map.get(apt.apartmentID)
-
-            if reading and reading.newElectricity > reading.oldElectricity:
-                elec_cons = reading.newElectricity - reading.oldElectricity
-
-                if elec_cons > 0:
-                    elec_total = AccountingService.calculate_electricity_cost(float(elec_cons))
-                    
-                    bill_elec = Bill(
-                        apartmentID=apt.apartmentID, 
-                        accountantID=accountant_id,
-                        createDate=datetime.now(),
-                        deadline=deadline_date,
-                        typeOfBill="ELECTRICITY",
-                        amount=elec_total,
-                        total=elec_total,
-                        status='Unpaid'
-                    )
-                    db.add(bill_elec)
-                    db.flush() 
-                    NotificationService.notify_new_bill(db, bill_elec.billID, month, year, reading)
-                    bills_created += 1
-
-            if reading and reading.newWater > reading.oldWater:
-                water_cons = reading.newWater - reading.oldWater
-                if water_cons > 0:
-                    water_total = AccountingService.calculate_water_cost(float(water_cons))
-                    
-                    bill_water = Bill(
-                        apartmentID=apt.apartmentID,
-                        accountantID=accountant_id,
-                        createDate=datetime.now(),
-                        deadline=deadline_date,
-                        typeOfBill="WATER",
-                        amount=water_total,
-                        total=water_total,
-                        status='Unpaid'
-                    )
-                    db.add(bill_water)
-                    db.flush()
-                    NotificationService.notify_new_bill(db, bill_water.billID, month, year, reading)
-                    bills_created += 1
-
-            apt_fees = [f for f in all_fees if f.buildingID == apt.buildingID]
-            service_sum = sum(Decimal(str(f.unitPrice)) for f in apt_fees 
-                             if "điện" not in f.serviceName.lower() and "nước" not in f.serviceName.lower())
-            
-            if service_sum > 0:
-                bill_service = Bill(
-                    apartmentID=apt.apartmentID,
-                    accountantID=accountant_id,
-                    createDate=datetime.now(),
-                    deadline=deadline_date,
-                    typeOfBill="SERVICE",
-                    amount=service_sum,
-                    total=service_sum,
-                    status='Unpaid'
-                )
-                db.add(bill_service)
-                db.flush()
-                NotificationService.notify_new_bill(db, bill_service.billID, month, year)
-                bills_created += 1
+    @staticmethod
+    def rebill_apartment(db: Session, apartment_id: str, month: int, year: int, accountant_id: int):
+        """
+        Kỳ đã được tính hóa đơn thì chỉ tính lại (tăng dần) cho riêng căn hộ này,
+        dùng khi sửa chỉ số của một căn hộ. Trả về None nếu kỳ chưa tính hóa đơn.
+        """
+        return AccountingService.rebill_apartments(db, [apartment_id], month, year, accountant_id)
 
-        db.commit()
+    @staticmethod
+    def rebill_apartments(db: Session, apartment_ids: list[str], month: int, year: int, accountant_id: int):
+        """Như rebill_apartment nhưng cho nhiều căn hộ trong một lượt (VD: sau khi nhập file chỉ số)"""
+        if not apartment_ids:
+            return None
+        from backend.app.services.billing_engine import BillingEngine, BILL_TYPES
+
+        first_day = BillingEngine.deadline_for(month, year, 1)
+        last_day = first_day.replace(day=calendar.monthrange(first_day.year, first_day.month)[1])
+        billed = db.query(Bill.deadline).filter(
+            Bill.typeOfBill.in_(BILL_TYPES),
+            Bill.deadline.between(first_day, last_day)
+        ).first()
+        if not billed:
+            return None
 
-        return bills_created
+        return BillingEngine.run(
+            db=db,
+            month=month,
+            year=year,
+            accountant_id=accountant_id,
+            deadline_day=billed.deadline.day,
+            overwrite=True,
+            apartment_ids=apartment_ids
+        )
 
     @staticmethod
     def create_or_update_fee(db: Session, fee_data, building_id):
@@ -0,0 +1,39 @@
+"""
+Gạch nợ hóa đơn của một giao dịch, dùng chung cho mọi kênh thanh toán.
+
+Số câu lệnh không phụ thuộc số hóa đơn trong giao dịch: 1 câu JOIN lấy loại hóa đơn và
+1 câu UPDATE BILL ... WHERE billID IN (SELECT billID FROM TRANSACTION_DETAIL ...).
+"""
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+from backend.app.models.bill import Bill
+from backend.app.models.transaction_detail import TransactionDetail
+
+
+class BillSettlementService:
+
+    @staticmethod
+    def bill_types(db: Session, trans_id: int) -> list[str]:
+        """Các loại hóa đơn (không trùng, theo thứ tự billID) của giao dịch"""
+        return list(db.scalars(
+            select(Bill.typeOfBill)
+            .join(TransactionDetail, TransactionDetail.billID == Bill.billID)
+            .where(TransactionDetail.transID == trans_id)
+            .group_by(Bill.typeOfBill)
+            .order_by(func.min(Bill.billID))
+        ))
+
+    @staticmethod
+    def settle(db: Session, trans_id: int) -> list[str]:
+        """Đánh dấu 'Paid' (bỏ giữ chỗ) mọi hóa đơn của giao dịch; trả về các loại hóa đơn. Không commit."""
+        bill_types = BillSettlementService.bill_types(db, trans_id)
+        db.execute(
+            update(Bill)
+            .where(Bill.billID.in_(
+                select(TransactionDetail.billID).where(TransactionDetail.transID == trans_id)
+            ))
+            .values(status="Paid", reservedTransID=None)
+            .execution_options(synchronize_session=False)
+        )
+        return bill_types
@@ -0,0 +1,498 @@
+"""
+Bộ máy tính hóa đơn hàng loạt (set-based) cho 3 luồng: Điện, Nước, Phí dịch vụ.
+
+Thay vì duyệt từng căn hộ rồi flush/query lại cho từng hóa đơn, engine:
+    1. Nạp trước chỉ số, đơn giá phí và cư dân nhận thông báo trong vài câu SELECT.
+    2. Tính toàn bộ hóa đơn trong bộ nhớ.
+    3. Ghi hóa đơn và thông báo bằng các câu INSERT nhiều dòng (theo lô).
+Mỗi pha được đo thời gian để trả về cùng kết quả.
+"""
+import hashlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from datetime import datetime, date
+from decimal import Decimal
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.orm import Session
+
+from backend.app.core.db import SessionLocal, get_engine
+from backend.app.models.apartment import Apartment
+from backend.app.models.building import Building
+from backend.app.models.bill import Bill
+from backend.app.models.meter_reading import MeterReading
+from backend.app.models.resident import Resident
+from backend.app.models.service_fee import ServiceFee
+from backend.app.models.transaction_detail import TransactionDetail
+from backend.app.services.notification_service import NotificationService
+from backend.app.services.payment_core import PaymentCore
+from backend.app.services.tariff_service import TariffService
+
+BILL_TYPES = ("ELECTRICITY", "WATER", "SERVICE")
+
+# Số dòng tối đa trong một câu INSERT nhiều dòng
+INSERT_CHUNK_SIZE = 1000
+
+
+class BillingEngine:
+
+    @staticmethod
+    def deadline_for(month: int, year: int, deadline_day: int) -> date:
+        """Hạn thanh toán của kỳ hóa đơn (giữ nguyên quy ước cũ của calculate_monthly_bills)"""
+        if month == 12:
+            month_dl = 1
+            year_dl = year + 1
+        else:
+            month_dl = month
+            year_dl = year
+        return date(year_dl, month_dl, deadline_day)
+
+    @staticmethod
+    def apartments_of_buildings(building_ids: list[str] | None):
+        """Subquery apartmentID thuộc các tòa nhà; None nếu không giới hạn tòa nhà"""
+        if not building_ids:
+            return None
+        return select(Apartment.apartmentID).where(Apartment.buildingID.in_(building_ids))
+
+    @staticmethod
+    def existing_bills(db: Session, deadline_date: date, apartment_ids=None):
+        """Query các hóa đơn Điện/Nước/Dịch vụ đã có của kỳ"""
+        query = db.query(Bill).filter(
+            Bill.deadline == deadline_date,
+            Bill.typeOfBill.in_(BILL_TYPES)
+        )
+        if apartment_ids is not None:
+            query = query.filter(Bill.apartmentID.in_(apartment_ids))
+        return query
+
+    @staticmethod
+    def delete_bills(db: Session, bill_ids: list[int]) -> None:
+        """Xóa hóa đơn (và chi tiết giao dịch liên quan) bằng 2 câu DELETE"""
+        if not bill_ids:
+            return
+        db.query(TransactionDetail).filter(
+            TransactionDetail.billID.in_(bill_ids)
+        ).delete(synchronize_session=False)
+        db.query(Bill).filter(Bill.billID.in_(bill_ids)).delete(synchronize_session=False)
+
+    @staticmethod
+    def fingerprint(*parts) -> str:
+        """Dấu vân tay nội dung đầu vào của một hóa đơn (chỉ số, biểu giá, bộ phí)"""
+        return hashlib.sha1("|".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def load_inputs(db: Session, month: int, year: int, apartment_ids=None) -> dict:
+        """Nạp một lần toàn bộ dữ liệu đầu vào của kỳ (chỉ lấy các cột cần dùng)"""
+        apt_query = db.query(Apartment.apartmentID, Apartment.buildingID)
+        reading_query = db.query(
+            MeterReading.apartmentID,
+            MeterReading.oldElectricity, MeterReading.newElectricity,
+            MeterReading.oldWater, MeterReading.newWater
+        ).filter(MeterReading.month == month, MeterReading.year == year)
+        resident_query = db.query(
+            Resident.apartmentID, func.min(Resident.residentID)
+        ).group_by(Resident.apartmentID)
+
+        if apartment_ids is not None:
+            apt_query = apt_query.filter(Apartment.apartmentID.in_(apartment_ids))
+            reading_query = reading_query.filter(MeterReading.apartmentID.in_(apartment_ids))
+            resident_query = resident_query.filter(Resident.apartmentID.in_(apartment_ids))
+
+        # Tổng phí dịch vụ theo tòa nhà (bỏ qua các dòng phí điện, nước)
+        service_sums: dict[str, Decimal] = {}
+        service_fees: dict[str, list] = {}
+        for building_id, name, unit_price in db.query(
+            ServiceFee.buildingID, ServiceFee.serviceName, ServiceFee.unitPrice
+        ):
+            lowered = (name or "").lower()
+            if "điện" in lowered or "nước" in lowered:
+                continue
+            service_sums[building_id] = service_sums.get(building_id, Decimal('0')) + Decimal(str(unit_price))
+            service_fees.setdefault(building_id, []).append((name, unit_price))
+
+        apartments = apt_query.order_by(Apartment.apartmentID).all()
+
+        # Biểu giá hiệu lực của kỳ cho từng tòa nhà: (phiên bản, TieredTariff)
+        period = date(year, month, 1)
+        snapshot = TariffService.snapshot(db)
+        tariffs = {
+            building_id: {
+                tariff_type: TariffService.resolve(snapshot, tariff_type, building_id, period)
+                for tariff_type in ("ELECTRICITY", "WATER")
+            }
+            for building_id in {building_id for _, building_id in apartments}
+        }
+
+        return {
+            "apartments": apartments,
+            "tariffs": tariffs,
+            "readings": {r.apartmentID: r for r in reading_query},
+            "residents": dict(resident_query.all()),
+            "service_sums": service_sums,
+            "fee_sets": {building_id: sorted(fees) for building_id, fees in service_fees.items()},
+        }
+
+    @staticmethod
+    def compute(inputs: dict, accountant_id: int, deadline_date: date, created_at: datetime) -> list[dict]:
+        """Tính toàn bộ hóa đơn trong bộ nhớ, trả về danh sách dòng BILL"""
+        readings = inputs["readings"]
+        service_sums = inputs["service_sums"]
+        rows = []
+
+        def bill_row(apartment_id, bill_type, total, input_hash):
+            return {
+                "apartmentID": apartment_id,
+                "accountantID": accountant_id,
+                "createDate": created_at,
+                "deadline": deadline_date,
+                "typeOfBill": bill_type,
+                "amount": total,
+                "total": total,
+                "status": "Unpaid",
+                "inputHash": input_hash,
+            }
+
+        # Gom chỉ số tiêu thụ theo từng biểu giá để tính tiền điện/nước một lượt
+        groups: dict = {}
+
+        def collect(tariff, key, consumption):
+            _, keys, values = groups.setdefault(id(tariff), (tariff, [], []))
+            keys.append(key)
+            values.append(consumption)
+
+        tariffs = inputs["tariffs"]
+        for apartment_id, building_id in inputs["apartments"]:
+            reading = readings.get(apartment_id)
+            if reading is None:
+                continue
+            building_tariffs = tariffs[building_id]
+            if reading.newElectricity > reading.oldElectricity:
+                collect(building_tariffs["ELECTRICITY"][1], ("ELECTRICITY", apartment_id),
+                        reading.newElectricity - reading.oldElectricity)
+            if reading.newWater > reading.oldWater:
+                collect(building_tariffs["WATER"][1], ("WATER", apartment_id),
+                        reading.newWater - reading.oldWater)
+
+        totals = {}
+        for tariff, keys, consumptions in groups.values():
+            totals.update(zip(keys, tariff.cost_many(consumptions)))
+
+        fee_sets = inputs["fee_sets"]
+        for apartment_id, building_id in inputs["apartments"]:
+            reading = readings.get(apartment_id)
+            for bill_type, old_field, new_field in (
+                ("ELECTRICITY", "oldElectricity", "newElectricity"),
+                ("WATER", "oldWater", "newWater"),
+            ):
+                total = totals.get((bill_type, apartment_id))
+                if total is not None:
+                    tariff = tariffs[building_id][bill_type][1]
+                    input_hash = BillingEngine.fingerprint(
+                        bill_type, getattr(reading, old_field), getattr(reading, new_field),
+                        tariff.tiers, tariff.surcharge_percent
+                    )
+                    rows.append(bill_row(apartment_id, bill_type, Decimal(total), input_hash))
+
+            service_sum = service_sums.get(building_id, Decimal('0'))
+            if service_sum > 0:
+                input_hash = BillingEngine.fingerprint("SERVICE", fee_sets.get(building_id))
+                rows.append(bill_row(apartment_id, "SERVICE", service_sum, input_hash))
+
+        return rows
+
+    @staticmethod
+    def insert_rows(db: Session, table, rows: list[dict]) -> None:
+        """INSERT nhiều dòng theo lô INSERT_CHUNK_SIZE"""
+        for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+            db.execute(insert(table).values(rows[start:start + INSERT_CHUNK_SIZE]))
+
+    @staticmethod
+    def build_notifications(db: Session, inputs: dict, bill_rows: list[dict], month: int, year: int,
+                            deadline_date: date, created_at: datetime, accountant_id: int,
+                            apartment_ids=None, known_ids: dict | None = None) -> list[dict]:
+        """
+        Lấy lại billID vừa sinh bằng 1 câu SELECT và soạn thông báo cho từng hóa đơn.
+        known_ids: billID đã biết trước (hóa đơn được cập nhật thay vì tạo mới).
+        """
+        id_query = db.query(Bill.billID, Bill.apartmentID, Bill.typeOfBill).filter(
+            Bill.deadline == deadline_date,
+            Bill.typeOfBill.in_(BILL_TYPES),
+            Bill.createDate == created_at,
+            Bill.accountantID == accountant_id
+        )
+        if apartment_ids is not None:
+            id_query = id_query.filter(Bill.apartmentID.in_(apartment_ids))
+        bill_ids = {(apt_id, bill_type): bill_id for bill_id, apt_id, bill_type in id_query}
+        bill_ids.update(known_ids or {})
+
+        residents = inputs["residents"]
+        readings = inputs["readings"]
+        rows = []
+        for bill in bill_rows:
+            apartment_id = bill["apartmentID"]
+            resident_id = residents.get(apartment_id)
+            bill_id = bill_ids.get((apartment_id, bill["typeOfBill"]))
+            if resident_id is None or bill_id is None:
+                continue
+
+            message = NotificationService.render_new_bill(
+                bill["typeOfBill"], apartment_id, bill["total"], deadline_date,
+                month, year, readings.get(apartment_id)
+            )
+            rows.append({
+                "residentID": resident_id,
+                "type": "NEW_BILL",
+                "relatedID": bill_id,
+                "isRead": False,
+                "createdDate": created_at,
+                **message
+            })
+        return rows
+
+    @staticmethod
+    def ensure_not_billed(db: Session, month: int, year: int, deadline_date: date, apartment_ids=None) -> None:
+        """Báo lỗi nếu kỳ đã có hóa đơn (khi không chọn ghi đè)"""
+        existing = BillingEngine.existing_bills(db, deadline_date, apartment_ids)
+        if db.query(existing.exists()).scalar():
+            raise Exception(f"Đã có hóa đơn tháng {month}/{year}. Chọn 'Ghi đè' để tính lại.")
+
+    @staticmethod
+    def generate(db: Session, month: int, year: int, accountant_id: int, deadline_date: date,
+                 apartment_ids=None, timer: "PhaseTimer | None" = None) -> dict:
+        """
+        Nạp dữ liệu, tính và INSERT hóa đơn + thông báo cho phạm vi căn hộ (không commit).
+        apartment_ids: danh sách hoặc subquery apartmentID; None = toàn bộ căn hộ.
+        """
+        timer = timer or PhaseTimer()
+        # DATETIME của MySQL không lưu phần micro giây
+        created_at = datetime.now().replace(microsecond=0)
+
+        inputs = BillingEngine.load_inputs(db, month, year, apartment_ids)
+        timer.lap("load")
+
+        bill_rows = BillingEngine.compute(inputs, accountant_id, deadline_date, created_at)
+        timer.lap("compute")
+
+        BillingEngine.insert_rows(db, Bill.__table__, bill_rows)
+        timer.lap("insert_bills")
+
+        noti_rows = BillingEngine.build_notifications(
+            db, inputs, bill_rows, month, year, deadline_date, created_at, accountant_id, apartment_ids
+        )
+        NotificationService.insert_many(db, noti_rows)
+        timer.lap("insert_notifications")
+
+        return {
+            "apartments": len(inputs["apartments"]),
+            "bills_created": len(bill_rows),
+            "notifications_created": len(noti_rows),
+        }
+
+    @staticmethod
+    def rebill(db: Session, month: int, year: int, accountant_id: int, deadline_date: date,
+               apartment_ids=None, timer: "PhaseTimer | None" = None) -> dict:
+        """
+        Tính lại hóa đơn theo kiểu tăng dần (không commit): chỉ ghi các hóa đơn có
+        dấu vân tay đầu vào thay đổi. Hóa đơn đã thanh toán giữ nguyên; hóa đơn chưa
+        thanh toán không còn căn cứ (VD: chỉ số bị xóa) sẽ bị xóa. Giao dịch đang chờ
+        thanh toán giữ các hóa đơn bị sửa / xóa bị hủy trong cùng transaction.
+        """
+        timer = timer or PhaseTimer()
+        created_at = datetime.now().replace(microsecond=0)
+
+        inputs = BillingEngine.load_inputs(db, month, year, apartment_ids)
+        existing = {
+            (apt_id, bill_type): (bill_id, bill_status, input_hash)
+            for bill_id, apt_id, bill_type, bill_status, input_hash in db.query(
+                Bill.billID, Bill.apartmentID, Bill.typeOfBill, Bill.status, Bill.inputHash
+            ).filter(
+                Bill.deadline == deadline_date,
+                Bill.typeOfBill.in_(BILL_TYPES),
+                *([Bill.apartmentID.in_(apartment_ids)] if apartment_ids is not None else [])
+            )
+        }
+        timer.lap("load")
+
+        bill_rows = BillingEngine.compute(inputs, accountant_id, deadline_date, created_at)
+        to_insert, to_update, changed_ids = [], [], {}
+        unchanged = skipped_paid = 0
+        for row in bill_rows:
+            key = (row["apartmentID"], row["typeOfBill"])
+            current = existing.pop(key, None)
+            if current is None:
+                to_insert.append(row)
+                continue
+            bill_id, bill_status, input_hash = current
+            if bill_status == "Paid":
+                skipped_paid += 1
+            elif input_hash == row["inputHash"]:
+                unchanged += 1
+            else:
+                to_update.append(row)
+                changed_ids[key] = bill_id
+
+        stale_ids = [bill_id for bill_id, bill_status, _ in existing.values() if bill_status != "Paid"]
+        timer.lap("compute")
+
+        # QR của giao dịch đang giữ các hóa đơn này mang số tiền cũ
+        cancelled = PaymentCore.release_bills(db, list(changed_ids.values()) + stale_ids)
+        if changed_ids:
+            # Chi tiết giao dịch cũ không còn đúng số tiền
+            db.query(TransactionDetail).filter(
+                TransactionDetail.billID.in_(list(changed_ids.values()))
+            ).delete(synchronize_session=False)
+            db.execute(update(Bill), [
+                {
+                    "billID": changed_ids[(row["apartmentID"], row["typeOfBill"])],
+                    "accountantID": row["accountantID"],
+                    "createDate": row["createDate"],
+                    "amount": row["amount"],
+                    "total": row["total"],
+                    "status": "Unpaid",
+                    "inputHash": row["inputHash"],
+                }
+                for row in to_update
+            ])
+        BillingEngine.delete_bills(db, stale_ids)
+        BillingEngine.insert_rows(db, Bill.__table__, to_insert)
+        timer.lap("write_bills")
+
+        noti_rows = BillingEngine.build_notifications(
+            db, inputs, to_insert + to_update, month, year, deadline_date, created_at, accountant_id,
+            apartment_ids, known_ids=changed_ids
+        )
+        NotificationService.insert_many(db, noti_rows)
+        timer.lap("insert_notifications")
+
+        return {
+            "apartments": len(inputs["apartments"]),
+            "bills_created": len(to_insert),
+            "bills_updated": len(to_update),
+            "bills_deleted": len(stale_ids),
+            "bills_unchanged": unchanged,
+            "bills_paid_skipped": skipped_paid,
+            "transactions_cancelled": len(cancelled),
+            "notifications_created": len(noti_rows),
+        }
+
+    @staticmethod
+    def run(db: Session, month: int, year: int, accountant_id: int, deadline_day: int,
+            overwrite: bool = False, apartment_ids=None) -> dict:
+        """
+        Tính và ghi hóa đơn cả kỳ trong một transaction.
+        overwrite=True: tính lại tăng dần, chỉ ghi các hóa đơn có đầu vào thay đổi.
+        Trả về số hóa đơn, số thông báo và thời gian (ms) của từng pha.
+        """
+        timer = PhaseTimer()
+        deadline_date = BillingEngine.deadline_for(month, year, deadline_day)
+
+        if overwrite:
+            report = BillingEngine.rebill(db, month, year, accountant_id, deadline_date, apartment_ids, timer)
+        else:
+            BillingEngine.ensure_not_billed(db, month, year, deadline_date, apartment_ids)
+            timer.lap("check")
+            report = BillingEngine.generate(db, month, year, accountant_id, deadline_date, apartment_ids, timer)
+
+        db.commit()
+        timer.lap("commit")
+
+        return {**report, **timer.report(report["apartments"])}
+
+    @staticmethod
+    def run_sharded(db: Session, month: int, year: int, accountant_id: int, deadline_day: int,
+                    overwrite: bool = False, building_ids: list[str] | None = None,
+                    max_workers: int | None = None, use_processes: bool = False,
+                    on_shard_done=None) -> dict:
+        """
+        Chia lượt tính theo tòa nhà, mỗi shard chạy ở thread/process riêng với session
+        và transaction riêng. Shard lỗi chỉ rollback tòa nhà đó, không chặn các shard khác.
+        on_shard_done(result) được gọi ở thread hiện tại sau mỗi shard; trả về False để
+        hủy các shard chưa bắt đầu.
+        """
+        started = time.perf_counter()
+        if building_ids is None:
+            building_ids = [b for (b,) in db.query(Building.buildingID).order_by(Building.buildingID)]
+
+        shards = {}
+        if building_ids:
+            workers = max_workers or min(len(building_ids), os.cpu_count() or 1)
+            if use_processes:
+                pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_shard_process)
+            else:
+                pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="billing-shard")
+
+            with pool:
+                futures = {
+                    pool.submit(_run_shard, month, year, accountant_id, deadline_day, overwrite, building_id): building_id
+                    for building_id in building_ids
+                }
+                for future in as_completed(futures):
+                    building_id = futures[future]
+                    if future.cancelled():
+                        continue
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        # Process shard bị chết (BrokenProcessPool...)
+                        result = {"building_id": building_id, "ok": False, "error": str(e)}
+                    shards[building_id] = result
+                    if on_shard_done is not None and on_shard_done(result) is False:
+                        for pending in futures:
+                            pending.cancel()
+
+        succeeded = [r for r in shards.values() if r["ok"]]
+        elapsed = time.perf_counter() - started
+        apartment_count = sum(r["apartments"] for r in succeeded)
+        return {
+            "apartments": apartment_count,
+            "bills_created": sum(r["bills_created"] for r in succeeded),
+            "notifications_created": sum(r["notifications_created"] for r in succeeded),
+            "shards": shards,
+            "errors": {b: r["error"] for b, r in shards.items() if not r["ok"]},
+            "total_ms": round(elapsed * 1000, 2),
+            "apartments_per_second": round(apartment_count / elapsed) if elapsed > 0 else apartment_count,
+        }
+
+
+def _init_shard_process():
+    """Process con (fork) không được dùng lại connection của process cha"""
+    get_engine().dispose(close=False)
+
+
+def _run_shard(month: int, year: int, accountant_id: int, deadline_day: int, overwrite: bool,
+               building_id: str) -> dict:
+    """Tính hóa đơn cho một tòa nhà trong session riêng (hàm cấp module để pickle được)"""
+    db = SessionLocal()
+    try:
+        report = BillingEngine.run(
+            db, month, year, accountant_id, deadline_day, overwrite,
+            apartment_ids=BillingEngine.apartments_of_buildings([building_id])
+        )
+        return {"building_id": building_id, "ok": True, **report}
+    except Exception as e:
+        db.rollback()
+        return {"building_id": building_id, "ok": False, "error": str(e)}
+    finally:
+        db.close()
+
+
+class PhaseTimer:
+    """Đo thời gian (ms) từng pha của một lượt tính hóa đơn"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._mark = self.started
+        self.timings = {}
+
+    def lap(self, phase: str) -> None:
+        now = time.perf_counter()
+        self.timings[phase] = round(self.timings.get(phase, 0) + (now - self._mark) * 1000, 2)
+        self._mark = now
+
+    def report(self, apartment_count: int) -> dict:
+        elapsed = time.perf_counter() - self.started
+        return {
+            "timings_ms": self.timings,
+            "total_ms": round(elapsed * 1000, 2),
+            "apartments_per_second": round(apartment_count / elapsed) if elapsed > 0 else apartment_count,
+        }
@@ -0,0 +1,345 @@
+"""
+Hàng đợi job tính hóa đơn cuối tháng.
+
+API chỉ ghi một dòng BILLING_JOB rồi trả về jobID; worker pool trong process chạy
+job theo từng lô căn hộ (thứ tự apartmentID). Mỗi lô ghi hóa đơn + tiến độ (lastApartmentID)
+trong cùng một transaction nên job bị dừng giữa chừng (crash, restart) có thể chạy
+tiếp từ lô kế tiếp mà không tạo trùng hóa đơn.
+Chế độ sharded chạy mỗi tòa nhà một shard song song (BillingEngine.run_sharded);
+khi chạy lại chỉ tính các tòa nhà chưa thành công (kể cả shard đã commit hóa đơn nhưng
+chưa kịp ghi tiến độ).
+"""
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from fastapi import HTTPException, status
+from sqlalchemy import func, or_, and_, update
+from sqlalchemy.orm import Session
+
+from backend.app.core.db import SessionLocal
+from backend.app.models.apartment import Apartment
+from backend.app.models.bill import Bill
+from backend.app.models.billing_job import BillingJob
+from backend.app.services.billing_engine import BillingEngine
+
+# Số căn hộ mỗi lô (mỗi lô là một transaction)
+CHUNK_SIZE = 500
+# Job RUNNING không cập nhật heartbeat quá thời gian này được xem là worker đã chết
+STALE_AFTER = timedelta(minutes=5)
+
+ACTIVE_STATUSES = ("QUEUED", "RUNNING")
+FINAL_STATUSES = ("SUCCEEDED", "FAILED", "CANCELLED")
+
+
+class BillingJobService:
+
+    _executor = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _get_executor() -> ThreadPoolExecutor:
+        with BillingJobService._lock:
+            if BillingJobService._executor is None:
+                workers = int(os.getenv("BILLING_WORKERS", "2"))
+                BillingJobService._executor = ThreadPoolExecutor(
+                    max_workers=max(workers, 1), thread_name_prefix="billing-job"
+                )
+            return BillingJobService._executor
+
+    @staticmethod
+    def _building_ids(job: BillingJob) -> list[str] | None:
+        return json.loads(job.buildingIDs) if job.buildingIDs else None
+
+    @staticmethod
+    def to_dict(job: BillingJob) -> dict:
+        return {
+            "job_id": job.jobID,
+            "month": job.month,
+            "year": job.year,
+            "building_ids": BillingJobService._building_ids(job),
+            "status": job.status,
+            "cancel_requested": job.cancelRequested,
+            "total_apartments": job.totalApartments,
+            "processed_apartments": job.processedApartments,
+            "bills_created": job.billsCreated,
+            "error": job.error,
+            "sharded": job.sharded,
+            "report": json.loads(job.report) if job.report else None,
+            "created_date": job.createdDate,
+            "started_date": job.startedDate,
+            "finished_date": job.finishedDate,
+        }
+
+    @staticmethod
+    def enqueue(db: Session, month: int, year: int, accountant_id: int, deadline_day: int,
+                overwrite: bool = False, building_ids: list[str] | None = None,
+                sharded: bool = False) -> BillingJob:
+        """Kiểm tra nhanh điều kiện rồi tạo job QUEUED và đẩy vào worker pool"""
+        deadline_date = BillingEngine.deadline_for(month, year, deadline_day)
+        scope = BillingEngine.apartments_of_buildings(building_ids)
+
+        if not overwrite:
+            existing = BillingEngine.existing_bills(db, deadline_date, scope)
+            if db.query(existing.exists()).scalar():
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Đã có hóa đơn tháng {month}/{year}. Chọn 'Ghi đè' để tính lại."
+                )
+
+        # Không cho 2 job cùng kỳ chạy chồng lên cùng tòa nhà
+        for active in db.query(BillingJob).filter(
+            BillingJob.month == month,
+            BillingJob.year == year,
+            BillingJob.status.in_(ACTIVE_STATUSES)
+        ):
+            active_buildings = BillingJobService._building_ids(active)
+            if not building_ids or not active_buildings or set(building_ids) & set(active_buildings):
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail=f"Job {active.jobID} đang tính hóa đơn tháng {month}/{year} cho cùng tòa nhà."
+                )
+
+        job = BillingJob(
+            month=month,
+            year=year,
+            deadlineDay=deadline_day,
+            overwrite=overwrite,
+            accountantID=accountant_id,
+            buildingIDs=json.dumps(building_ids) if building_ids else None,
+            sharded=sharded,
+            status="QUEUED",
+            createdDate=datetime.now()
+        )
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+
+        BillingJobService._get_executor().submit(BillingJobService.execute, job.jobID)
+        return job
+
+    @staticmethod
+    def get_job(db: Session, job_id: int) -> BillingJob:
+        job = db.query(BillingJob).filter(BillingJob.jobID == job_id).first()
+        if not job:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Không tìm thấy job {job_id}")
+        return job
+
+    @staticmethod
+    def cancel(db: Session, job_id: int) -> BillingJob:
+        """Yêu cầu hủy; worker dừng sau lô đang chạy (các lô đã xong vẫn giữ nguyên)"""
+        job = BillingJobService.get_job(db, job_id)
+        if job.status in FINAL_STATUSES:
+            return job
+        if job.status == "QUEUED":
+            job.status = "CANCELLED"
+            job.finishedDate = datetime.now()
+        job.cancelRequested = True
+        db.commit()
+        db.refresh(job)
+        return job
+
+    @staticmethod
+    def _claim(db: Session, job_id: int) -> bool:
+        """Nhận job bằng 1 câu UPDATE có điều kiện để chỉ một worker chạy được job"""
+        now = datetime.now()
+        result = db.execute(
+            update(BillingJob)
+            .where(
+                BillingJob.jobID == job_id,
+                BillingJob.cancelRequested.is_(False),
+                or_(
+                    BillingJob.status == "QUEUED",
+                    and_(BillingJob.status == "RUNNING", BillingJob.heartbeatAt < now - STALE_AFTER)
+                )
+            )
+            .values(status="RUNNING", heartbeatAt=now)
+        )
+        db.commit()
+        return result.rowcount == 1
+
+    @staticmethod
+    def execute(job_id: int) -> None:
+        """Chạy job theo từng lô căn hộ; an toàn khi chạy lại sau crash"""
+        db = SessionLocal()
+        try:
+            if not BillingJobService._claim(db, job_id):
+                return
+
+            job = db.query(BillingJob).filter(BillingJob.jobID == job_id).first()
+            building_ids = BillingJobService._building_ids(job)
+            scope = BillingEngine.apartments_of_buildings(building_ids)
+            deadline_date = BillingEngine.deadline_for(job.month, job.year, job.deadlineDay)
+
+            apt_query = db.query(Apartment.apartmentID)
+            if scope is not None:
+                apt_query = apt_query.filter(Apartment.apartmentID.in_(scope))
+
+            if job.sharded:
+                BillingJobService._execute_sharded(db, job, building_ids, apt_query)
+                return
+
+            if job.lastApartmentID is None:
+                # Lần chạy đầu: kiểm tra kỳ chưa có hóa đơn (trừ khi ghi đè)
+                if not job.overwrite:
+                    BillingEngine.ensure_not_billed(db, job.month, job.year, deadline_date, scope)
+                job.lastApartmentID = ""
+                job.startedDate = datetime.now()
+                job.totalApartments = apt_query.count()
+                db.commit()
+
+            while True:
+                db.refresh(job)
+                if job.cancelRequested:
+                    job.status = "CANCELLED"
+                    job.finishedDate = datetime.now()
+                    db.commit()
+                    return
+
+                chunk = [
+                    apartment_id for (apartment_id,) in apt_query
+                    .filter(Apartment.apartmentID > job.lastApartmentID)
+                    .order_by(Apartment.apartmentID)
+                    .limit(CHUNK_SIZE)
+                ]
+                if not chunk:
+                    break
+
+                # Ghi đè = tính lại tăng dần, chỉ ghi các hóa đơn có đầu vào thay đổi
+                compute_chunk = BillingEngine.rebill if job.overwrite else BillingEngine.generate
+                report = compute_chunk(db, job.month, job.year, job.accountantID, deadline_date, chunk)
+                job.lastApartmentID = chunk[-1]
+                job.processedApartments = (job.processedApartments or 0) + len(chunk)
+                job.billsCreated = (job.billsCreated or 0) + report["bills_created"] + report.get("bills_updated", 0)
+                job.heartbeatAt = datetime.now()
+                db.commit()
+
+            job.status = "SUCCEEDED"
+            job.finishedDate = datetime.now()
+            db.commit()
+
+        except Exception as e:
+            db.rollback()
+            print(f"[BILLING-JOB ERROR] Job {job_id}: {e}")
+            db.query(BillingJob).filter(BillingJob.jobID == job_id).update(
+                {"status": "FAILED", "error": str(e), "finishedDate": datetime.now()},
+                synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    @staticmethod
+    def _execute_sharded(db: Session, job: BillingJob, building_ids: list[str] | None, apt_query) -> None:
+        """Chạy job theo shard tòa nhà; khi chạy lại chỉ tính các tòa nhà chưa thành công"""
+        report = json.loads(job.report) if job.report else {"shards": {}}
+        resuming = job.lastApartmentID is not None
+        if not resuming:
+            job.lastApartmentID = ""
+            job.startedDate = datetime.now()
+            job.totalApartments = apt_query.count()
+            db.commit()
+
+        if building_ids is None:
+            building_ids = [b for (b,) in db.query(Apartment.buildingID).distinct() if b is not None]
+        done = {b for b, r in report["shards"].items() if r["ok"]}
+        remaining = sorted(set(building_ids) - done)
+
+        if resuming and not job.overwrite and remaining:
+            # Shard đã commit hóa đơn rồi worker chết trước khi ghi tiến độ: chạy lại sẽ
+            # vướng ensure_not_billed nên ghi nhận luôn là thành công
+            committed = BillingJobService._committed_shards(db, job, remaining)
+            for building_id, result in committed.items():
+                report["shards"][building_id] = result
+                job.processedApartments = (job.processedApartments or 0) + result["apartments"]
+                job.billsCreated = (job.billsCreated or 0) + result["bills_created"]
+            if committed:
+                job.report = json.dumps(report)
+                db.commit()
+                remaining = [b for b in remaining if b not in committed]
+
+        def on_shard_done(result):
+            report["shards"][result["building_id"]] = {
+                key: result.get(key) for key in ("ok", "error", "apartments", "bills_created", "bills_updated", "total_ms")
+            }
+            if result["ok"]:
+                job.processedApartments = (job.processedApartments or 0) + result["apartments"]
+                job.billsCreated = (job.billsCreated or 0) + result["bills_created"] + result.get("bills_updated", 0)
+            job.report = json.dumps(report)
+            job.heartbeatAt = datetime.now()
+            db.commit()
+            db.refresh(job)
+            return not job.cancelRequested
+
+        BillingEngine.run_sharded(
+            db, job.month, job.year, job.accountantID, job.deadlineDay, job.overwrite,
+            building_ids=remaining,
+            use_processes=os.getenv("BILLING_SHARD_PROCESSES", "").lower() in ("1", "true"),
+            on_shard_done=on_shard_done
+        )
+
+        errors = {b: r["error"] for b, r in report["shards"].items() if not r["ok"]}
+        if job.cancelRequested:
+            job.status = "CANCELLED"
+        elif errors:
+            job.status = "FAILED"
+            job.error = "; ".join(f"{b}: {e}" for b, e in errors.items())
+        else:
+            job.status = "SUCCEEDED"
+        job.finishedDate = datetime.now()
+        db.commit()
+
+    @staticmethod
+    def _committed_shards(db: Session, job: BillingJob, building_ids: list[str]) -> dict:
+        """Các tòa nhà đã có hóa đơn kỳ này do chính job tạo (shard chạy trong 1 transaction)"""
+        deadline_date = BillingEngine.deadline_for(job.month, job.year, job.deadlineDay)
+        bill_counts = dict(
+            BillingEngine.existing_bills(db, deadline_date, BillingEngine.apartments_of_buildings(building_ids))
+            .join(Apartment, Apartment.apartmentID == Bill.apartmentID)
+            .filter(
+                Bill.accountantID == job.accountantID,
+                # createDate của hóa đơn bỏ phần micro giây
+                Bill.createDate >= job.startedDate.replace(microsecond=0)
+            )
+            .with_entities(Apartment.buildingID, func.count(Bill.billID))
+            .group_by(Apartment.buildingID)
+        )
+        if not bill_counts:
+            return {}
+        apartment_counts = dict(
+            db.query(Apartment.buildingID, func.count(Apartment.apartmentID))
+            .filter(Apartment.buildingID.in_(list(bill_counts)))
+            .group_by(Apartment.buildingID)
+        )
+        return {
+            building_id: {
+                "ok": True, "error": None, "apartments": apartment_counts.get(building_id, 0),
+                "bills_created": bills, "bills_updated": 0, "total_ms": None, "recovered": True,
+            }
+            for building_id, bills in bill_counts.items()
+        }
+
+    @staticmethod
+    def resume_pending() -> int:
+        """
+        Đẩy lại vào pool các job QUEUED và job RUNNING đã mất heartbeat
+        (process chạy job bị tắt). Gọi khi khởi động và định kỳ.
+        """
+        db = SessionLocal()
+        try:
+            stale_before = datetime.now() - STALE_AFTER
+            job_ids = [job_id for (job_id,) in db.query(BillingJob.jobID).filter(
+                BillingJob.cancelRequested.is_(False),
+                or_(
+                    BillingJob.status == "QUEUED",
+                    and_(BillingJob.status == "RUNNING", BillingJob.heartbeatAt < stale_before)
+                )
+            )]
+        finally:
+            db.close()
+
+        executor = BillingJobService._get_executor()
+        for job_id in job_ids:
+            executor.submit(BillingJobService.execute, job_id)
+        return len(job_ids)
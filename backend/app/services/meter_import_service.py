@@ -0,0 +1,241 @@
+"""
+Nhập chỉ số điện nước hàng loạt từ file CSV/XLSX.
+
+File được đọc tuần tự từng dòng (csv reader trên luồng upload, openpyxl read_only
+cho XLSX) nên không nạp cả file vào bộ nhớ. Các dòng được gom theo lô BATCH_SIZE:
+mỗi lô chỉ chạy 1 câu SELECT căn hộ, 1 câu SELECT chỉ số kỳ trước (bảng
+METER_READING_LATEST) và 1 câu INSERT ... ON DUPLICATE KEY UPDATE nhiều dòng. Dòng
+lỗi không chặn cả file mà được ghi vào báo cáo kèm số dòng.
+"""
+import csv
+import io
+import os
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from fastapi import HTTPException, status
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.orm import Session
+
+from backend.app.models.apartment import Apartment
+from backend.app.models.meter_reading import MeterReading
+from backend.app.services.meter_reading_service import MeterReadingService
+
+# Số dòng mỗi lô kiểm tra + ghi
+BATCH_SIZE = 1000
+# Báo cáo chỉ liệt kê tối đa chừng này dòng lỗi (vẫn đếm đủ tổng số)
+MAX_REPORTED_ERRORS = 1000
+# DECIMAL(10, 2)
+MAX_READING = Decimal("99999999.99")
+CENT = Decimal("0.01")
+
+REQUIRED_COLUMNS = ("apartmentID", "newElectricity", "newWater")
+OPTIONAL_COLUMNS = ("oldElectricity", "oldWater")
+UPSERT_COLUMNS = ("oldElectricity", "newElectricity", "oldWater", "newWater", "recordedDate", "accountantID")
+
+
+class MeterImportService:
+
+    @staticmethod
+    def _header_map(header) -> dict:
+        """Ánh xạ tên cột (không phân biệt hoa thường) -> vị trí cột trong file"""
+        known = {name.lower(): name for name in REQUIRED_COLUMNS + OPTIONAL_COLUMNS}
+        positions = {}
+        for index, cell in enumerate(header or ()):
+            name = known.get(str(cell).strip().lower()) if cell is not None else None
+            if name and name not in positions:
+                positions[name] = index
+
+        missing = [name for name in REQUIRED_COLUMNS if name not in positions]
+        if missing:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"File thiếu cột bắt buộc: {', '.join(missing)}"
+            )
+        return positions
+
+    @staticmethod
+    def _iter_csv(file):
+        text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+        try:
+            yield from csv.reader(text)
+        finally:
+            text.detach()
+
+    @staticmethod
+    def _iter_xlsx(file):
+        try:
+            from openpyxl import load_workbook
+        except ImportError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Máy chủ chưa cài openpyxl, hãy dùng file CSV."
+            )
+        try:
+            workbook = load_workbook(file, read_only=True, data_only=True)
+        except Exception:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="File XLSX không hợp lệ.")
+        try:
+            yield from workbook.active.iter_rows(values_only=True)
+        finally:
+            workbook.close()
+
+    @staticmethod
+    def iter_rows(file, filename: str):
+        """Sinh (số dòng, dict giá trị) cho từng dòng dữ liệu, bỏ qua dòng trống"""
+        extension = os.path.splitext(filename or "")[1].lower()
+        if extension == ".csv":
+            rows = MeterImportService._iter_csv(file)
+        elif extension in (".xlsx", ".xlsm"):
+            rows = MeterImportService._iter_xlsx(file)
+        else:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Chỉ hỗ trợ file .csv hoặc .xlsx"
+            )
+
+        positions = MeterImportService._header_map(next(rows, None))
+        for row_number, row in enumerate(rows, start=2):
+            if not row or all(cell is None or str(cell).strip() == "" for cell in row):
+                continue
+            yield row_number, {
+                name: row[index] if index < len(row) else None
+                for name, index in positions.items()
+            }
+
+    @staticmethod
+    def _parse_number(value, column: str):
+        """Trả về (giá trị Decimal | None nếu ô trống, thông báo lỗi | None)"""
+        if value is None or str(value).strip() == "":
+            return None, None
+        try:
+            number = Decimal(str(value).strip())
+        except InvalidOperation:
+            return None, f"{column} không phải là số: {value}"
+        if not number.is_finite() or number < 0 or number > MAX_READING:
+            return None, f"{column} không hợp lệ: {value}"
+        return number.quantize(CENT), None
+
+    @staticmethod
+    def _validate_batch(db: Session, batch: list, month: int, year: int, accountant_id: int,
+                        recorded_at: datetime, seen: set, errors: list, anomalies: list) -> list[dict]:
+        """
+        Kiểm tra một lô dòng; trả về các dòng hợp lệ dạng dict để ghi.
+        Dòng lỗi ghi vào errors; dòng hợp lệ nhưng bất thường (cảnh báo) ghi vào anomalies.
+        """
+        ids = {str(data["apartmentID"]).strip() for _, data in batch if data["apartmentID"] is not None}
+        known = {
+            apartment_id for (apartment_id,) in
+            db.query(Apartment.apartmentID).filter(Apartment.apartmentID.in_(ids))
+        }
+
+        # Chỉ số kỳ trước của cả lô: 1 câu SELECT vào METER_READING_LATEST
+        baselines = MeterReadingService.baselines(db, known, month, year)
+
+        values = []
+        for row_number, data in batch:
+            apartment_id = str(data["apartmentID"]).strip() if data["apartmentID"] is not None else ""
+
+            def fail(message):
+                errors.append({"row": row_number, "apartmentID": apartment_id or None, "error": message})
+
+            if not apartment_id:
+                fail("Thiếu apartmentID")
+                continue
+            if apartment_id not in known:
+                fail(f"Không tồn tại căn hộ {apartment_id}")
+                continue
+            if apartment_id in seen:
+                fail(f"Căn hộ {apartment_id} xuất hiện nhiều lần trong file")
+                continue
+
+            parsed = {}
+            messages = []
+            for column in REQUIRED_COLUMNS[1:] + OPTIONAL_COLUMNS:
+                parsed[column], message = MeterImportService._parse_number(data.get(column), column)
+                if message:
+                    messages.append(message)
+                elif parsed[column] is None and column in REQUIRED_COLUMNS:
+                    messages.append(f"Thiếu {column}")
+            if messages:
+                fail("; ".join(messages))
+                continue
+
+            # Điền chỉ số cũ còn trống + kiểm tra tiêu thụ âm / tăng đột biến trong cùng một lượt
+            found = MeterReadingService.prepare(parsed, baselines.get(apartment_id))
+            if MeterReadingService.is_blocking(found):
+                fail("; ".join(anomaly["message"] for anomaly in found))
+                continue
+            anomalies.extend(
+                {"row": row_number, "apartmentID": apartment_id, **anomaly} for anomaly in found
+            )
+
+            seen.add(apartment_id)
+            values.append({
+                "apartmentID": apartment_id,
+                "month": month,
+                "year": year,
+                **parsed,
+                "recordedDate": recorded_at,
+                "accountantID": accountant_id,
+            })
+        return values
+
+    @staticmethod
+    def _upsert(db: Session, values: list[dict]) -> None:
+        """
+        Ghi cả lô bằng INSERT ... ON DUPLICATE KEY UPDATE (khóa căn hộ + tháng + năm).
+        Câu lệnh chỉ biên dịch một lần; executemany của PyMySQL gộp các dòng thành
+        INSERT nhiều VALUES nên mỗi lô chỉ tốn một vòng gửi tới DB.
+        """
+        if not values:
+            return
+        stmt = mysql_insert(MeterReading.__table__)
+        stmt = stmt.on_duplicate_key_update({column: stmt.inserted[column] for column in UPSERT_COLUMNS})
+        db.execute(stmt, values)
+
+    @staticmethod
+    def import_readings(db: Session, file, filename: str, month: int, year: int, accountant_id: int) -> dict:
+        """
+        Nhập chỉ số cho kỳ month/year từ file. Cột bắt buộc: apartmentID, newElectricity,
+        newWater; cột oldElectricity/oldWater bỏ trống sẽ lấy chỉ số mới của tháng trước.
+        Dòng đã có chỉ số trong kỳ sẽ được ghi đè.
+        """
+        if not 1 <= month <= 12:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Tháng không hợp lệ")
+
+        recorded_at = datetime.now()
+        seen: set = set()
+        errors: list = []
+        anomalies: list = []
+        imported_ids: list = []
+        total_rows = 0
+
+        batch = []
+        rows = MeterImportService.iter_rows(file, filename)
+        while True:
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= BATCH_SIZE:
+                    break
+            if not batch:
+                break
+            total_rows += len(batch)
+            values = MeterImportService._validate_batch(
+                db, batch, month, year, accountant_id, recorded_at, seen, errors, anomalies
+            )
+            MeterImportService._upsert(db, values)
+            MeterReadingService.refresh_latest(db, values)
+            imported_ids.extend(value["apartmentID"] for value in values)
+            batch = []
+        db.commit()
+
+        return {
+            "month": month,
+            "year": year,
+            "total_rows": total_rows,
+            "imported": len(imported_ids),
+            "failed": len(errors),
+            "errors": errors[:MAX_REPORTED_ERRORS],
+            "anomalies": anomalies[:MAX_REPORTED_ERRORS],
+            "apartment_ids": imported_ids,
+        }
@@ -0,0 +1,181 @@
+"""
+Chỉ số điện nước: tự điền chỉ số cũ và phát hiện bất thường.
+
+Bảng METER_READING_LATEST giữ chỉ số của kỳ mới nhất mỗi căn hộ và được cập nhật
+cùng transaction với mỗi lần ghi METER_READING (refresh_latest). Nhờ đó chỉ số kỳ
+trước của cả một lô căn hộ lấy được bằng 1 câu SELECT theo khóa chính, không phải
+tra từng căn hộ trong METER_READING. Chỉ khi sửa lại một kỳ cũ (index đã ở kỳ đó
+hoặc kỳ sau) mới cần tra lịch sử, và cũng chỉ 1 câu cho cả lô.
+"""
+from datetime import datetime
+from decimal import Decimal
+from sqlalchemy import delete, func, insert, select, and_
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.orm import Session
+
+from backend.app.models.meter_reading import MeterReading
+from backend.app.models.meter_reading_latest import MeterReadingLatest
+
+# Tiêu thụ kỳ này > OUTLIER_FACTOR lần kỳ trước và tăng ít nhất OUTLIER_MIN_JUMP thì bị đánh dấu
+OUTLIER_FACTOR = Decimal(3)
+OUTLIER_MIN_JUMP = {"Electricity": Decimal(100), "Water": Decimal(10)}
+# Số kỳ lịch sử tối đa được tra khi sửa lại kỳ cũ
+HISTORY_PERIODS = 12
+
+READING_COLUMNS = ("oldElectricity", "newElectricity", "oldWater", "newWater")
+# Bất thường chặn không cho ghi; các loại còn lại chỉ cảnh báo
+BLOCKING_ANOMALIES = {"NEGATIVE_CONSUMPTION"}
+
+
+class MeterReadingService:
+
+    @staticmethod
+    def _period(month: int, year: int) -> int:
+        return year * 12 + month
+
+    @staticmethod
+    def _decimal(value) -> Decimal:
+        return value if isinstance(value, Decimal) else Decimal(str(value or 0))
+
+    @staticmethod
+    def baselines(db: Session, apartment_ids, month: int, year: int) -> dict:
+        """
+        Chỉ số kỳ gần nhất trước kỳ month/year của các căn hộ:
+        {apartmentID: {"month", "year", "oldElectricity", "newElectricity", "oldWater", "newWater"}}.
+        Căn hộ chưa có chỉ số nào trước kỳ này không có trong kết quả.
+        """
+        apartment_ids = list(apartment_ids)
+        if not apartment_ids:
+            return {}
+
+        target = MeterReadingService._period(month, year)
+        result = {}
+        history_needed = []
+        for row in db.query(
+            MeterReadingLatest.apartmentID, MeterReadingLatest.month, MeterReadingLatest.year,
+            *(getattr(MeterReadingLatest, column) for column in READING_COLUMNS)
+        ).filter(MeterReadingLatest.apartmentID.in_(apartment_ids)):
+            if MeterReadingService._period(row.month, row.year) < target:
+                result[row.apartmentID] = dict(row._mapping)
+            else:
+                history_needed.append(row.apartmentID)
+
+        if history_needed:
+            period = MeterReading.year * 12 + MeterReading.month
+            rows = db.query(
+                MeterReading.apartmentID, MeterReading.month, MeterReading.year,
+                *(getattr(MeterReading, column) for column in READING_COLUMNS)
+            ).filter(
+                MeterReading.apartmentID.in_(history_needed),
+                period.between(target - HISTORY_PERIODS, target - 1)
+            ).order_by(MeterReading.year, MeterReading.month)
+            # Sắp theo kỳ tăng dần nên dòng sau ghi đè dòng trước -> giữ kỳ gần nhất
+            for row in rows:
+                result[row.apartmentID] = dict(row._mapping)
+        return result
+
+    @staticmethod
+    def prepare(values: dict, baseline: dict | None) -> list[dict]:
+        """
+        Điền chỉ số cũ còn trống (None) từ baseline rồi kiểm tra bất thường, trong một lượt.
+        values được sửa tại chỗ; trả về danh sách bất thường {"type", "message"}.
+        """
+        anomalies = []
+        for kind, label in (("Electricity", "điện"), ("Water", "nước")):
+            old_key, new_key = f"old{kind}", f"new{kind}"
+            previous_new = MeterReadingService._decimal(baseline[new_key]) if baseline else None
+
+            if values[old_key] is None:
+                values[old_key] = previous_new if previous_new is not None else Decimal(0)
+            elif previous_new is not None and MeterReadingService._decimal(values[old_key]) != previous_new:
+                anomalies.append({
+                    "type": "OLD_MISMATCH",
+                    "message": f"Chỉ số {label} cũ ({values[old_key]}) khác chỉ số mới kỳ trước ({previous_new})"
+                })
+
+            usage = MeterReadingService._decimal(values[new_key]) - MeterReadingService._decimal(values[old_key])
+            if usage < 0:
+                anomalies.append({
+                    "type": "NEGATIVE_CONSUMPTION",
+                    "message": f"Chỉ số {label} mới ({values[new_key]}) nhỏ hơn chỉ số cũ ({values[old_key]})"
+                })
+                continue
+
+            if baseline:
+                previous_usage = max(previous_new - MeterReadingService._decimal(baseline[old_key]), Decimal(0))
+                if usage > previous_usage * OUTLIER_FACTOR and usage - previous_usage >= OUTLIER_MIN_JUMP[kind]:
+                    anomalies.append({
+                        "type": "OUTLIER_JUMP",
+                        "message": f"Tiêu thụ {label} {usage} tăng đột biến so với kỳ trước ({previous_usage})"
+                    })
+        return anomalies
+
+    @staticmethod
+    def is_blocking(anomalies: list[dict]) -> bool:
+        return any(anomaly["type"] in BLOCKING_ANOMALIES for anomaly in anomalies)
+
+    @staticmethod
+    def refresh_latest(db: Session, rows: list[dict]) -> None:
+        """
+        Cập nhật index sau khi ghi METER_READING (gọi trong cùng transaction).
+        Chỉ ghi đè khi kỳ của dòng mới >= kỳ đang lưu, nên nhập lại kỳ cũ không làm lùi index.
+        """
+        if not rows:
+            return
+        table = MeterReadingLatest.__table__
+        stmt = mysql_insert(table)
+        newer = stmt.inserted.year * 12 + stmt.inserted.month >= table.c.year * 12 + table.c.month
+        # MySQL gán lần lượt từ trái sang phải, biểu thức sau thấy các cột đã gán trước đó.
+        # Các cột chỉ số so kỳ trên dòng cũ; sau đó gán month rồi mới tới year: dòng mới hơn
+        # thì year mới >= year cũ nên phép so sau khi đổi month vẫn đúng, còn dòng không mới
+        # hơn thì month giữ nguyên nên phép so vẫn sai. Gán year trước sẽ làm hỏng phép so
+        # của month khi qua năm (12/2025 -> 1/2026 giữ lại month 12).
+        assignments = [
+            (column, func.IF(newer, stmt.inserted[column], table.c[column]))
+            for column in READING_COLUMNS + ("updatedAt", "month", "year")
+        ]
+        stmt = stmt.on_duplicate_key_update(assignments)
+        db.execute(stmt, [
+            {
+                "apartmentID": row["apartmentID"],
+                "month": row["month"],
+                "year": row["year"],
+                **{column: row[column] for column in READING_COLUMNS},
+                "updatedAt": row.get("recordedDate") or datetime.now(),
+            }
+            for row in rows
+        ])
+
+    @staticmethod
+    def rebuild_latest(db: Session) -> int:
+        """Dựng lại toàn bộ index từ METER_READING (dùng khi khởi tạo / đồng bộ lại)"""
+        period = MeterReading.year * 12 + MeterReading.month
+        latest = select(
+            MeterReading.apartmentID.label("apartmentID"),
+            func.max(period).label("period")
+        ).group_by(MeterReading.apartmentID).subquery()
+
+        source = select(
+            MeterReading.apartmentID, MeterReading.month, MeterReading.year,
+            *(getattr(MeterReading, column) for column in READING_COLUMNS),
+            MeterReading.recordedDate
+        ).join(latest, and_(
+            MeterReading.apartmentID == latest.c.apartmentID,
+            period == latest.c.period
+        ))
+
+        db.execute(delete(MeterReadingLatest))
+        result = db.execute(insert(MeterReadingLatest).from_select(
+            ["apartmentID", "month", "year", *READING_COLUMNS, "updatedAt"], source
+        ))
+        db.commit()
+        return result.rowcount
+
+    @staticmethod
+    def backfill_latest_if_empty(db: Session) -> int:
+        """Index trống nhưng đã có dữ liệu chỉ số (mới nâng cấp) thì dựng lại một lần"""
+        if db.query(MeterReadingLatest.apartmentID).first() is not None:
+            return 0
+        if db.query(MeterReading.readingID).first() is None:
+            return 0
+        return MeterReadingService.rebuild_latest(db)
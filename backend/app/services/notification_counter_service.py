@@ -0,0 +1,187 @@
+"""
+Bộ đếm thông báo chưa đọc cho badge chuông.
+
+Số chưa đọc của cư dân = NOTIFICATION_COUNTER.unreadCount
+                        + (tổng thông báo chung - broadcastReadCount).
+Bộ đếm được ghi kèm (write-through) trong cùng transaction với mỗi lần tạo thông
+báo hoặc đánh dấu đã đọc, nên lượt poll badge chỉ còn 1 lần đọc theo khóa chính;
+phía trước còn một cache TTL trong process, mục của cư dân bị đổi được xóa khi transaction
+commit (rollback thì cache không bị đụng). reconcile() định kỳ tính lại từ dữ
+liệu gốc để sửa mọi sai lệch (ghi trực tiếp vào DB, lỗi giữa chừng...).
+"""
+import threading
+import time
+from collections import Counter, defaultdict
+from sqlalchemy import event, func, insert, select
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.orm import Session
+
+from backend.app.models.notification import Notification
+from backend.app.models.notification_broadcast import NotificationBroadcast
+from backend.app.models.notification_broadcast_read import NotificationBroadcastRead
+from backend.app.models.notification_counter import NotificationCounter
+from backend.app.models.resident import Resident
+
+# Thời gian sống của cache (giây)
+CACHE_TTL = 30
+# Session.info: residentID có bộ đếm bị đổi trong transaction đang mở
+DIRTY_KEY = "notification_counter_dirty"
+
+
+class NotificationCounterService:
+
+    _lock = threading.Lock()
+    # residentID -> (hết hạn, unreadCount, broadcastReadCount)
+    _counters: dict = {}
+    # (hết hạn, tổng số thông báo chung)
+    _broadcast_total = (0.0, 0)
+
+    @staticmethod
+    def _broadcasts(db: Session) -> int:
+        now = time.monotonic()
+        expires, total = NotificationCounterService._broadcast_total
+        if expires > now:
+            return total
+        total = db.query(func.count(NotificationBroadcast.broadcastID)).scalar()
+        NotificationCounterService._broadcast_total = (now + CACHE_TTL, total)
+        return total
+
+    @staticmethod
+    def _counts(*conditions):
+        """SELECT residentID, số chưa đọc, số thông báo chung đã đọc tính từ dữ liệu gốc"""
+        unread = select(func.count(Notification.notificationID)).where(
+            Notification.residentID == Resident.residentID,
+            Notification.isRead == False
+        ).scalar_subquery()
+        reads = select(func.count(NotificationBroadcastRead.broadcastID)).where(
+            NotificationBroadcastRead.residentID == Resident.residentID
+        ).scalar_subquery()
+        return select(Resident.residentID, unread, reads).where(*conditions)
+
+    @staticmethod
+    def _load(db: Session, resident_id: int) -> tuple[int, int]:
+        """
+        Đọc bộ đếm theo khóa chính; cư dân chưa có dòng thì tính một lần rồi ghi lại bằng
+        session riêng (không commit thay transaction của bên gọi)
+        """
+        row = db.query(NotificationCounter.unreadCount, NotificationCounter.broadcastReadCount)\
+            .filter(NotificationCounter.residentID == resident_id).first()
+        if row is not None:
+            return row.unreadCount, row.broadcastReadCount
+
+        row = db.execute(NotificationCounterService._counts(Resident.residentID == resident_id)).first()
+        if row is None:
+            return 0, 0
+        _, unread, reads = row
+        writer = Session(bind=db.get_bind())
+        try:
+            # Dòng do transaction khác vừa tạo thì giữ nguyên
+            writer.execute(insert(NotificationCounter.__table__).prefix_with("IGNORE", dialect="mysql"), {
+                "residentID": resident_id, "unreadCount": unread, "broadcastReadCount": reads
+            })
+            writer.commit()
+        except Exception as e:
+            writer.rollback()
+            print(f"[COUNTER ERROR] {e}")
+        finally:
+            writer.close()
+        return unread, reads
+
+    @staticmethod
+    def get_unread(db: Session, resident_id: int) -> int:
+        """Số thông báo chưa đọc (riêng + chung) của cư dân"""
+        now = time.monotonic()
+        cached = NotificationCounterService._counters.get(resident_id)
+        if cached and cached[0] > now:
+            _, unread, reads = cached
+        else:
+            unread, reads = NotificationCounterService._load(db, resident_id)
+            NotificationCounterService._counters[resident_id] = (now + CACHE_TTL, unread, reads)
+        return max(unread, 0) + max(NotificationCounterService._broadcasts(db) - reads, 0)
+
+    @staticmethod
+    def _add(db: Session, column, deltas: dict) -> None:
+        """
+        Cộng {residentID: delta} vào cột bộ đếm. Gọi sau khi thay đổi dữ liệu gốc trong cùng
+        transaction: cư dân chưa có dòng thì dòng được tạo với số đếm đầy đủ tính từ dữ liệu
+        gốc (đã gồm thay đổi này), không phải chỉ delta. Cache bị xóa sau khi commit.
+        """
+        deltas = {resident_id: delta for resident_id, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        db.flush()
+        existing = {resident_id for resident_id, in db.query(NotificationCounter.residentID)
+                    .filter(NotificationCounter.residentID.in_(list(deltas)))}
+        by_delta = defaultdict(list)
+        for resident_id in existing:
+            by_delta[deltas[resident_id]].append(resident_id)
+        for delta, resident_ids in by_delta.items():
+            db.query(NotificationCounter).filter(NotificationCounter.residentID.in_(resident_ids))\
+                .update({column: column + delta}, synchronize_session=False)
+
+        missing = [resident_id for resident_id in deltas if resident_id not in existing]
+        if missing:
+            db.execute(
+                insert(NotificationCounter.__table__).prefix_with("IGNORE", dialect="mysql").from_select(
+                    ["residentID", "unreadCount", "broadcastReadCount"],
+                    NotificationCounterService._counts(Resident.residentID.in_(missing))
+                )
+            )
+        db.info.setdefault(DIRTY_KEY, set()).update(deltas)
+
+    @staticmethod
+    def add_unread(db: Session, deltas: dict) -> None:
+        """Cộng/trừ số chưa đọc theo {residentID: delta} (gọi trong transaction ghi thông báo)"""
+        NotificationCounterService._add(db, NotificationCounter.unreadCount, deltas)
+
+    @staticmethod
+    def count_new_rows(db: Session, rows: list[dict]) -> None:
+        """Ghi kèm bộ đếm cho một lô dòng NOTIFICATION vừa INSERT"""
+        NotificationCounterService.add_unread(
+            db, Counter(row["residentID"] for row in rows if not row.get("isRead"))
+        )
+
+    @staticmethod
+    def add_broadcast_read(db: Session, resident_id: int, count: int = 1) -> None:
+        """Ghi kèm khi cư dân đánh dấu đã đọc thông báo chung"""
+        NotificationCounterService._add(db, NotificationCounter.broadcastReadCount, {resident_id: count})
+
+    @staticmethod
+    def broadcast_created() -> None:
+        """Có thông báo chung mới: cộng ngay vào tổng đang cache"""
+        with NotificationCounterService._lock:
+            expires, total = NotificationCounterService._broadcast_total
+            NotificationCounterService._broadcast_total = (expires, total + 1)
+
+    @staticmethod
+    def reconcile(db: Session) -> int:
+        """Tính lại toàn bộ bộ đếm từ NOTIFICATION / NOTIFICATION_BROADCAST_READ bằng 1 câu INSERT ... SELECT"""
+        stmt = mysql_insert(NotificationCounter.__table__).from_select(
+            ["residentID", "unreadCount", "broadcastReadCount"],
+            NotificationCounterService._counts()
+        )
+        stmt = stmt.on_duplicate_key_update(
+            unreadCount=stmt.inserted.unreadCount,
+            broadcastReadCount=stmt.inserted.broadcastReadCount
+        )
+        result = db.execute(stmt)
+        db.commit()
+
+        with NotificationCounterService._lock:
+            NotificationCounterService._counters.clear()
+            NotificationCounterService._broadcast_total = (0.0, 0)
+        return result.rowcount
+
+
+@event.listens_for(Session, "after_commit")
+def _drop_committed_counters(session: Session) -> None:
+    dirty = session.info.pop(DIRTY_KEY, None)
+    if dirty:
+        with NotificationCounterService._lock:
+            for resident_id in dirty:
+                NotificationCounterService._counters.pop(resident_id, None)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back_counters(session: Session) -> None:
+    session.info.pop(DIRTY_KEY, None)
@@ -0,0 +1,165 @@
+"""
+Lưu giữ thông báo: chuyển thông báo riêng đã đọc, cũ hơn NOTIFICATION_RETENTION_DAYS ngày
+từ NOTIFICATION sang NOTIFICATION_ARCHIVE (bảng nén, không khóa ngoại).
+
+- Chuyển theo lô ARCHIVE_BATCH_SIZE dòng, mỗi lô một transaction ngắn (INSERT ... SELECT
+  rồi DELETE theo khóa chính) và nghỉ BATCH_PAUSE_SECONDS giữa các lô để không giữ khóa lâu.
+  Lô kế tiếp đọc tiếp từ notificationID cuối của lô trước nên mỗi lần chạy chỉ quét bảng một lượt.
+- Chỉ dòng đã đọc được chuyển nên bộ đếm chưa đọc không đổi.
+- MySQL: đặt NOTIFICATION_ARCHIVE_PARTITIONS=1 để bảng lưu trữ được chia partition theo tháng
+  (pYYYYMM); NOTIFICATION_ARCHIVE_KEEP_MONTHS > 0 thì partition cũ hơn số tháng đó bị DROP.
+- Danh sách thông báo chỉ đọc bảng lưu trữ khi trang chạm tới archive_cutoff(): thông báo mới
+  hơn mốc đó chưa thể bị lưu trữ nên không cần hỏi DB. Khi đã chạm mốc, archive_horizon()
+  đọc createdDate lớn nhất của bảng lưu trữ từ DB (không cache trong process) nên lượt lưu
+  trữ chạy ở process khác cũng được thấy ngay.
+"""
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import delete, func, insert, literal, select, text
+from sqlalchemy.orm import Session
+
+from backend.app.models.notification import Notification
+from backend.app.models.notification_archive import NotificationArchive
+
+# Số thông báo mỗi lô (mỗi lô là một transaction)
+ARCHIVE_BATCH_SIZE = 1000
+# Nghỉ giữa các lô (giây)
+BATCH_PAUSE_SECONDS = 0.05
+
+ARCHIVE_COLUMNS = (
+    "notificationID", "createdDate", "residentID", "title", "content",
+    "type", "relatedID", "electricity", "water",
+)
+
+
+def _month_start(value: datetime, offset: int = 0) -> datetime:
+    months = value.year * 12 + value.month - 1 + offset
+    return datetime(months // 12, months % 12 + 1, 1)
+
+
+class NotificationRetentionService:
+
+    _lock = threading.Lock()
+    # Kết quả lần chạy gần nhất
+    last_run: dict | None = None
+
+    @staticmethod
+    def retention_days() -> int:
+        return int(os.getenv("NOTIFICATION_RETENTION_DAYS", "180"))
+
+    @staticmethod
+    def archive_cutoff() -> datetime:
+        """Mốc thời gian mà thông báo mới hơn chưa thể nằm trong bảng lưu trữ"""
+        return datetime.now() - timedelta(days=NotificationRetentionService.retention_days())
+
+    @staticmethod
+    def archive_horizon(db: Session) -> datetime | None:
+        """Thông báo mới nhất đã lưu trữ (MAX trên index createdDate); None nếu bảng lưu trữ trống"""
+        return db.query(func.max(NotificationArchive.createdDate)).scalar()
+
+    @staticmethod
+    def archive_batch(db: Session, cutoff: datetime, after_id: int = 0,
+                      batch_size: int = ARCHIVE_BATCH_SIZE) -> tuple[int, int | None]:
+        """
+        Chuyển một lô thông báo đã đọc cũ hơn cutoff có notificationID > after_id.
+        Trả về (số dòng đã chuyển, notificationID cuối của lô | None nếu đã hết).
+        """
+        ids = [row_id for row_id, in db.query(Notification.notificationID).filter(
+            Notification.notificationID > after_id,
+            Notification.isRead == True,
+            Notification.createdDate < cutoff
+        ).order_by(Notification.notificationID).limit(batch_size)]
+        if not ids:
+            return 0, None
+
+        source = select(
+            *(getattr(Notification, column) for column in ARCHIVE_COLUMNS), literal(datetime.now())
+        ).where(Notification.notificationID.in_(ids), Notification.isRead == True)
+        db.execute(
+            insert(NotificationArchive)
+            .from_select([*ARCHIVE_COLUMNS, "archivedDate"], source)
+            .prefix_with("IGNORE", dialect="mysql")
+        )
+        moved = db.execute(
+            delete(Notification).where(Notification.notificationID.in_(ids), Notification.isRead == True)
+        ).rowcount
+        db.commit()
+        return moved, ids[-1]
+
+    @staticmethod
+    def ensure_partitions(db: Session, cutoff: datetime) -> dict:
+        """
+        MySQL: chia NOTIFICATION_ARCHIVE theo tháng tới hết tháng của cutoff (dòng cũ hơn
+        partition đầu tiên nằm trong partition đó) và DROP partition quá hạn giữ.
+        """
+        result = {"partitionsAdded": 0, "partitionsDropped": 0}
+        if db.get_bind().dialect.name != "mysql":
+            return result
+
+        table = NotificationArchive.__tablename__
+        names = {name for name, in db.execute(text(
+            "SELECT PARTITION_NAME FROM information_schema.PARTITIONS "
+            "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND PARTITION_NAME IS NOT NULL"
+        ), {"table": table})}
+        if not names:
+            db.execute(text(
+                f"ALTER TABLE {table} PARTITION BY RANGE (TO_DAYS(createdDate)) "
+                "(PARTITION pmax VALUES LESS THAN MAXVALUE)"
+            ))
+            names = {"pmax"}
+
+        months = sorted(name for name in names if name != "pmax")
+        month = _month_start(datetime.strptime(months[-1], "p%Y%m"), 1) if months else _month_start(cutoff)
+        added = []
+        while month <= cutoff:
+            added.append(
+                f"PARTITION p{month:%Y%m} VALUES LESS THAN (TO_DAYS('{_month_start(month, 1):%Y-%m-%d}'))"
+            )
+            month = _month_start(month, 1)
+        if added:
+            db.execute(text(
+                f"ALTER TABLE {table} REORGANIZE PARTITION pmax INTO "
+                f"({', '.join(added)}, PARTITION pmax VALUES LESS THAN MAXVALUE)"
+            ))
+            result["partitionsAdded"] = len(added)
+
+        keep_months = int(os.getenv("NOTIFICATION_ARCHIVE_KEEP_MONTHS", "0"))
+        if keep_months > 0:
+            oldest = f"p{_month_start(datetime.now(), -keep_months):%Y%m}"
+            expired = [name for name in months if name < oldest]
+            if expired:
+                db.execute(text(f"ALTER TABLE {table} DROP PARTITION {', '.join(expired)}"))
+                result["partitionsDropped"] = len(expired)
+        return result
+
+    @staticmethod
+    def run(db: Session, retention_days: int | None = None, max_batches: int | None = None) -> dict:
+        """Chạy một lượt lưu trữ; trả về và ghi lại số liệu vào last_run"""
+        started = time.monotonic()
+        cutoff = datetime.now() - timedelta(days=retention_days or NotificationRetentionService.retention_days())
+        metrics = {
+            "startedAt": datetime.now(),
+            "cutoff": cutoff,
+            "archived": 0,
+            "batches": 0,
+            "partitionsAdded": 0,
+            "partitionsDropped": 0,
+        }
+        if os.getenv("NOTIFICATION_ARCHIVE_PARTITIONS", "").lower() in ("1", "true"):
+            metrics.update(NotificationRetentionService.ensure_partitions(db, cutoff))
+
+        after_id = 0
+        while max_batches is None or metrics["batches"] < max_batches:
+            moved, after_id = NotificationRetentionService.archive_batch(db, cutoff, after_id)
+            if after_id is None:
+                break
+            metrics["archived"] += moved
+            metrics["batches"] += 1
+            time.sleep(BATCH_PAUSE_SECONDS)
+
+        metrics["seconds"] = round(time.monotonic() - started, 3)
+        with NotificationRetentionService._lock:
+            NotificationRetentionService.last_run = metrics
+        return metrics
@@ -1,82 +1,160 @@
-from sqlalchemy.orm import Session
+import heapq
+from itertools import islice
+from fastapi import HTTPException
+from sqlalchemy import and_, false, func, insert, literal, or_, select, update
+from sqlalchemy.orm import Session, aliased
 from backend.app.models.notification import Notification
+from backend.app.models.notification_archive import NotificationArchive
+from backend.app.models.notification_broadcast import NotificationBroadcast
+from backend.app.models.notification_broadcast_read import NotificationBroadcastRead
 from backend.app.models.resident import Resident
 from backend.app.models.bill import Bill
 from backend.app.models.meter_reading import MeterReading
+from backend.app.services.notification_counter_service import NotificationCounterService
+from backend.app.services.notification_retention_service import NotificationRetentionService, ARCHIVE_COLUMNS
+from backend.app.services.push_hub import PushHub
+from backend.app.utils.pagination import before_cursor
 from datetime import datetime
 
+# Số thông báo mỗi câu INSERT nhiều dòng / số cư dân mỗi lô khi gửi thông báo chung
+NOTIFY_CHUNK_SIZE = 1000
+
+
 class NotificationService:
 
     @staticmethod
-    def notify_new_bill(db: Session, bill_id: int, month: int, year: int, reading: MeterReading = None):
-        """Soạn nội dung thông báo dựa trên loại hóa đơn"""
-        bill = db.query(Bill).filter(Bill.billID == bill_id).first()
-        if not bill: return
+    def insert_many(db: Session, rows) -> int:
+        """
+        Ghi thông báo theo lô NOTIFY_CHUNK_SIZE dòng bằng Core insert (không qua unit-of-work).
+        Mỗi lô chạy executemany trên một câu INSERT đã biên dịch sẵn; PyMySQL gộp lô
+        thành một INSERT nhiều VALUES. rows có thể là generator. Không commit.
+        """
+        count = 0
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= NOTIFY_CHUNK_SIZE:
+                NotificationService._insert_chunk(db, chunk)
+                count += len(chunk)
+                chunk = []
+        if chunk:
+            NotificationService._insert_chunk(db, chunk)
+            count += len(chunk)
+        return count
 
-        resident = db.query(Resident).filter(Resident.apartmentID == bill.apartmentID).first()
-        if not resident: return
+    @staticmethod
+    def _insert_chunk(db: Session, chunk: list[dict]) -> None:
+        db.execute(insert(Notification), chunk)
+        # Ghi kèm bộ đếm chưa đọc trong cùng transaction
+        NotificationCounterService.count_new_rows(db, chunk)
+        # Đẩy realtime sau khi commit
+        for row in chunk:
+            PushHub.queue(db, [row["residentID"]], {"type": "notification", "notification": row})
 
+    @staticmethod
+    def render_new_bill(bill_type: str, apartment_id: str, total, deadline, month: int, year: int, reading=None) -> dict:
+        """
+        Soạn nội dung thông báo dựa trên loại hóa đơn.
+        Trả về dict các cột của NOTIFICATION (title, content, electricity, water)
+        để dùng chung cho cả luồng tạo lẻ và luồng tính hóa đơn hàng loạt.
+        """
         title = ""
         content = ""
         elec_val = None
         water_val = None
 
-        if bill.typeOfBill == "ELECTRICITY":
+        if bill_type == "ELECTRICITY":
             title = f"Tiền Điện Tháng {month}/{year}"
             cons = reading.newElectricity - reading.oldElectricity
             content = (
-                f"Thông báo tiền điện căn hộ {bill.apartmentID}:\n"
+                f"Thông báo tiền điện căn hộ {apartment_id}:\n"
                 f"- Chỉ số: {reading.oldElectricity:g} -> {reading.newElectricity:g}\n"
                 f"- Tiêu thụ: {cons:g} kWh\n"
-                f"- Tổng tiền: {bill.total:,.0f} VNĐ\n"
-                f"- Hạn thanh toán: {bill.deadline.strftime('%d/%m/%Y')}"
+                f"- Tổng tiền: {total:,.0f} VNĐ\n"
+                f"- Hạn thanh toán: {deadline.strftime('%d/%m/%Y')}"
             )
             elec_val = cons
 
-        elif bill.typeOfBill == "WATER":
+        elif bill_type == "WATER":
             title = f"Tiền Nước Tháng {month}/{year}"
             cons = reading.newWater - reading.oldWater
             content = (
-                f"Thông báo tiền nước căn hộ {bill.apartmentID}:\n"
+                f"Thông báo tiền nước căn hộ {apartment_id}:\n"
                 f"- Chỉ số: {reading.oldWater:g} -> {reading.newWater:g}\n"
                 f"- Tiêu thụ: {cons:g} m3\n"
-                f"- Tổng tiền: {bill.total:,.0f} VNĐ\n"
-                f"- Hạn thanh toán: {bill.deadline.strftime('%d/%m/%Y')}"
+                f"- Tổng tiền: {total:,.0f} VNĐ\n"
+                f"- Hạn thanh toán: {deadline.strftime('%d/%m/%Y')}"
             )
             water_val = cons
 
-        elif bill.typeOfBill == "SERVICE":
+        elif bill_type == "SERVICE":
             title = f"Phí Dịch Vụ Tháng {month}/{year}"
             content = (
-                f"Thông báo các phí dịch vụ căn hộ {bill.apartmentID} (Quản lý, Gửi xe, Rác...):\n"
-                f"- Tổng cộng: {bill.total:,.0f} VNĐ"
-                f"- Hạn thanh toán: {bill.deadline.strftime('%d/%m/%Y')}\n"
+                f"Thông báo các phí dịch vụ căn hộ {apartment_id} (Quản lý, Gửi xe, Rác...):\n"
+                f"- Tổng cộng: {total:,.0f} VNĐ"
+                f"- Hạn thanh toán: {deadline.strftime('%d/%m/%Y')}\n"
                 f"Vui lòng thanh toán đúng hạn để tránh phát sinh phí."
             )
 
-        noti = Notification(
-            residentID=resident.residentID,
-            title=title,
-            content=content,
-            type="NEW_BILL",
-            relatedID=bill.billID,
-            isRead=False,
-            createdDate=datetime.now(),
-            electricity=elec_val,
-            water=water_val
-        )
-        db.add(noti)
+        return {"title": title, "content": content, "electricity": elec_val, "water": water_val}
 
     @staticmethod
-    def notify_payment_result(db: Session, content: str, resident_id: int, status: str, amount: float, trans_id: int):
+    def notify_new_bill(db: Session, bill_id: int, month: int, year: int, reading: MeterReading = None):
+        """Soạn nội dung thông báo dựa trên loại hóa đơn"""
+        NotificationService.fan_out_new_bills(db, [
+            {"bill_id": bill_id, "month": month, "year": year, "reading": reading}
+        ])
+
+    @staticmethod
+    def fan_out_new_bills(db: Session, events: list[dict]) -> int:
         """
-        Tạo thông báo kết quả giao dịch.
-        content đầu vào là chuỗi dạng: "ELECTRICITY, WATER"
+        Thông báo hóa đơn mới cho cả lô sự kiện {bill_id, month, year, reading?}.
+        Hóa đơn + cư dân nhận được lấy bằng 1 câu JOIN cho cả lô. Không commit.
         """
-        createDate = datetime.now()
+        if not events:
+            return 0
+        bills = {
+            row.billID: row for row in db.execute(
+                select(
+                    Bill.billID, Bill.apartmentID, Bill.typeOfBill, Bill.total, Bill.deadline,
+                    func.min(Resident.residentID).label("residentID")
+                )
+                .join(Resident, Resident.apartmentID == Bill.apartmentID)
+                .where(Bill.billID.in_({event["bill_id"] for event in events}))
+                .group_by(Bill.billID, Bill.apartmentID, Bill.typeOfBill, Bill.total, Bill.deadline)
+            )
+        }
+
+        created_at = datetime.now()
+
+        def rows():
+            for event in events:
+                bill = bills.get(event["bill_id"])
+                if bill is None:
+                    continue
+                message = NotificationService.render_new_bill(
+                    bill.typeOfBill, bill.apartmentID, bill.total, bill.deadline,
+                    event["month"], event["year"], event.get("reading")
+                )
+                yield {
+                    "residentID": bill.residentID,
+                    "type": "NEW_BILL",
+                    "relatedID": bill.billID,
+                    "isRead": False,
+                    "createdDate": created_at,
+                    **message
+                }
+
+        return NotificationService.insert_many(db, rows())
 
-        month = createDate.month
-        year = createDate.year
+    @staticmethod
+    def render_payment_result(content: str, status: str, amount: float, created_at: datetime) -> tuple[str, str]:
+        """
+        Soạn tiêu đề + nội dung thông báo kết quả giao dịch.
+        content đầu vào là chuỗi dạng: "ELECTRICITY, WATER"
+        """
+        month = created_at.month
+        year = created_at.year
         if month==1: 
             month = 12
             year = year - 1
@@ -104,36 +182,275 @@ class NotificationService:
             title = "Lỗi giao dịch"
             msg_content = f"Có lỗi xảy ra trong quá trình xử lý giao dịch {display_content}."
 
-        current_resident = db.query(Resident).filter(Resident.residentID == resident_id).first()
-        
-        if not current_resident:
-            print(f"Error: Resident ID {resident_id} not found.")
-            return
-        
-        residents = db.query(Resident).filter(Resident.apartmentID == current_resident.apartmentID).all()
-
-        for resident in residents:
-            noti = Notification(
-                residentID=resident.residentID,
-                type="PAYMENT_RESULT",
-                title=title,
-                content=msg_content,
-                relatedID=trans_id,
-                isRead=False,
-                createdDate=createDate
-            )
-            db.add(noti)
+        return title, msg_content
 
+    @staticmethod
+    def notify_payment_result(db: Session, content: str, resident_id: int, status: str, amount: float, trans_id: int):
+        """
+        Tạo thông báo kết quả giao dịch.
+        content đầu vào là chuỗi dạng: "ELECTRICITY, WATER"
+        """
+        NotificationService.fan_out_payment_results(db, [{
+            "content": content,
+            "resident_id": resident_id,
+            "status": status,
+            "amount": amount,
+            "trans_id": trans_id,
+        }])
         db.commit()
 
+    @staticmethod
+    def fan_out_payment_results(db: Session, events: list[dict]) -> int:
+        """
+        Thông báo kết quả giao dịch cho mọi cư dân cùng căn hộ với người thanh toán,
+        cho cả lô sự kiện {content, resident_id, status, amount, trans_id}.
+        Người nhận của cả lô lấy bằng 1 câu self-JOIN RESIDENT. Không commit.
+        """
+        if not events:
+            return 0
+        payer = aliased(Resident)
+        recipients: dict = {}
+        for payer_id, recipient_id in db.execute(
+            select(payer.residentID, Resident.residentID)
+            .join(Resident, Resident.apartmentID == payer.apartmentID)
+            .where(payer.residentID.in_({event["resident_id"] for event in events}))
+        ):
+            recipients.setdefault(payer_id, []).append(recipient_id)
+
+        created_at = datetime.now()
+
+        def rows():
+            for event in events:
+                residents = recipients.get(event["resident_id"])
+                if not residents:
+                    print(f"Error: Resident ID {event['resident_id']} not found.")
+                    continue
+                title, msg_content = NotificationService.render_payment_result(
+                    event["content"], event["status"], event["amount"], created_at
+                )
+                for recipient_id in residents:
+                    yield {
+                        "residentID": recipient_id,
+                        "type": "PAYMENT_RESULT",
+                        "title": title,
+                        "content": msg_content,
+                        "relatedID": event["trans_id"],
+                        "isRead": False,
+                        "createdDate": created_at
+                    }
+
+        return NotificationService.insert_many(db, rows())
+
     @staticmethod
     def create_broadcast(db: Session, title: str, content: str):
-        """Gửi thông báo chung cho tất cả cư dân"""
-        residents = db.query(Resident).all()
-        for r in residents:
-            db.add(Notification(
-                residentID=r.residentID, title=title, content=content,
-                type="GENERAL", isRead=False, createdDate=datetime.now()
+        """
+        Gửi thông báo chung cho tất cả cư dân.
+        Chỉ ghi 1 dòng NOTIFICATION_BROADCAST; danh sách thông báo của từng cư dân
+        ghép thông báo chung vào lúc đọc. Trả về số cư dân nhận được.
+        """
+        broadcast = NotificationBroadcast(title=title, content=content, createdDate=datetime.now())
+        db.add(broadcast)
+        db.flush()
+        PushHub.queue(db, None, {"type": "notification", "notification": {
+            "notificationID": -broadcast.broadcastID,
+            "type": "GENERAL",
+            "title": title,
+            "content": content,
+            "isRead": False,
+            "createdDate": broadcast.createdDate,
+        }})
+        db.commit()
+        NotificationCounterService.broadcast_created()
+        return db.query(func.count(Resident.residentID)).scalar()
+
+    @staticmethod
+    def _broadcast_as_notification(broadcast: NotificationBroadcast, resident_id: int, is_read: bool) -> Notification:
+        """
+        Dựng đối tượng Notification tạm (không thêm vào session) cho thông báo chung
+        để trả về cùng schema. notificationID âm = -broadcastID.
+        """
+        return Notification(
+            notificationID=-broadcast.broadcastID,
+            residentID=resident_id,
+            type="GENERAL",
+            title=broadcast.title,
+            content=broadcast.content,
+            isRead=is_read,
+            createdDate=broadcast.createdDate
+        )
+
+    @staticmethod
+    def _archive_as_notification(row: NotificationArchive) -> Notification:
+        """Đối tượng Notification tạm cho thông báo đã chuyển sang bảng lưu trữ (luôn đã đọc)"""
+        return Notification(
+            isRead=True,
+            **{column: getattr(row, column) for column in ARCHIVE_COLUMNS}
+        )
+
+    @staticmethod
+    def _broadcast_before(cursor: tuple, inclusive: bool = False):
+        """
+        Điều kiện thông báo chung đứng sau con trỏ trong danh sách (inclusive: tính cả dòng
+        của con trỏ). Thông báo chung mang id = -broadcastID (âm) nên cùng createdDate thì
+        đứng sau mọi thông báo riêng, và giữa chúng "id nhỏ hơn" nghĩa là broadcastID lớn hơn.
+        """
+        created, row_id = cursor
+        if created is None:
+            return false()
+        if row_id >= 0:
+            return NotificationBroadcast.createdDate <= created
+        same_time = NotificationBroadcast.broadcastID >= -row_id if inclusive \
+            else NotificationBroadcast.broadcastID > -row_id
+        return or_(
+            NotificationBroadcast.createdDate < created,
+            and_(NotificationBroadcast.createdDate == created, same_time)
+        )
+
+    @staticmethod
+    def list_for_resident(db: Session, resident_id: int, skip: int = 0, limit: int = 50,
+                          cursor: tuple | None = None) -> list:
+        """
+        Thông báo riêng + thông báo chung của cư dân, mới nhất trước.
+        Mỗi nguồn chỉ lấy tối đa skip + limit dòng đã sắp sẵn rồi trộn bằng heapq.merge.
+        cursor = (createdDate, notificationID) của dòng cuối trang trước (xem utils.pagination):
+        mỗi nguồn chỉ đọc tiếp từ mốc đó theo index nên trang sâu không phải quét lại từ đầu.
+        """
+        window = skip + limit
+        personal = db.query(Notification)\
+            .filter(Notification.residentID == resident_id)
+        broadcasts = db.query(NotificationBroadcast, NotificationBroadcastRead.readDate)\
+            .outerjoin(NotificationBroadcastRead, and_(
+                NotificationBroadcastRead.broadcastID == NotificationBroadcast.broadcastID,
+                NotificationBroadcastRead.residentID == resident_id
             ))
+
+        if cursor is not None:
+            personal = personal.filter(
+                before_cursor(Notification.createdDate, Notification.notificationID, cursor)
+            )
+            broadcasts = broadcasts.filter(NotificationService._broadcast_before(cursor))
+
+        personal = personal\
+            .order_by(Notification.createdDate.desc(), Notification.notificationID.desc())\
+            .limit(window).all()
+        broadcasts = [
+            NotificationService._broadcast_as_notification(broadcast, resident_id, read_date is not None)
+            for broadcast, read_date in broadcasts
+            .order_by(NotificationBroadcast.createdDate.desc(), NotificationBroadcast.broadcastID)
+            .limit(window)
+        ]
+
+        feed_key = lambda n: (n.createdDate, n.notificationID)
+        merged = list(islice(heapq.merge(personal, broadcasts, key=feed_key, reverse=True), window))
+
+        # Chỉ đọc bảng lưu trữ khi trang chưa đủ hoặc đã chạm tới vùng có thể đã lưu trữ
+        reaches_archive = len(merged) < window or \
+            merged[-1].createdDate <= NotificationRetentionService.archive_cutoff()
+        horizon = NotificationRetentionService.archive_horizon(db) if reaches_archive else None
+        if horizon is not None and (len(merged) < window or merged[-1].createdDate <= horizon):
+            archived = db.query(NotificationArchive).filter(NotificationArchive.residentID == resident_id)
+            if cursor is not None:
+                archived = archived.filter(
+                    before_cursor(NotificationArchive.createdDate, NotificationArchive.notificationID, cursor)
+                )
+            archived = [
+                NotificationService._archive_as_notification(row) for row in archived
+                .order_by(NotificationArchive.createdDate.desc(), NotificationArchive.notificationID.desc())
+                .limit(window)
+            ]
+            merged = heapq.merge(merged, archived, key=feed_key, reverse=True)
+        return list(islice(merged, skip, window))
+
+    @staticmethod
+    def count_unread(db: Session, resident_id: int) -> int:
+        """Số thông báo chưa đọc (riêng + chung), đọc từ bộ đếm"""
+        return NotificationCounterService.get_unread(db, resident_id)
+
+    @staticmethod
+    def mark_read(db: Session, resident_id: int, notification_id: int) -> None:
+        """Đánh dấu đã đọc; notification_id âm là thông báo chung (-broadcastID)"""
+        if notification_id < 0:
+            broadcast_id = -notification_id
+            if not db.query(NotificationBroadcast.broadcastID).filter(
+                NotificationBroadcast.broadcastID == broadcast_id
+            ).first():
+                raise HTTPException(404, "Không tìm thấy thông báo")
+            exists = db.query(NotificationBroadcastRead.broadcastID).filter(
+                NotificationBroadcastRead.residentID == resident_id,
+                NotificationBroadcastRead.broadcastID == broadcast_id
+            ).first()
+            if not exists:
+                db.add(NotificationBroadcastRead(
+                    residentID=resident_id, broadcastID=broadcast_id, readDate=datetime.now()
+                ))
+                NotificationCounterService.add_broadcast_read(db, resident_id)
+                db.commit()
+            return
+
+        noti = db.query(Notification).filter(Notification.notificationID == notification_id).first()
+        if not noti:
+            # Thông báo đã được lưu trữ thì vốn đã đọc
+            archived_owner = db.query(NotificationArchive.residentID)\
+                .filter(NotificationArchive.notificationID == notification_id).scalar()
+            if archived_owner == resident_id:
+                return
+            raise HTTPException(404, "Không tìm thấy thông báo")
+        
+        if noti.residentID != resident_id:
+            raise HTTPException(403, "Bạn không có quyền thao tác trên thông báo này")
+        
+        if not noti.isRead:
+            noti.isRead = True
+            NotificationCounterService.add_unread(db, {resident_id: -1})
+        db.commit()
+
+    @staticmethod
+    def mark_read_many(db: Session, resident_id: int, ids: list[int] | None = None,
+                       cursor: tuple | None = None) -> int:
+        """
+        Đánh dấu đã đọc hàng loạt, mỗi nguồn đúng 1 câu lệnh theo tập hợp (không nạp từng dòng):
+        - ids: các id được chọn (id âm là thông báo chung), id không thuộc cư dân bị bỏ qua;
+        - cursor: mọi thông báo từ mốc con trỏ trở về trước, tính cả mốc;
+        - không truyền gì: tất cả.
+        Bộ đếm chưa đọc được ghi kèm theo số dòng thực sự đổi. Trả về số chưa đọc mới.
+        """
+        personal = [Notification.residentID == resident_id, Notification.isRead == False]
+        broadcast = []
+        update_personal = insert_broadcast = True
+        if ids is not None:
+            personal_ids = [i for i in set(ids) if i > 0]
+            broadcast_ids = [-i for i in set(ids) if i < 0]
+            update_personal, insert_broadcast = bool(personal_ids), bool(broadcast_ids)
+            personal.append(Notification.notificationID.in_(personal_ids))
+            broadcast.append(NotificationBroadcast.broadcastID.in_(broadcast_ids))
+        elif cursor is not None:
+            personal.append(or_(
+                before_cursor(Notification.createdDate, Notification.notificationID, cursor),
+                Notification.notificationID == cursor[1]
+            ))
+            broadcast.append(NotificationService._broadcast_before(cursor, inclusive=True))
+
+        if update_personal:
+            result = db.execute(
+                update(Notification).where(*personal).values(isRead=True)
+                .execution_options(synchronize_session=False)
+            )
+            NotificationCounterService.add_unread(db, {resident_id: -result.rowcount})
+
+        if insert_broadcast:
+            not_read = ~select(NotificationBroadcastRead.broadcastID).where(
+                NotificationBroadcastRead.residentID == resident_id,
+                NotificationBroadcastRead.broadcastID == NotificationBroadcast.broadcastID
+            ).exists()
+            unread = select(
+                literal(resident_id), NotificationBroadcast.broadcastID, literal(datetime.now())
+            ).where(not_read, *broadcast)
+            result = db.execute(
+                insert(NotificationBroadcastRead)
+                .from_select(["residentID", "broadcastID", "readDate"], unread)
+                .prefix_with("IGNORE", dialect="mysql")
+            )
+            NotificationCounterService.add_broadcast_read(db, resident_id, result.rowcount)
+
         db.commit()
-        return len(residents)
\ No newline at end of file
+        return NotificationService.count_unread(db, resident_id)
@@ -0,0 +1,422 @@
+"""
+Lõi thanh toán dùng chung cho mọi kênh (SePay online, kế toán xác nhận offline, tiền mặt / thẻ sau này).
+
+- Kênh thanh toán là một adapter PaymentChannel: tên phương thức lưu vào paymentMethod
+  và các cột ghi kèm khi giao dịch thành công (vd mã giao dịch của cổng). Kênh mới chỉ cần
+  khai báo adapter rồi register_channel(), không sao chép luồng tạo / gạch nợ.
+- Mọi kênh dùng chung: regex mã BM<transID> biên dịch sẵn, cấu hình ngân hàng đọc một lần,
+  máy trạng thái giao dịch (TRANSITIONS, đổi bằng UPDATE có điều kiện) và gạch nợ theo lô
+  (BillSettlementService).
+"""
+import os
+import re
+import time
+from datetime import datetime
+from fastapi import HTTPException
+from sqlalchemy import exists, or_, update
+from sqlalchemy.orm import Session
+
+from backend.app.core.security import sign_link
+from backend.app.models.bill import Bill
+from backend.app.models.payment_transaction import PaymentTransaction
+from backend.app.models.transaction_detail import TransactionDetail
+
+from backend.app.services.bill_settlement_service import BillSettlementService
+from backend.app.services.notification_service import NotificationService
+from backend.app.services.payment_expiry_service import PaymentExpiryService, PAYMENT_TIMEOUT
+from backend.app.utils import vietqr
+
+# Mã giao dịch trong nội dung chuyển khoản: BM<transID>
+TRANS_CODE_PATTERN = re.compile(r"BM(\d+)", re.IGNORECASE)
+
+# Trạng thái đích -> các trạng thái được phép chuyển sang nó
+TRANSITIONS = {
+    # Mở lại giao dịch hết hạn của đúng bộ hóa đơn đó để dùng tiếp
+    "Pending": ("Pending", "Failed", "Expired"),
+    "Failed": ("Pending",),
+    "Expired": ("Pending", "Failed"),
+    "Success": ("Pending", "Failed"),
+}
+
+# Trạng thái giao dịch còn giữ hóa đơn (khi chưa quá hạn)
+LIVE_STATUSES = ("Pending", "Failed")
+# Số lần thử lại khi thua tranh chấp giữ chỗ hóa đơn
+RESERVE_ATTEMPTS = 3
+
+# Endpoint trả ảnh QR của giao dịch (api/payments.py)
+QR_IMAGE_PATH = "/api/payments/qr"
+
+_bank_config = None
+
+
+def get_bank_config() -> dict:
+    """Cấu hình tài khoản nhận tiền (đọc environment một lần)"""
+    global _bank_config
+    if _bank_config is None:
+        _bank_config = {
+            "bank_id": os.getenv("BANK_ID", "MB").strip(),
+            "bank_account": os.getenv("BANK_ACCOUNT", "").strip(),
+            "template": os.getenv("BANK_TEMPLATE", "compact2"),
+        }
+    return _bank_config
+
+
+class PaymentChannel:
+    """Adapter của một kênh thanh toán"""
+
+    name = ""
+    payment_method = ""
+
+    def success_values(self, reference) -> dict:
+        """Các cột ghi kèm khi giao dịch chuyển sang Success"""
+        return {}
+
+
+class SepayChannel(PaymentChannel):
+    """Chuyển khoản online, SePay báo về qua webhook / đối soát sao kê"""
+
+    name = "sepay"
+    payment_method = "Online Payment"
+
+    def success_values(self, reference) -> dict:
+        return {"gatewayTransCode": str(reference)} if reference is not None else {}
+
+
+class OfflineChannel(PaymentChannel):
+    """Kế toán xác nhận khoản chuyển khoản / nộp tiền"""
+
+    name = "offline"
+    payment_method = "Offline Payment"
+
+
+CHANNELS: dict = {}
+
+
+def register_channel(channel: PaymentChannel) -> PaymentChannel:
+    CHANNELS[channel.name] = channel
+    return channel
+
+
+SEPAY = register_channel(SepayChannel())
+OFFLINE = register_channel(OfflineChannel())
+
+
+class PaymentCore:
+
+    @staticmethod
+    def parse_trans_code(content: str | None) -> int | None:
+        """transID trong nội dung chuyển khoản, None nếu không có mã"""
+        match = TRANS_CODE_PATTERN.search(content or "")
+        return int(match.group(1)) if match else None
+
+    @staticmethod
+    def qr_resource(trans_id: int) -> str:
+        """Tên tài nguyên được ký trong link ảnh QR"""
+        return f"qr:{trans_id}"
+
+    @staticmethod
+    def qr_url(trans_id: int, amount, trans_code: str) -> str:
+        """
+        Ảnh QR do backend tự sinh (QrImageService), link có chữ ký dùng trong thời gian chờ
+        thanh toán (thẻ <img> không gửi được token); BANK_ID không tra được BIN thì dùng ảnh
+        của img.vietqr.io như trước.
+        """
+        config = get_bank_config()
+        if vietqr.bank_bin(config["bank_id"]) and config["bank_account"]:
+            expires = int(time.time() + PAYMENT_TIMEOUT.total_seconds())
+            signature = sign_link(PaymentCore.qr_resource(trans_id), expires)
+            return f"{QR_IMAGE_PATH}/{trans_id}?format=png&expires={expires}&signature={signature}"
+        return (
+            f"https://img.vietqr.io/image/{config['bank_id']}-{config['bank_account']}-{config['template']}.png"
+            f"?amount={int(amount)}"
+            f"&addInfo={trans_code}"
+        )
+
+    @staticmethod
+    def transition(db: Session, trans_id: int, to_status: str, *conditions, **values) -> bool:
+        """
+        Đổi trạng thái giao dịch theo TRANSITIONS (kèm điều kiện thêm nếu có) bằng 1 câu UPDATE
+        có điều kiện; False nếu trạng thái hiện tại không được phép (đã bị luồng khác / job hết
+        hạn đổi trước).
+        """
+        changes = {PaymentTransaction.status: to_status}
+        changes.update({getattr(PaymentTransaction, key): value for key, value in values.items()})
+        return db.query(PaymentTransaction).filter(
+            PaymentTransaction.transID == trans_id,
+            PaymentTransaction.status.in_(TRANSITIONS[to_status]),
+            *conditions
+        ).update(changes, synchronize_session=False) == 1
+
+    @staticmethod
+    def is_live(status: str | None, created_date: datetime | None, now: datetime) -> bool:
+        """Giao dịch còn giữ hóa đơn: chưa kết thúc và chưa quá hạn thanh toán"""
+        return status in LIVE_STATUSES and created_date is not None and now - created_date <= PAYMENT_TIMEOUT
+
+    @staticmethod
+    def _result(trans_id: int, amount, trans_code: str) -> dict:
+        return {
+            "transaction_id": trans_id,
+            "trans_code": trans_code,
+            "total_amount": amount,
+            "qr_url": PaymentCore.qr_url(trans_id, amount, trans_code)
+        }
+
+    @staticmethod
+    def _reserve_bills(db: Session, trans_id: int, bill_ids: list[int], holder: int | None = None) -> bool:
+        """
+        Giữ chỗ hóa đơn cho trans_id bằng 1 câu UPDATE có điều kiện: hóa đơn chưa trả và đang
+        trống / do holder giữ / do giao dịch đã hết hiệu lực giữ. Chỉ một yêu cầu đồng thời
+        giữ được đủ mọi hóa đơn; False nếu thiếu (đã bị yêu cầu khác giữ trước).
+        """
+        threshold = datetime.now() - PAYMENT_TIMEOUT
+        holder_live = exists().where(
+            PaymentTransaction.transID == Bill.reservedTransID,
+            PaymentTransaction.status.in_(LIVE_STATUSES),
+            PaymentTransaction.createdDate > threshold
+        )
+        free = or_(Bill.reservedTransID.is_(None), ~holder_live)
+        if holder is not None:
+            free = or_(Bill.reservedTransID == holder, free)
+
+        reserved = db.execute(
+            update(Bill)
+            .where(
+                Bill.billID.in_(bill_ids),
+                or_(Bill.status.is_(None), Bill.status != "Paid"),
+                free
+            )
+            .values(reservedTransID=trans_id)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        return reserved == len(bill_ids)
+
+    @staticmethod
+    def release_bills(db: Session, bill_ids: list[int]) -> list[int]:
+        """
+        Hủy các giao dịch chưa kết thúc đang giữ các hóa đơn này (chuyển Expired) và nhả chỗ
+        giữ mọi hóa đơn của các giao dịch đó (không commit). Dùng khi số tiền hóa đơn đổi
+        hoặc hóa đơn bị xóa: QR cũ không còn đúng nên không được giữ hóa đơn tới khi hết hạn.
+        Trả về transID đã hủy.
+        """
+        if not bill_ids:
+            return []
+        holder_ids = [trans_id for trans_id, in db.query(Bill.reservedTransID).filter(
+            Bill.billID.in_(bill_ids),
+            Bill.reservedTransID.isnot(None)
+        ).distinct()]
+        if not holder_ids:
+            return []
+
+        cancelled = [trans_id for trans_id, in db.query(PaymentTransaction.transID).filter(
+            PaymentTransaction.transID.in_(holder_ids),
+            PaymentTransaction.status.in_(TRANSITIONS["Expired"])
+        ).with_for_update()]
+        if cancelled:
+            db.query(PaymentTransaction).filter(
+                PaymentTransaction.transID.in_(cancelled),
+                PaymentTransaction.status.in_(TRANSITIONS["Expired"])
+            ).update({PaymentTransaction.status: "Expired"}, synchronize_session=False)
+        db.execute(
+            update(Bill)
+            .where(Bill.reservedTransID.in_(holder_ids))
+            .values(reservedTransID=None)
+            .execution_options(synchronize_session=False)
+        )
+        return cancelled
+
+    @staticmethod
+    def _try_create(db: Session, channel: PaymentChannel, user_id: int, bill_ids: list[int]) -> dict | None:
+        """Một lượt tạo / dùng lại giao dịch; None nếu thua tranh chấp giữ chỗ (gọi lại để thử tiếp)"""
+        bills = db.query(Bill.billID, Bill.amount, Bill.status, Bill.reservedTransID)\
+            .filter(Bill.billID.in_(bill_ids)).all()
+
+        if not bills:
+            raise HTTPException(status_code=404, detail="Không tìm thấy hóa đơn nào hợp lệ.")
+
+        total_amount = 0
+        for bill in bills:
+            if bill.status == 'Paid':
+                raise HTTPException(status_code=400, detail=f"Hóa đơn {bill.billID} đã được thanh toán trước đó.")
+            total_amount += bill.amount
+        bill_ids = [bill.billID for bill in bills]
+
+        # Giao dịch đang giữ các hóa đơn này
+        now = datetime.now()
+        holder_ids = {bill.reservedTransID for bill in bills if bill.reservedTransID is not None}
+        holders = {
+            row.transID: row for row in db.query(
+                PaymentTransaction.transID, PaymentTransaction.status, PaymentTransaction.createdDate,
+                PaymentTransaction.amount, PaymentTransaction.paymentContent
+            ).filter(PaymentTransaction.transID.in_(holder_ids))
+        } if holder_ids else {}
+
+        holder = None
+        if len(holder_ids) == 1 and all(bill.reservedTransID is not None for bill in bills):
+            holder = holders.get(next(iter(holder_ids)))
+            if holder is not None and {
+                bill_id for bill_id, in db.query(TransactionDetail.billID)
+                .filter(TransactionDetail.transID == holder.transID)
+            } != set(bill_ids):
+                holder = None
+
+        live = [trans_id for trans_id, row in holders.items()
+                if PaymentCore.is_live(row.status, row.createdDate, now)]
+        if live:
+            # Cùng bộ hóa đơn đang chờ thanh toán -> trả lại giao dịch đó
+            if holder is not None and live == [holder.transID]:
+                db.rollback()
+                return PaymentCore._result(holder.transID, holder.amount, holder.paymentContent)
+            busy = ", ".join(str(bill.billID) for bill in bills if bill.reservedTransID in live)
+            raise HTTPException(status_code=409, detail=f"Hóa đơn {busy} đang chờ thanh toán ở giao dịch khác.")
+
+        try:
+            # Cùng bộ hóa đơn, cùng số tiền, giao dịch cũ đã hết hạn -> mở lại giao dịch đó
+            if holder is not None and holder.status != "Success" and holder.amount == total_amount:
+                if not PaymentCore.transition(
+                    db, holder.transID, "Pending",
+                    or_(PaymentTransaction.status != "Pending", PaymentTransaction.createdDate <= now - PAYMENT_TIMEOUT),
+                    createdDate=now, payDate=None
+                ) or not PaymentCore._reserve_bills(db, holder.transID, bill_ids, holder=holder.transID):
+                    db.rollback()
+                    return None
+                db.commit()
+                PaymentExpiryService.schedule(holder.transID, now)
+                return PaymentCore._result(holder.transID, holder.amount, holder.paymentContent)
+
+            new_trans = PaymentTransaction(
+                residentID=user_id,
+                amount=total_amount,
+                paymentMethod=channel.payment_method,
+                status="Pending",
+                createdDate=now
+            )
+            db.add(new_trans)
+            db.flush()  # Sinh transID
+
+            trans_code = f"BM{new_trans.transID}"
+            new_trans.paymentContent = trans_code
+
+            if not PaymentCore._reserve_bills(db, new_trans.transID, bill_ids):
+                db.rollback()
+                return None
+
+            db.add_all([
+                TransactionDetail(transID=new_trans.transID, billID=bill.billID, amount=bill.amount)
+                for bill in bills
+            ])
+
+            db.commit()
+            PaymentExpiryService.schedule(new_trans.transID, now)
+            return PaymentCore._result(new_trans.transID, total_amount, trans_code)
+
+        except Exception as e:
+            db.rollback()
+            print(f"[ERROR create_transaction/{channel.name}]: {str(e)}")
+            raise HTTPException(status_code=500, detail="Lỗi hệ thống khi tạo giao dịch.")
+
+    # TẠO GIAO DỊCH & SINH QR
+    @staticmethod
+    def create_transaction(db: Session, channel: PaymentChannel, user_id: int, bill_ids: list[int]):
+        """
+        Input: Kênh thanh toán, danh sách Bill ID
+        Output: Thông tin giao dịch + Link QR Code
+        Hóa đơn được giữ chỗ cho giao dịch (BILL.reservedTransID) nên yêu cầu trùng / đồng thời
+        nhận lại cùng giao dịch đang chờ thay vì tạo thêm; giao dịch hết hạn của đúng bộ hóa
+        đơn đó được mở lại để dùng tiếp.
+        """
+        bill_ids = sorted(set(bill_ids))
+        for _ in range(RESERVE_ATTEMPTS):
+            result = PaymentCore._try_create(db, channel, user_id, bill_ids)
+            if result is not None:
+                return result
+        raise HTTPException(status_code=409, detail="Hóa đơn đang được tạo giao dịch, vui lòng thử lại.")
+
+    # GẠCH NỢ
+    @staticmethod
+    def settle(db: Session, channel: PaymentChannel, content: str, amount_in: float, reference=None):
+        """
+        Input: Nội dung chuyển khoản, số tiền nhận, mã tham chiếu của kênh (nếu có)
+        Output: Kết quả giao dịch
+        Dòng giao dịch bị khóa (SELECT ... FOR UPDATE) tới khi commit nên các lần báo trùng
+        đồng thời xử lý tuần tự; mọi lần đổi trạng thái đều theo TRANSITIONS.
+        Lỗi DB khi gạch nợ được rollback rồi ném tiếp (không trả về success=False).
+        """
+        print(f"PAYMENT RECEIVED [{channel.name}]: {content} | Amount: {amount_in}")
+
+        trans_id = PaymentCore.parse_trans_code(content)
+        if trans_id is None:
+            return {"success": False, "message": "Không tìm thấy mã đơn hàng trong nội dung"}
+
+        transaction = db.query(PaymentTransaction)\
+            .filter(PaymentTransaction.transID == trans_id)\
+            .with_for_update().first()
+
+        if not transaction:
+            db.rollback()
+            return {"success": False, "message": f"Không tìm thấy Transaction ID {trans_id}"}
+
+        # Kiểm tra Idempotency trước kiểm tra hạn: báo đến muộn không được
+        # đổi giao dịch đã thanh toán thành Expired
+        if transaction.status == 'Success':
+            db.rollback()
+            return {"success": True, "message": "Giao dịch này đã được thực hiện"}
+
+        if transaction.status == 'Expired' or datetime.now() - transaction.createdDate > PAYMENT_TIMEOUT:
+            PaymentCore.transition(db, trans_id, "Expired")
+            db.commit()
+
+            NotificationService.notify_payment_result(
+                db=db,
+                resident_id=transaction.residentID,
+                status="Expired",
+                amount=float(amount_in),
+                trans_id=transaction.transID,
+                content=""
+            )
+            return {"success": False, "message": "Giao dịch đã hết hạn thanh toán."}
+
+        if float(amount_in) < float(transaction.amount):
+            PaymentCore.transition(db, trans_id, "Failed")
+            db.commit()
+
+            NotificationService.notify_payment_result(
+                db=db,
+                content=", ".join(BillSettlementService.bill_types(db, transaction.transID)),
+                resident_id=transaction.residentID,
+                status="Failed",
+                amount=float(amount_in),
+                trans_id=transaction.transID
+            )
+            return {
+                "success": False,
+                "message": f"Thanh toán không đủ. Cần: {transaction.amount}, Nhận: {amount_in}"
+            }
+
+        try:
+            # Chỉ một luồng đổi được sang Success
+            if not PaymentCore.transition(
+                db, trans_id, "Success", payDate=datetime.now(), **channel.success_values(reference)
+            ):
+                db.rollback()
+                return {"success": True, "message": "Giao dịch này đã được thực hiện"}
+
+            bill_types = BillSettlementService.settle(db, transaction.transID)
+
+            db.commit()
+        except Exception as e:
+            # Lỗi DB (deadlock, hết thời gian chờ khóa...) là lỗi tạm thời: để bên gọi biết
+            # mà thử lại, không trả về như một lần thanh toán bị từ chối
+            db.rollback()
+            print(f"--> Lỗi giao dịch: {e}")
+            raise
+
+        print(f"--> Giao dịch thành công [{channel.name}]: TransID {trans_id}")
+        NotificationService.notify_payment_result(
+            db=db,
+            content=", ".join(bill_types) if bill_types else "Thanh toán hóa đơn",
+            resident_id=transaction.residentID,
+            status="Success",
+            amount=float(amount_in),
+            trans_id=transaction.transID
+        )
+        return {"success": True, "message": "Giao dịch thành công"}
@@ -0,0 +1,197 @@
+"""
+Hủy giao dịch thanh toán quá hạn theo sự kiện, thay cho việc quét bảng mỗi phút.
+
+- Hạn của các giao dịch Pending nằm trong một min-heap trong bộ nhớ: thêm ngay khi tạo
+  giao dịch (schedule) và dựng lại từ DB khi process giành được quyền leader.
+- Mỗi nhịp TICK_SECONDS, leader lấy các giao dịch tới hạn khỏi heap và hủy bằng 1 câu
+  UPDATE theo khóa chính (kèm điều kiện status = 'Pending' nên giao dịch đã xong không bị đụng).
+- Chỉ một process làm leader nhờ khóa MySQL GET_LOCK giữ trên một kết nối riêng (mất kết
+  nối thì khóa tự nhả, process khác giành lại ở nhịp sau). Giao dịch tạo (hoặc mở lại, giữ
+  transID cũ nhưng đổi createdDate) ở worker khác được leader nhặt bằng range
+  status = 'Pending' AND createdDate > nhịp trước - CATCH_UP_OVERLAP trên index
+  (status, createdDate), không quét bảng.
+- Các job định kỳ khác chỉ cần một process chạy cho cả cụm dùng chung khóa này qua is_leader().
+"""
+import heapq
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import text, update
+from sqlalchemy.orm import Session
+
+from backend.app.core.db import SessionLocal, get_engine
+from backend.app.models.payment_transaction import PaymentTransaction
+
+# Thời gian chờ thanh toán của một giao dịch
+PAYMENT_TIMEOUT = timedelta(minutes=15)
+# Chu kỳ kiểm tra heap (giây)
+TICK_SECONDS = 5
+# Đọc lùi thêm khoảng này mỗi nhịp để không sót giao dịch commit chậm / đồng hồ các worker lệch nhau
+CATCH_UP_OVERLAP = timedelta(minutes=1)
+# Số giao dịch mỗi câu UPDATE
+EXPIRE_CHUNK_SIZE = 1000
+LEADER_LOCK_NAME = "bluemoon.payment_expiry"
+
+
+class PaymentExpiryService:
+
+    _lock = threading.Lock()
+    # (hạn, transID)
+    _heap: list = []
+    # transID -> hạn mới nhất đang có trong heap (tránh thêm trùng khi đọc tiếp)
+    _scheduled: dict = {}
+    # Thời điểm bắt đầu lần đọc DB gần nhất
+    _watermark = None
+    _is_leader = False
+    _leader_conn = None
+    # tick() và các job gọi is_leader() chạy ở các thread khác nhau của scheduler nhưng dùng
+    # chung kết nối giữ khóa leader
+    _leader_lock = threading.Lock()
+
+    @staticmethod
+    def _push(trans_id: int, created_date: datetime) -> None:
+        """Thêm hạn của giao dịch; giao dịch được mở lại (createdDate mới) có thêm hạn mới"""
+        deadline = created_date + PAYMENT_TIMEOUT
+        if PaymentExpiryService._scheduled.get(trans_id) == deadline:
+            return
+        PaymentExpiryService._scheduled[trans_id] = deadline
+        heapq.heappush(PaymentExpiryService._heap, (deadline, trans_id))
+
+    @staticmethod
+    def schedule(trans_id: int, created_date: datetime) -> None:
+        """
+        Gọi sau khi tạo (hoặc mở lại) giao dịch Pending; process không phải leader thì để
+        leader tự nhặt. Hạn cũ còn trong heap không sao: tick() kiểm tra lại createdDate.
+        """
+        with PaymentExpiryService._lock:
+            if PaymentExpiryService._is_leader:
+                PaymentExpiryService._push(trans_id, created_date)
+
+    @staticmethod
+    def _reset() -> None:
+        PaymentExpiryService._heap = []
+        PaymentExpiryService._scheduled = {}
+        PaymentExpiryService._watermark = None
+
+    @staticmethod
+    def _load_pending(db: Session) -> None:
+        """Dựng lại heap từ các giao dịch Pending (dùng index status)"""
+        watermark = datetime.now()
+        rows = db.query(PaymentTransaction.transID, PaymentTransaction.createdDate)\
+            .filter(PaymentTransaction.status == "Pending").all()
+        with PaymentExpiryService._lock:
+            PaymentExpiryService._reset()
+            for trans_id, created_date in rows:
+                PaymentExpiryService._push(trans_id, created_date or datetime.now())
+            PaymentExpiryService._watermark = watermark
+
+    @staticmethod
+    def _catch_up(db: Session) -> None:
+        """Nhặt giao dịch Pending mới tạo / mới mở lại (kể cả ở worker khác) theo createdDate"""
+        watermark = datetime.now()
+        since = (PaymentExpiryService._watermark or watermark) - CATCH_UP_OVERLAP
+        rows = db.query(PaymentTransaction.transID, PaymentTransaction.createdDate).filter(
+            PaymentTransaction.status == "Pending",
+            PaymentTransaction.createdDate > since
+        ).all()
+        with PaymentExpiryService._lock:
+            for trans_id, created_date in rows:
+                PaymentExpiryService._push(trans_id, created_date)
+            PaymentExpiryService._watermark = watermark
+
+    @staticmethod
+    def _release_leadership() -> None:
+        with PaymentExpiryService._lock:
+            PaymentExpiryService._is_leader = False
+            PaymentExpiryService._reset()
+        if PaymentExpiryService._leader_conn is not None:
+            try:
+                PaymentExpiryService._leader_conn.close()
+            except Exception:
+                pass
+            PaymentExpiryService._leader_conn = None
+
+    @staticmethod
+    def _ensure_leader(db: Session) -> bool:
+        """Giữ / giành khóa leader; vừa giành được thì dựng lại heap"""
+        engine = get_engine()
+        if engine.dialect.name != "mysql":
+            # Không có GET_LOCK: chạy một process
+            if not PaymentExpiryService._is_leader:
+                PaymentExpiryService._load_pending(db)
+                PaymentExpiryService._is_leader = True
+            return True
+
+        conn = PaymentExpiryService._leader_conn
+        if conn is not None:
+            try:
+                held = conn.execute(
+                    text("SELECT IS_USED_LOCK(:name) = CONNECTION_ID()"), {"name": LEADER_LOCK_NAME}
+                ).scalar()
+                conn.commit()
+            except Exception:
+                held = False
+            if held:
+                return True
+            PaymentExpiryService._release_leadership()
+
+        conn = engine.connect()
+        acquired = conn.execute(text("SELECT GET_LOCK(:name, 0)"), {"name": LEADER_LOCK_NAME}).scalar()
+        conn.commit()
+        if acquired != 1:
+            conn.close()
+            return False
+        PaymentExpiryService._leader_conn = conn
+        PaymentExpiryService._load_pending(db)
+        with PaymentExpiryService._lock:
+            PaymentExpiryService._is_leader = True
+        return True
+
+    @staticmethod
+    def is_leader() -> bool:
+        """
+        Process này đang giữ (hoặc vừa giành được) khóa leader. Job định kỳ chỉ cần một process
+        chạy cho cả cụm gọi hàm này trước khi chạy để các worker uvicorn không chạy trùng.
+        """
+        db = SessionLocal()
+        try:
+            with PaymentExpiryService._leader_lock:
+                return PaymentExpiryService._ensure_leader(db)
+        finally:
+            db.close()
+
+    @staticmethod
+    def tick() -> int:
+        """Một nhịp: hủy các giao dịch đã tới hạn; trả về số giao dịch bị hủy"""
+        db = SessionLocal()
+        try:
+            with PaymentExpiryService._leader_lock:
+                if not PaymentExpiryService._ensure_leader(db):
+                    return 0
+            PaymentExpiryService._catch_up(db)
+
+            now = datetime.now()
+            due = []
+            with PaymentExpiryService._lock:
+                heap = PaymentExpiryService._heap
+                while heap and heap[0][0] <= now:
+                    deadline, trans_id = heapq.heappop(heap)
+                    if PaymentExpiryService._scheduled.get(trans_id) == deadline:
+                        del PaymentExpiryService._scheduled[trans_id]
+                    due.append(trans_id)
+
+            count = 0
+            for start in range(0, len(due), EXPIRE_CHUNK_SIZE):
+                count += db.execute(
+                    update(PaymentTransaction)
+                    .where(
+                        PaymentTransaction.transID.in_(due[start:start + EXPIRE_CHUNK_SIZE]),
+                        PaymentTransaction.status == "Pending",
+                        PaymentTransaction.createdDate <= now - PAYMENT_TIMEOUT
+                    )
+                    .values(status="Expired")
+                    .execution_options(synchronize_session=False)
+                ).rowcount
+            db.commit()
+            return count
+        finally:
+            db.close()
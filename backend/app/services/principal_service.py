@@ -0,0 +1,118 @@
+"""
+Ngữ cảnh người dùng (residentID, apartmentID, buildingID, role) cho các request đã xác thực.
+
+- Token đăng nhập mang claim residentID nên endpoint chỉ cần residentID không phải đọc DB.
+- apartmentID / buildingID lấy bằng 1 câu JOIN rồi cache trong process theo username
+  (CACHE_TTL, tối đa CACHE_SIZE người dùng); trong một request dependency của FastAPI
+  chỉ tính một lần.
+- Sửa / xóa cư dân gọi invalidate(db, username): ghi ACCOUNT.principalChangedAt, xóa cache
+  và bỏ qua claim của các token cấp trước thời điểm đó. Process khác nạp các mốc này bằng
+  sync() định kỳ (như danh sách thu hồi token), cache của họ hết hạn sau CACHE_TTL.
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy.orm import Session
+
+from backend.app.core.security import ACCESS_TOKEN_EXPIRE_HOURS
+from backend.app.models.account import Account
+from backend.app.models.apartment import Apartment
+from backend.app.models.resident import Resident
+from backend.app.schemas.auth import PrincipalContext, TokenData
+
+# Thời gian sống của cache (giây)
+CACHE_TTL = 30
+# Số người dùng tối đa trong cache
+CACHE_SIZE = 10000
+
+
+class PrincipalService:
+
+    _lock = threading.Lock()
+    # username -> (hết hạn, residentID, apartmentID, buildingID)
+    _contexts: dict = {}
+    # username -> thời điểm (epoch giây) thông tin cư dân thay đổi gần nhất (trong thời hạn token)
+    _changed: dict = {}
+
+    @staticmethod
+    def lookup_resident_id(db: Session, username: str) -> int | None:
+        """residentID của tài khoản, dùng khi cấp token"""
+        return db.query(Resident.residentID).filter(Resident.username == username).scalar()
+
+    @staticmethod
+    def _claims_valid(user: TokenData) -> bool:
+        changed = PrincipalService._changed.get(user.username)
+        return changed is None or (user.iat is not None and user.iat > changed)
+
+    @staticmethod
+    def _load(db: Session, username: str) -> tuple:
+        now = time.monotonic()
+        cached = PrincipalService._contexts.get(username)
+        if cached and cached[0] > now:
+            return cached[1:]
+
+        row = db.query(Resident.residentID, Resident.apartmentID, Apartment.buildingID)\
+            .outerjoin(Apartment, Apartment.apartmentID == Resident.apartmentID)\
+            .filter(Resident.username == username).first()
+        values = tuple(row) if row else (None, None, None)
+        with PrincipalService._lock:
+            contexts = PrincipalService._contexts
+            if len(contexts) >= CACHE_SIZE and username not in contexts:
+                # Bỏ mục cũ nhất (dict giữ thứ tự thêm vào)
+                contexts.pop(next(iter(contexts)))
+            contexts[username] = (now + CACHE_TTL, *values)
+        return values
+
+    @staticmethod
+    def get(db: Session, user: TokenData) -> PrincipalContext:
+        resident_id, apartment_id, building_id = PrincipalService._load(db, user.username)
+        return PrincipalContext(
+            username=user.username,
+            role=user.role,
+            residentID=resident_id,
+            apartmentID=apartment_id,
+            buildingID=building_id
+        )
+
+    @staticmethod
+    def resident_id(db: Session | None, user: TokenData) -> int | None:
+        """residentID từ claim của token; token cũ / đã bị invalidate thì tra cache / DB"""
+        if user.residentID is not None and PrincipalService._claims_valid(user):
+            return user.residentID
+        if db is None:
+            return None
+        return PrincipalService._load(db, user.username)[0]
+
+    @staticmethod
+    def invalidate(db: Session, *usernames: str | None) -> None:
+        """Gọi sau khi commit thay đổi cư dân của các tài khoản này"""
+        usernames = [username for username in usernames if username]
+        if not usernames:
+            return
+        changed = datetime.now()
+        db.query(Account).filter(Account.username.in_(usernames))\
+            .update({Account.principalChangedAt: changed}, synchronize_session=False)
+        db.commit()
+        with PrincipalService._lock:
+            for username in usernames:
+                PrincipalService._contexts.pop(username, None)
+                PrincipalService._changed[username] = changed.timestamp()
+
+    @staticmethod
+    def sync(db: Session) -> int:
+        """
+        Nạp các mốc thay đổi còn trong thời hạn token (do process khác ghi); xóa cache của
+        tài khoản có mốc mới. Trả về số tài khoản.
+        """
+        since = datetime.now() - timedelta(hours=ACCESS_TOKEN_EXPIRE_HOURS)
+        rows = db.query(Account.username, Account.principalChangedAt)\
+            .filter(Account.principalChangedAt >= since).all()
+        with PrincipalService._lock:
+            previous = PrincipalService._changed
+            changed = {}
+            for username, changed_at in rows:
+                changed[username] = max(changed_at.timestamp(), previous.get(username, 0))
+                if changed[username] != previous.get(username):
+                    PrincipalService._contexts.pop(username, None)
+            PrincipalService._changed = changed
+        return len(changed)
@@ -0,0 +1,158 @@
+"""
+Hub pub/sub đẩy thông báo realtime tới cư dân (SSE).
+
+- Mỗi kết nối là một Subscription với hàng đợi asyncio giới hạn QUEUE_SIZE; kết
+  nối đọc chậm bị đầy hàng đợi thì bỏ các sự kiện cũ và nhận một sự kiện "resync"
+  để tự tải lại danh sách (không để bộ nhớ phình theo client chậm).
+- Sự kiện chỉ được phát sau khi transaction tạo thông báo commit thành công
+  (queue() gắn vào session, listener after_commit mới publish).
+- Backend mặc định phát trong process. Chạy nhiều worker thì đặt PUSH_BACKEND_URL
+  (redis://...) để phát qua Redis pub/sub, hoặc gọi PushHub.set_backend() với
+  backend riêng có publish(message) và gọi PushHub.deliver_local(message) khi nhận.
+"""
+import asyncio
+import json
+import os
+import threading
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# Số sự kiện tối đa đang chờ trên mỗi kết nối
+QUEUE_SIZE = 100
+# Chu kỳ gửi heartbeat để giữ kết nối / phát hiện client đã rời (giây)
+HEARTBEAT_SECONDS = 15
+
+RESYNC_EVENT = {"type": "resync"}
+
+
+class Subscription:
+    __slots__ = ("resident_id", "queue", "loop")
+
+    def __init__(self, resident_id: int, loop: asyncio.AbstractEventLoop):
+        self.resident_id = resident_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.loop = loop
+
+
+class LocalBackend:
+    """Phát ngay trong process (một worker)"""
+
+    def publish(self, message: dict) -> None:
+        PushHub.deliver_local(message)
+
+
+class RedisBackend:
+    """Phát qua Redis pub/sub để mọi worker cùng nhận (cần cài gói redis)"""
+
+    CHANNEL = "bluemoon:notifications"
+
+    def __init__(self, url: str):
+        import redis
+
+        self._client = redis.Redis.from_url(url)
+        self._pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.subscribe(**{self.CHANNEL: self._on_message})
+        self._thread = self._pubsub.run_in_thread(sleep_time=1, daemon=True)
+
+    def _on_message(self, raw) -> None:
+        PushHub.deliver_local(json.loads(raw["data"]))
+
+    def publish(self, message: dict) -> None:
+        self._client.publish(self.CHANNEL, json.dumps(message, default=str))
+
+
+class PushHub:
+
+    _lock = threading.Lock()
+    # residentID -> tập Subscription đang mở
+    _subscribers: dict = {}
+    _backend = None
+
+    @staticmethod
+    def _get_backend():
+        with PushHub._lock:
+            if PushHub._backend is None:
+                url = os.getenv("PUSH_BACKEND_URL")
+                PushHub._backend = RedisBackend(url) if url else LocalBackend()
+            return PushHub._backend
+
+    @staticmethod
+    def set_backend(backend) -> None:
+        with PushHub._lock:
+            PushHub._backend = backend
+
+    @staticmethod
+    def subscribe(resident_id: int) -> Subscription:
+        """Mở kết nối mới (gọi trong event loop của request)"""
+        subscription = Subscription(resident_id, asyncio.get_running_loop())
+        with PushHub._lock:
+            PushHub._subscribers.setdefault(resident_id, set()).add(subscription)
+        return subscription
+
+    @staticmethod
+    def unsubscribe(subscription: Subscription) -> None:
+        with PushHub._lock:
+            subscriptions = PushHub._subscribers.get(subscription.resident_id)
+            if subscriptions:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del PushHub._subscribers[subscription.resident_id]
+
+    @staticmethod
+    def connection_count() -> int:
+        with PushHub._lock:
+            return sum(len(subscriptions) for subscriptions in PushHub._subscribers.values())
+
+    @staticmethod
+    def _offer(subscription: Subscription, payload: dict) -> None:
+        """Chạy trong event loop của kết nối; hàng đợi đầy thì thay toàn bộ bằng 1 resync"""
+        queue = subscription.queue
+        if queue.full():
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(RESYNC_EVENT)
+            return
+        queue.put_nowait(payload)
+
+    @staticmethod
+    def deliver_local(message: dict) -> None:
+        """
+        Chuyển message {"residents": [id...] | None (mọi cư dân), "event": {...}}
+        tới các kết nối trong process này. An toàn khi gọi từ thread bất kỳ.
+        """
+        residents = message.get("residents")
+        with PushHub._lock:
+            if residents is None:
+                targets = [s for subscriptions in PushHub._subscribers.values() for s in subscriptions]
+            else:
+                targets = [s for r in residents for s in PushHub._subscribers.get(r, ())]
+        payload = message["event"]
+        for subscription in targets:
+            try:
+                subscription.loop.call_soon_threadsafe(PushHub._offer, subscription, payload)
+            except RuntimeError:
+                # Event loop của kết nối đã đóng
+                PushHub.unsubscribe(subscription)
+
+    @staticmethod
+    def publish(residents: list[int] | None, payload: dict) -> None:
+        try:
+            PushHub._get_backend().publish({"residents": residents, "event": payload})
+        except Exception as e:
+            print(f"[PUSH ERROR] {e}")
+
+    @staticmethod
+    def queue(db: Session, residents: list[int] | None, payload: dict) -> None:
+        """Hẹn phát sự kiện khi transaction hiện tại của db commit (rollback thì bỏ)"""
+        db.info.setdefault("push_events", []).append((residents, payload))
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_after_commit(session: Session) -> None:
+    for residents, payload in session.info.pop("push_events", ()):
+        PushHub.publish(residents, payload)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session: Session) -> None:
+    session.info.pop("push_events", None)
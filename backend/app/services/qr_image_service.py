@@ -0,0 +1,128 @@
+"""
+Ảnh QR thanh toán sinh tại chỗ (không phụ thuộc img.vietqr.io), cache theo nội dung.
+
+- Khóa cache = sha256(chuỗi VietQR, định dạng, scale): cùng nội dung luôn ra cùng ảnh nên
+  khóa cũng là ETag mạnh; trình duyệt gửi lại If-None-Match thì trả 304, không cần vẽ.
+- Tầng 1: LRU trong bộ nhớ (MEMORY_CACHE_SIZE ảnh). Tầng 2: thư mục QR_CACHE_DIR trên đĩa,
+  file <khóa>.<đuôi>, tối đa QR_DISK_CACHE_SIZE file; đọc trúng thì cập nhật mtime để dọn
+  file lâu không dùng nhất trước.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from fastapi import HTTPException, status
+from sqlalchemy.orm import Session
+
+from backend.app.models.payment_transaction import PaymentTransaction
+from backend.app.services.payment_core import LIVE_STATUSES, get_bank_config
+from backend.app.utils import vietqr
+
+MEDIA_TYPES = {"png": "image/png", "svg": "image/svg+xml"}
+DEFAULT_SCALE = 8
+# Số ảnh giữ trong bộ nhớ
+MEMORY_CACHE_SIZE = 256
+
+
+class QrImageService:
+
+    _lock = threading.Lock()
+    # khóa -> bytes ảnh, thứ tự theo lần dùng gần nhất
+    _memory: OrderedDict = OrderedDict()
+
+    @staticmethod
+    def cache_dir() -> str:
+        return os.getenv("QR_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "bluemoon-qr")
+
+    @staticmethod
+    def payload(amount, trans_code: str) -> str | None:
+        """Chuỗi VietQR của giao dịch; None nếu không xác định được BIN của BANK_ID"""
+        config = get_bank_config()
+        bin_code = vietqr.bank_bin(config["bank_id"])
+        if not bin_code or not config["bank_account"]:
+            return None
+        return vietqr.build_payload(bin_code, config["bank_account"], int(amount), trans_code)
+
+    @staticmethod
+    def transaction_payload(db: Session, trans_id: int) -> str:
+        """Chuỗi VietQR của giao dịch đang chờ thanh toán (404 nếu không có / đã kết thúc)"""
+        transaction = db.query(
+            PaymentTransaction.amount, PaymentTransaction.paymentContent, PaymentTransaction.status
+        ).filter(PaymentTransaction.transID == trans_id).first()
+        if not transaction or transaction.status not in LIVE_STATUSES:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Không có giao dịch chờ thanh toán")
+
+        payload = QrImageService.payload(transaction.amount, transaction.paymentContent or f"BM{trans_id}")
+        if payload is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Chưa cấu hình tài khoản nhận tiền")
+        return payload
+
+    @staticmethod
+    def cache_key(payload: str, image_format: str, scale: int = DEFAULT_SCALE) -> str:
+        return hashlib.sha256(f"{image_format}:{scale}:{payload}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _remember(key: str, image: bytes) -> None:
+        with QrImageService._lock:
+            QrImageService._memory[key] = image
+            QrImageService._memory.move_to_end(key)
+            while len(QrImageService._memory) > MEMORY_CACHE_SIZE:
+                QrImageService._memory.popitem(last=False)
+
+    @staticmethod
+    def _read_disk(path: str) -> bytes | None:
+        try:
+            with open(path, "rb") as f:
+                image = f.read()
+            os.utime(path)
+            return image
+        except OSError:
+            return None
+
+    @staticmethod
+    def _write_disk(directory: str, path: str, image: bytes) -> None:
+        try:
+            os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(image)
+            os.replace(tmp_path, path)
+            QrImageService._evict_disk(directory)
+        except OSError as e:
+            print(f"[QR CACHE ERROR] {e}")
+
+    @staticmethod
+    def _evict_disk(directory: str) -> None:
+        limit = int(os.getenv("QR_DISK_CACHE_SIZE", "5000"))
+        entries = [entry for entry in os.scandir(directory) if entry.is_file() and not entry.name.endswith(".tmp")]
+        if len(entries) <= limit:
+            return
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        # Dọn xuống 90% để không phải quét thư mục ở mọi lần ghi
+        for entry in entries[:len(entries) - limit * 9 // 10]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+    @staticmethod
+    def image(payload: str, image_format: str, scale: int = DEFAULT_SCALE) -> tuple[str, bytes]:
+        """(ETag, bytes ảnh): bộ nhớ -> đĩa -> vẽ mới"""
+        key = QrImageService.cache_key(payload, image_format, scale)
+        with QrImageService._lock:
+            image = QrImageService._memory.get(key)
+            if image is not None:
+                QrImageService._memory.move_to_end(key)
+                return key, image
+
+        directory = QrImageService.cache_dir()
+        path = os.path.join(directory, f"{key}.{image_format}")
+        image = QrImageService._read_disk(path)
+        if image is None:
+            render = vietqr.render_png if image_format == "png" else vietqr.render_svg
+            image = render(payload, scale)
+            QrImageService._write_disk(directory, path, image)
+
+        QrImageService._remember(key, image)
+        return key, image
@@ -0,0 +1,237 @@
+"""
+Đối soát sao kê SePay với PAYMENT_TRANSACTION để bù các webhook bị thất lạc.
+
+- Đọc tiếp sao kê từ lastID của lượt thành công gần nhất (since-cursor), theo trang, qua
+  session HTTP dùng chung có timeout / thử lại (sepay_utils.iterTransactions). Sao kê được
+  xử lý trong một lượt duyệt: mỗi dòng tiền vào chỉ được gom theo mã BM<transID>.
+- Giao dịch và webhook đã nhận được tra theo lô EXISTENCE_CHUNK_SIZE id (index trong bộ nhớ),
+  không tra từng dòng.
+- Dòng khớp giao dịch nhưng chưa có trong inbox webhook được ghi vào inbox bằng một INSERT
+  nhiều dòng; worker inbox gạch nợ như webhook thường (chống trùng theo id SePay). Webhook
+  đã có nhưng đang FAILED (lỗi DB khi gạch nợ) được đưa lại hàng đợi ngay.
+- Chênh lệch (không có mã, không tìm thấy giao dịch, thiếu / thừa tiền, trả nhiều lần, trả sau
+  khi hết hạn) được ghi vào báo cáo của lượt đối soát.
+"""
+import json
+from datetime import datetime
+from decimal import Decimal
+from fastapi import HTTPException, status
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from backend.app.models.payment_transaction import PaymentTransaction
+from backend.app.models.sepay_reconciliation import SepayReconciliation
+from backend.app.models.sepay_webhook_event import SepayWebhookEvent
+from backend.app.services.payment_core import PaymentCore
+from backend.app.services.sepay_webhook_service import SepayWebhookService
+from backend.app.utils import sepay_utils
+
+# Số id mỗi câu tra IN (...)
+EXISTENCE_CHUNK_SIZE = 1000
+# Số chênh lệch tối đa lưu trong báo cáo
+MAX_REPORTED = 1000
+LOCK_NAME = "bluemoon.sepay_reconciliation"
+
+
+class SepayReconciliationService:
+
+    @staticmethod
+    def to_dict(run: SepayReconciliation) -> dict:
+        return {
+            "run_id": run.runID,
+            "since_id": run.sinceID,
+            "last_id": run.lastID,
+            "status": run.status,
+            "fetched_lines": run.fetchedLines,
+            "matched_lines": run.matchedLines,
+            "enqueued_lines": run.enqueuedLines,
+            "discrepancies": run.discrepancies,
+            "report": json.loads(run.report) if run.report else [],
+            "error": run.error,
+            "started_date": run.startedDate,
+            "finished_date": run.finishedDate,
+        }
+
+    @staticmethod
+    def get(db: Session, run_id: int) -> dict:
+        run = db.get(SepayReconciliation, run_id)
+        if not run:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Không tìm thấy lượt đối soát")
+        return SepayReconciliationService.to_dict(run)
+
+    @staticmethod
+    def next_since_id(db: Session) -> int | None:
+        last_id = db.query(SepayReconciliation.lastID).filter(
+            SepayReconciliation.status == "SUCCEEDED",
+            SepayReconciliation.lastID.isnot(None)
+        ).order_by(SepayReconciliation.runID.desc()).limit(1).scalar()
+        return last_id + 1 if last_id is not None else None
+
+    @staticmethod
+    def _to_payload(line: dict) -> dict:
+        """Dòng sao kê -> payload cùng dạng webhook SePay"""
+        return {
+            "id": int(line["id"]),
+            "gateway": line.get("bank_brand_name") or "",
+            "transactionDate": line.get("transaction_date") or "",
+            "accountNumber": line.get("account_number") or "",
+            "code": line.get("code"),
+            "content": line.get("transaction_content") or "",
+            "transferType": "in",
+            "transferAmount": float(line.get("amount_in") or 0),
+            "accumulated": float(line.get("accumulated") or 0),
+            "subAccount": line.get("sub_account"),
+            "referenceCode": line.get("reference_number") or "",
+            "description": "Đối soát sao kê",
+        }
+
+    @staticmethod
+    def _chunks(values: list):
+        for start in range(0, len(values), EXISTENCE_CHUNK_SIZE):
+            yield values[start:start + EXISTENCE_CHUNK_SIZE]
+
+    @staticmethod
+    def _acquire_lock(db: Session):
+        """
+        Khóa MySQL để chỉ một lượt đối soát chạy tại một thời điểm, giữ trên kết nối riêng
+        vì session trả kết nối về pool sau mỗi commit. Trả về kết nối giữ khóa, None nếu
+        lượt khác đang chạy.
+        """
+        engine = db.get_bind()
+        conn = engine.connect()
+        if engine.dialect.name == "mysql" and \
+                conn.execute(text("SELECT GET_LOCK(:name, 0)"), {"name": LOCK_NAME}).scalar() != 1:
+            conn.close()
+            return None
+        return conn
+
+    @staticmethod
+    def run(db: Session, since_id: int | None = None, lines=None) -> dict:
+        """
+        Chạy một lượt đối soát. since_id bỏ trống: đọc tiếp sau lượt thành công gần nhất.
+        lines: sao kê đã có sẵn (iterable các dòng dạng API SePay); bỏ trống thì tải từ SePay.
+        """
+        lock = SepayReconciliationService._acquire_lock(db)
+        if lock is None:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Đang có lượt đối soát khác chạy")
+        try:
+            if since_id is None:
+                since_id = SepayReconciliationService.next_since_id(db)
+            run = SepayReconciliation(sinceID=since_id, status="RUNNING", startedDate=datetime.now())
+            db.add(run)
+            db.commit()
+
+            try:
+                SepayReconciliationService._reconcile(db, run, since_id, lines)
+                run.status = "SUCCEEDED"
+            except Exception as e:
+                db.rollback()
+                run.status = "FAILED"
+                run.error = str(e)
+                print(f"[RECONCILIATION ERROR] {e}")
+            run.finishedDate = datetime.now()
+            db.commit()
+            return SepayReconciliationService.to_dict(run)
+        finally:
+            if lock.dialect.name == "mysql":
+                lock.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": LOCK_NAME})
+            lock.close()
+
+    @staticmethod
+    def _reconcile(db: Session, run: SepayReconciliation, since_id: int | None, lines) -> None:
+        if lines is None:
+            lines = sepay_utils.iterTransactions(since_id=since_id)
+
+        # Chênh lệch theo giao dịch được báo trước, tiền vào không có mã báo sau
+        report, no_code = [], []
+        discrepancies = 0
+
+        def flag(entry: dict, target: list = report) -> None:
+            nonlocal discrepancies
+            discrepancies += 1
+            if len(target) < MAX_REPORTED:
+                target.append(entry)
+
+        # 1. Một lượt duyệt sao kê: gom tiền vào theo mã giao dịch
+        # transID -> [tổng tiền, [id SePay]]
+        paid = {}
+        payloads = {}
+        fetched = 0
+        last_id = None
+        for line in lines:
+            fetched += 1
+            sepay_id = int(line["id"])
+            if since_id is not None and sepay_id < since_id:
+                continue
+            last_id = sepay_id if last_id is None else max(last_id, sepay_id)
+
+            amount_in = Decimal(str(line.get("amount_in") or 0))
+            if amount_in <= 0:
+                continue
+            trans_id = PaymentCore.parse_trans_code(line.get("transaction_content"))
+            if trans_id is None:
+                flag({"type": "NO_CODE", "sepayID": sepay_id, "amount": float(amount_in),
+                      "message": "Tiền vào không có mã BM<transID>"}, no_code)
+                continue
+
+            entry = paid.setdefault(trans_id, [Decimal(0), []])
+            entry[0] += amount_in
+            entry[1].append(sepay_id)
+            payloads[sepay_id] = (trans_id, line)
+
+        # 2. Tra giao dịch và webhook đã nhận theo lô
+        transactions = {}
+        for chunk in SepayReconciliationService._chunks(list(paid)):
+            for row in db.query(
+                PaymentTransaction.transID, PaymentTransaction.status, PaymentTransaction.amount
+            ).filter(PaymentTransaction.transID.in_(chunk)):
+                transactions[row.transID] = row
+
+        received, failed = set(), []
+        for chunk in SepayReconciliationService._chunks(list(payloads)):
+            for sepay_id, event_status in db.query(SepayWebhookEvent.sepayID, SepayWebhookEvent.status)\
+                    .filter(SepayWebhookEvent.sepayID.in_(chunk)):
+                received.add(sepay_id)
+                if event_status == "FAILED":
+                    failed.append(sepay_id)
+
+        # 3. Chênh lệch theo giao dịch
+        matched = 0
+        for trans_id, (total, sepay_ids) in paid.items():
+            transaction = transactions.get(trans_id)
+            if transaction is None:
+                flag({"type": "UNKNOWN_TRANSACTION", "transID": trans_id, "sepayIDs": sepay_ids,
+                      "amount": float(total), "message": f"Không tìm thấy Transaction ID {trans_id}"})
+                continue
+
+            matched += len(sepay_ids)
+            expected = Decimal(transaction.amount or 0)
+            base = {"transID": trans_id, "sepayIDs": sepay_ids, "amount": float(total), "expected": float(expected)}
+            if len(sepay_ids) > 1:
+                flag({"type": "DUPLICATE_PAYMENT", **base, "message": "Giao dịch được chuyển tiền nhiều lần"})
+            if total < expected:
+                flag({"type": "UNDERPAID", **base, "message": "Số tiền nhận được nhỏ hơn số tiền giao dịch"})
+            elif total > expected and len(sepay_ids) == 1:
+                flag({"type": "OVERPAID", **base, "message": "Số tiền nhận được lớn hơn số tiền giao dịch"})
+            if transaction.status == "Expired":
+                flag({"type": "PAID_AFTER_EXPIRY", **base, "message": "Tiền về cho giao dịch đã hết hạn"})
+
+        # 4. Tiền về khớp giao dịch nhưng chưa có webhook -> đưa vào inbox để gạch nợ
+        missed = [
+            SepayReconciliationService._to_payload(line)
+            for sepay_id, (trans_id, line) in payloads.items()
+            if sepay_id not in received and trans_id in transactions
+        ]
+        enqueued = 0
+        for start in range(0, len(missed), EXISTENCE_CHUNK_SIZE):
+            enqueued += SepayWebhookService.receive_many(db, missed[start:start + EXISTENCE_CHUNK_SIZE])
+        # Webhook đã nhận nhưng gạch nợ lỗi -> xử lý lại ngay, không chờ lượt thử lại
+        for chunk in SepayReconciliationService._chunks(failed):
+            enqueued += SepayWebhookService.requeue_failed(db, chunk)
+
+        run.lastID = last_id if last_id is not None else (since_id - 1 if since_id is not None else None)
+        run.fetchedLines = fetched
+        run.matchedLines = matched
+        run.enqueuedLines = enqueued
+        run.discrepancies = discrepancies
+        run.report = json.dumps((report + no_code)[:MAX_REPORTED], ensure_ascii=False)
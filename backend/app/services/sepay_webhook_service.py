@@ -0,0 +1,201 @@
+"""
+Inbox webhook SePay: endpoint chỉ ghi payload rồi trả lời ngay, worker gạch nợ sau.
+
+- Mỗi webhook được ghi vào SEPAY_WEBHOOK_EVENT theo id giao dịch SePay bằng INSERT IGNORE,
+  nên SePay gửi lại (kể cả đồng thời) cùng id thì chỉ một lần được ghi và xử lý.
+- Mỗi process chạy một pool SEPAY_INBOX_WORKERS worker. Worker nhận việc theo lô bằng
+  SELECT ... FOR UPDATE SKIP LOCKED (các worker/process không tranh nhau cùng dòng), đánh
+  dấu PROCESSING, chạy PaymentService.process_sepay_webhook rồi ghi kết quả vào từng dòng.
+- Ghi nhận webhook đánh thức worker ngay; không có việc thì worker kiểm tra lại sau
+  POLL_SECONDS. Dòng PROCESSING quá CLAIM_TIMEOUT (worker chết giữa chừng) được nhận lại.
+- REJECTED (không khớp / thiếu tiền / hết hạn) là kết quả cuối. Lỗi khi gạch nợ (deadlock,
+  hết thời gian chờ khóa, mất kết nối DB...) đưa dòng về FAILED và được thử lại sau
+  RETRY_BASE_DELAY * 2^(lần lỗi - 1) (tối đa RETRY_MAX_DELAY), tối đa MAX_ATTEMPTS lần; sau
+  đó chỉ đối soát sao kê (requeue_failed) mới đưa lại vào hàng đợi.
+"""
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import and_, insert, or_
+from sqlalchemy.orm import Session
+
+from backend.app.core.db import SessionLocal
+from backend.app.models.sepay_webhook_event import SepayWebhookEvent
+from backend.app.services.payment_core import PaymentCore
+from backend.app.services.payment_service import PaymentService
+
+# Số webhook mỗi lần worker nhận việc
+CLAIM_BATCH_SIZE = 50
+# Thời gian worker chờ giữa hai lần kiểm tra inbox khi không được đánh thức (giây)
+POLL_SECONDS = 2
+# Dòng PROCESSING quá thời gian này được xem là worker đã chết
+CLAIM_TIMEOUT = timedelta(minutes=5)
+# Thử lại webhook xử lý lỗi: chờ tăng gấp đôi sau mỗi lần lỗi
+RETRY_BASE_DELAY = timedelta(seconds=30)
+RETRY_MAX_DELAY = timedelta(hours=1)
+MAX_ATTEMPTS = 10
+
+
+class SepayWebhookService:
+
+    _lock = threading.Lock()
+    _workers: list = []
+    _wakeup = threading.Event()
+    _stop = threading.Event()
+
+    @staticmethod
+    def _inbox_row(payload: dict) -> dict:
+        return {
+            "sepayID": payload["id"],
+            "payload": json.dumps(payload, ensure_ascii=False),
+            "status": "RECEIVED",
+            "transID": PaymentCore.parse_trans_code(payload.get("content")),
+            "receivedDate": datetime.now(),
+        }
+
+    @staticmethod
+    def receive(db: Session, payload: dict) -> bool:
+        """Ghi payload vào inbox; False nếu id SePay này đã được nhận trước đó"""
+        return SepayWebhookService.receive_many(db, [payload]) == 1
+
+    @staticmethod
+    def receive_many(db: Session, payloads: list[dict]) -> int:
+        """Ghi nhiều payload vào inbox bằng một INSERT nhiều dòng; trả về số dòng mới"""
+        if not payloads:
+            return 0
+        inserted = db.execute(
+            insert(SepayWebhookEvent.__table__).prefix_with("IGNORE", dialect="mysql"),
+            [SepayWebhookService._inbox_row(payload) for payload in payloads]
+        ).rowcount
+        db.commit()
+        if inserted:
+            SepayWebhookService._wakeup.set()
+        return inserted
+
+    @staticmethod
+    def requeue_failed(db: Session, sepay_ids: list[int]) -> int:
+        """Đưa các webhook FAILED trong danh sách về hàng đợi ngay; trả về số dòng"""
+        if not sepay_ids:
+            return 0
+        requeued = db.query(SepayWebhookEvent).filter(
+            SepayWebhookEvent.sepayID.in_(sepay_ids),
+            SepayWebhookEvent.status == "FAILED"
+        ).update({
+            SepayWebhookEvent.status: "RECEIVED",
+            SepayWebhookEvent.nextAttemptAt: None,
+        }, synchronize_session=False)
+        db.commit()
+        if requeued:
+            SepayWebhookService._wakeup.set()
+        return requeued
+
+    @staticmethod
+    def retry_delay(attempts: int) -> timedelta:
+        return min(RETRY_BASE_DELAY * 2 ** min(attempts - 1, MAX_ATTEMPTS), RETRY_MAX_DELAY)
+
+    @staticmethod
+    def claim_batch(db: Session, limit: int = CLAIM_BATCH_SIZE) -> list[int]:
+        """Nhận tối đa limit webhook chờ xử lý / tới lượt thử lại (bỏ qua dòng worker khác đang khóa)"""
+        now = datetime.now()
+        ids = [sepay_id for sepay_id, in db.query(SepayWebhookEvent.sepayID).filter(or_(
+            SepayWebhookEvent.status == "RECEIVED",
+            and_(SepayWebhookEvent.status == "PROCESSING", SepayWebhookEvent.claimedAt < now - CLAIM_TIMEOUT),
+            and_(SepayWebhookEvent.status == "FAILED", SepayWebhookEvent.nextAttemptAt <= now)
+        )).order_by(SepayWebhookEvent.receivedDate).limit(limit).with_for_update(skip_locked=True)]
+        if ids:
+            db.query(SepayWebhookEvent).filter(SepayWebhookEvent.sepayID.in_(ids)).update({
+                SepayWebhookEvent.status: "PROCESSING",
+                SepayWebhookEvent.claimedAt: now,
+            }, synchronize_session=False)
+        db.commit()
+        return ids
+
+    @staticmethod
+    def process_event(db: Session, sepay_id: int) -> str:
+        """Gạch nợ một webhook đã nhận việc và ghi kết quả; trả về trạng thái cuối"""
+        payload = db.query(SepayWebhookEvent.payload)\
+            .filter(SepayWebhookEvent.sepayID == sepay_id).scalar()
+        data = json.loads(payload)
+
+        try:
+            result = PaymentService.process_sepay_webhook(
+                db=db,
+                content=data["content"],
+                amount_in=float(data["transferAmount"]),
+                gateway_id=str(data["id"]),
+                transaction_date=data["transactionDate"]
+            )
+            status = "PROCESSED" if result["success"] else "REJECTED"
+            message = result["message"]
+        except Exception as e:
+            db.rollback()
+            status, message = "FAILED", str(e)
+            print(f"[SEPAY WEBHOOK ERROR] {sepay_id}: {e}")
+
+        now = datetime.now()
+        values = {
+            SepayWebhookEvent.status: status,
+            SepayWebhookEvent.result: message[:255],
+            SepayWebhookEvent.processedDate: now,
+        }
+        if status == "FAILED":
+            attempts = (db.query(SepayWebhookEvent.attempts)
+                        .filter(SepayWebhookEvent.sepayID == sepay_id).scalar() or 0) + 1
+            values[SepayWebhookEvent.attempts] = attempts
+            values[SepayWebhookEvent.nextAttemptAt] = \
+                now + SepayWebhookService.retry_delay(attempts) if attempts < MAX_ATTEMPTS else None
+        db.query(SepayWebhookEvent).filter(
+            SepayWebhookEvent.sepayID == sepay_id,
+            SepayWebhookEvent.status == "PROCESSING"
+        ).update(values, synchronize_session=False)
+        db.commit()
+        return status
+
+    @staticmethod
+    def drain_once() -> int:
+        """Nhận và xử lý một lô; trả về số webhook đã xử lý"""
+        db = SessionLocal()
+        try:
+            ids = SepayWebhookService.claim_batch(db)
+            for sepay_id in ids:
+                SepayWebhookService.process_event(db, sepay_id)
+            return len(ids)
+        finally:
+            db.close()
+
+    @staticmethod
+    def _worker_loop() -> None:
+        while not SepayWebhookService._stop.is_set():
+            # Xóa cờ trước khi nhận việc để không lỡ tín hiệu đến trong lúc đang xử lý
+            SepayWebhookService._wakeup.clear()
+            try:
+                processed = SepayWebhookService.drain_once()
+            except Exception as e:
+                print(f"[SEPAY INBOX ERROR] {e}")
+                processed = 0
+            if not processed:
+                SepayWebhookService._wakeup.wait(POLL_SECONDS)
+
+    @staticmethod
+    def start_workers(count: int | None = None) -> int:
+        """Khởi động pool worker của process (gọi một lần khi startup)"""
+        with SepayWebhookService._lock:
+            if SepayWebhookService._workers:
+                return len(SepayWebhookService._workers)
+            count = count or int(os.getenv("SEPAY_INBOX_WORKERS", "2"))
+            SepayWebhookService._stop.clear()
+            for index in range(max(count, 1)):
+                worker = threading.Thread(
+                    target=SepayWebhookService._worker_loop, name=f"sepay-inbox-{index}", daemon=True
+                )
+                worker.start()
+                SepayWebhookService._workers.append(worker)
+            return len(SepayWebhookService._workers)
+
+    @staticmethod
+    def stop_workers() -> None:
+        with SepayWebhookService._lock:
+            SepayWebhookService._stop.set()
+            SepayWebhookService._wakeup.set()
+            SepayWebhookService._workers = []
@@ -0,0 +1,156 @@
+"""
+Quản lý biểu giá điện/nước có phiên bản theo ngày hiệu lực.
+
+Các dòng TARIFF_SCHEDULE được biên dịch một lần thành TieredTariff và giữ trong
+cache của process. Mỗi lượt tính hóa đơn chỉ chạy 1 câu SELECT nhỏ để so "dấu
+phiên bản" (số dòng, tổng revision, scheduleID lớn nhất); cache chỉ nạp lại khi dấu
+thay đổi. revision tăng ở mỗi lần sửa nên hai lần sửa trong cùng một giây (updatedAt
+chỉ chính xác tới giây) vẫn đổi dấu. Vòng lặp tính tiền chỉ còn tra dict + tìm nhị
+phân, không query DB.
+"""
+import json
+import threading
+from bisect import bisect_right
+from datetime import date
+from fastapi import HTTPException, status
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from backend.app.models.tariff_schedule import TariffSchedule
+from backend.app.utils.tariff_utils import TieredTariff, ELECTRICITY_TARIFF, WATER_TARIFF
+
+# Biểu giá mặc định khi chưa cấu hình trong DB (phiên bản 0)
+DEFAULT_TARIFFS = {
+    "ELECTRICITY": ELECTRICITY_TARIFF,
+    "WATER": WATER_TARIFF,
+}
+
+
+class TariffService:
+
+    _lock = threading.Lock()
+    _stamp = None
+    # (tariffType, buildingID | None) -> (tuple ngày hiệu lực tăng dần, tuple (scheduleID, TieredTariff))
+    _snapshot: dict = {}
+
+    @staticmethod
+    def _compile(row: TariffSchedule) -> TieredTariff:
+        tiers = [(limit, price) for limit, price in json.loads(row.tiers)]
+        return TieredTariff(tiers, surcharge_percent=row.surchargePercent)
+
+    @staticmethod
+    def _current_stamp(db: Session):
+        return db.query(
+            func.count(TariffSchedule.scheduleID),
+            func.coalesce(func.sum(TariffSchedule.revision), 0),
+            func.max(TariffSchedule.scheduleID)
+        ).one()
+
+    @staticmethod
+    def snapshot(db: Session) -> dict:
+        """Trả về bảng biểu giá đã biên dịch, nạp lại nếu DB có thay đổi"""
+        stamp = tuple(TariffService._current_stamp(db))
+        if stamp == TariffService._stamp:
+            return TariffService._snapshot
+
+        with TariffService._lock:
+            if stamp == TariffService._stamp:
+                return TariffService._snapshot
+
+            grouped: dict = {}
+            rows = db.query(TariffSchedule).order_by(TariffSchedule.effectiveFrom).all()
+            for row in rows:
+                key = (row.tariffType, row.buildingID)
+                grouped.setdefault(key, []).append(
+                    (row.effectiveFrom, row.scheduleID, TariffService._compile(row))
+                )
+
+            snapshot = {
+                key: (
+                    tuple(effective for effective, _, _ in versions),
+                    tuple((schedule_id, tariff) for _, schedule_id, tariff in versions),
+                )
+                for key, versions in grouped.items()
+            }
+            TariffService._snapshot = snapshot
+            TariffService._stamp = stamp
+            return snapshot
+
+    @staticmethod
+    def invalidate():
+        """Buộc lần gọi snapshot() kế tiếp nạp lại từ DB"""
+        with TariffService._lock:
+            TariffService._stamp = None
+
+    @staticmethod
+    def resolve(snapshot: dict, tariff_type: str, building_id: str | None, on_date: date) -> tuple[int, TieredTariff]:
+        """
+        Chọn biểu giá hiệu lực tại on_date: ưu tiên biểu giá riêng của tòa nhà,
+        sau đó biểu giá chung, cuối cùng là biểu giá mặc định (phiên bản 0).
+        """
+        for key in ((tariff_type, building_id), (tariff_type, None)):
+            entry = snapshot.get(key)
+            if entry is None:
+                continue
+            dates, versions = entry
+            index = bisect_right(dates, on_date) - 1
+            if index >= 0:
+                return versions[index]
+        return 0, DEFAULT_TARIFFS[tariff_type]
+
+    @staticmethod
+    def list_schedules(db: Session, tariff_type: str | None = None, building_id: str | None = None):
+        query = db.query(TariffSchedule)
+        if tariff_type: query = query.filter(TariffSchedule.tariffType == tariff_type)
+        if building_id: query = query.filter(TariffSchedule.buildingID == building_id)
+        return query.order_by(TariffSchedule.tariffType, TariffSchedule.effectiveFrom.desc()).all()
+
+    @staticmethod
+    def upsert_schedule(db: Session, data) -> TariffSchedule:
+        """Tạo mới hoặc cập nhật biểu giá cùng (loại, tòa nhà, ngày hiệu lực)"""
+        tiers = [(tier.limit, tier.price) for tier in data.tiers]
+        try:
+            TieredTariff(tiers, surcharge_percent=data.surchargePercent)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+        if data.buildingID:
+            building_filter = TariffSchedule.buildingID == data.buildingID
+        else:
+            building_filter = TariffSchedule.buildingID.is_(None)
+
+        schedule = db.query(TariffSchedule).filter(
+            TariffSchedule.tariffType == data.tariffType,
+            building_filter,
+            TariffSchedule.effectiveFrom == data.effectiveFrom
+        ).first()
+
+        if not schedule:
+            schedule = TariffSchedule(
+                tariffType=data.tariffType,
+                buildingID=data.buildingID,
+                effectiveFrom=data.effectiveFrom
+            )
+            db.add(schedule)
+        else:
+            schedule.revision = TariffSchedule.revision + 1
+
+        schedule.tiers = json.dumps(tiers)
+        schedule.surchargePercent = data.surchargePercent
+        db.commit()
+        db.refresh(schedule)
+        TariffService.invalidate()
+        return schedule
+
+    @staticmethod
+    def delete_schedule(db: Session, schedule_id: int) -> str:
+        schedule = db.query(TariffSchedule).filter(TariffSchedule.scheduleID == schedule_id).first()
+        if not schedule:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Không tìm thấy biểu giá {schedule_id}"
+            )
+        db.delete(schedule)
+        db.commit()
+        TariffService.invalidate()
+        return f"Đã xóa biểu giá {schedule_id}."
@@ -0,0 +1,20 @@
+"""
+Đồng bộ danh sách thu hồi token (core/security.py) với ACCOUNT.isActive.
+
+Process vô hiệu hóa tài khoản thu hồi ngay trong bộ nhớ của nó (revoke_username); các
+process khác nhận thay đổi ở lần đồng bộ định kỳ kế tiếp.
+"""
+from sqlalchemy.orm import Session
+
+from backend.app.core.security import set_revoked_usernames
+from backend.app.models.account import Account
+
+
+class TokenRevocationService:
+
+    @staticmethod
+    def sync(db: Session) -> int:
+        """Nạp lại username của các tài khoản bị vô hiệu hóa; trả về số tài khoản"""
+        usernames = [username for username, in db.query(Account.username).filter(Account.isActive == False)]
+        set_revoked_usernames(usernames)
+        return len(usernames)
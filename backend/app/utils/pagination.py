@@ -0,0 +1,52 @@
+"""
+Phân trang keyset (con trỏ) theo (createdDate, id) giảm dần.
+
+Con trỏ là chuỗi base64 của (createdDate, id) của dòng cuối trang trước; trang sau
+chỉ lấy các dòng đứng sau mốc đó nên trang sâu tốn như trang đầu (dùng index
+(..., createdDate, id), không OFFSET). Con trỏ trang kế được trả về qua header
+X-Next-Cursor để giữ nguyên schema danh sách của response.
+"""
+import base64
+import json
+from datetime import datetime
+from fastapi import HTTPException, Response, status
+from sqlalchemy import and_, or_
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(created_date: datetime | None, row_id: int) -> str:
+    raw = json.dumps([created_date.isoformat() if created_date else None, row_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime | None, int]:
+    """Giải mã con trỏ; con trỏ hỏng -> 400"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created, row_id = json.loads(raw)
+        return (datetime.fromisoformat(created) if created else None), int(row_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cursor không hợp lệ")
+
+
+def before_cursor(date_col, id_col, cursor: tuple[datetime | None, int]):
+    """
+    Điều kiện "đứng sau con trỏ" khi sắp (date_col DESC, id_col DESC), dạng OR mở
+    rộng để MySQL dùng được index range. Dòng createdDate NULL xếp cuối.
+    """
+    created, row_id = cursor
+    if created is None:
+        return and_(date_col.is_(None), id_col < row_id)
+    return or_(
+        date_col < created,
+        and_(date_col == created, id_col < row_id),
+        date_col.is_(None)
+    )
+
+
+def set_next_cursor(response: Response, items: list, limit: int, date_attr: str, id_attr: str) -> None:
+    """Đủ một trang thì gắn con trỏ tới trang kế vào header"""
+    if len(items) == limit and items:
+        last = items[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(getattr(last, date_attr), getattr(last, id_attr))
@@ -0,0 +1,299 @@
+"""
+Bộ mã hóa QR Code tối giản (ISO/IEC 18004) cho mã VietQR: chế độ byte, mức sửa lỗi M,
+tự chọn phiên bản nhỏ nhất đủ chứa dữ liệu và mặt nạ có điểm phạt thấp nhất.
+
+encode(data) trả về ma trận module (list các hàng, True = ô tối), chưa gồm viền trắng.
+"""
+
+# Theo phiên bản (chỉ số 0 không dùng), mức sửa lỗi M
+ECC_CODEWORDS_PER_BLOCK = (
+    -1, 10, 16, 26, 18, 24, 16, 18, 22, 22, 26, 30, 22, 22, 24, 24, 28, 28, 26, 26, 26,
+    26, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28,
+)
+NUM_ECC_BLOCKS = (
+    -1, 1, 1, 1, 2, 2, 4, 4, 4, 5, 5, 5, 8, 9, 9, 10, 10, 11, 13, 14, 16,
+    17, 17, 18, 20, 21, 23, 25, 26, 28, 29, 31, 33, 35, 37, 38, 40, 43, 45, 47, 49,
+)
+# Bit mức sửa lỗi M trong format info
+ECC_FORMAT_BITS = 0
+
+MASK_PATTERNS = (
+    lambda x, y: (x + y) % 2 == 0,
+    lambda x, y: y % 2 == 0,
+    lambda x, y: x % 3 == 0,
+    lambda x, y: (x + y) % 3 == 0,
+    lambda x, y: (x // 3 + y // 2) % 2 == 0,
+    lambda x, y: x * y % 2 + x * y % 3 == 0,
+    lambda x, y: (x * y % 2 + x * y % 3) % 2 == 0,
+    lambda x, y: ((x + y) % 2 + x * y % 3) % 2 == 0,
+)
+FINDER_LIKE = ([True, False, True, True, True, False, True, False, False, False, False],
+               [False, False, False, False, True, False, True, True, True, False, True])
+
+
+def _raw_data_modules(version: int) -> int:
+    result = (16 * version + 128) * version + 64
+    if version >= 2:
+        num_align = version // 7 + 2
+        result -= (25 * num_align - 10) * num_align - 55
+        if version >= 7:
+            result -= 36
+    return result
+
+
+def _data_codewords(version: int) -> int:
+    return _raw_data_modules(version) // 8 - ECC_CODEWORDS_PER_BLOCK[version] * NUM_ECC_BLOCKS[version]
+
+
+def _gf_multiply(x: int, y: int) -> int:
+    z = 0
+    for i in reversed(range(8)):
+        z = (z << 1) ^ ((z >> 7) * 0x11D)
+        z ^= ((y >> i) & 1) * x
+    return z
+
+
+def _rs_divisor(degree: int) -> list[int]:
+    result = [0] * (degree - 1) + [1]
+    root = 1
+    for _ in range(degree):
+        for j in range(degree):
+            result[j] = _gf_multiply(result[j], root)
+            if j + 1 < degree:
+                result[j] ^= result[j + 1]
+        root = _gf_multiply(root, 0x02)
+    return result
+
+
+def _rs_remainder(data: list[int], divisor: list[int]) -> list[int]:
+    result = [0] * len(divisor)
+    for byte in data:
+        factor = byte ^ result.pop(0)
+        result.append(0)
+        for i, coef in enumerate(divisor):
+            result[i] ^= _gf_multiply(coef, factor)
+    return result
+
+
+def _alignment_positions(version: int) -> list[int]:
+    if version == 1:
+        return []
+    num_align = version // 7 + 2
+    step = 26 if version == 32 else (version * 4 + num_align * 2 + 1) // (num_align * 2 - 2) * 2
+    size = version * 4 + 17
+    positions = [size - 7 - i * step for i in range(num_align - 1)] + [6]
+    return list(reversed(positions))
+
+
+def _data_bits(data: bytes, version: int) -> list[int]:
+    """Chuỗi codeword dữ liệu (chế độ byte) đã đệm đủ dung lượng phiên bản"""
+    bits = [0, 1, 0, 0]
+    count_bits = 8 if version <= 9 else 16
+    bits += [(len(data) >> i) & 1 for i in reversed(range(count_bits))]
+    for byte in data:
+        bits += [(byte >> i) & 1 for i in reversed(range(8))]
+
+    capacity = _data_codewords(version) * 8
+    bits += [0] * min(4, capacity - len(bits))
+    bits += [0] * (-len(bits) % 8)
+    codewords = [int("".join(map(str, bits[i:i + 8])), 2) for i in range(0, len(bits), 8)]
+    pad = 0xEC
+    while len(codewords) < capacity // 8:
+        codewords.append(pad)
+        pad ^= 0xEC ^ 0x11
+    return codewords
+
+
+def _add_ecc_and_interleave(data: list[int], version: int) -> list[int]:
+    num_blocks = NUM_ECC_BLOCKS[version]
+    ecc_len = ECC_CODEWORDS_PER_BLOCK[version]
+    raw_codewords = _raw_data_modules(version) // 8
+    num_short_blocks = num_blocks - raw_codewords % num_blocks
+    short_block_len = raw_codewords // num_blocks
+
+    divisor = _rs_divisor(ecc_len)
+    blocks = []
+    k = 0
+    for i in range(num_blocks):
+        block = data[k:k + short_block_len - ecc_len + (0 if i < num_short_blocks else 1)]
+        k += len(block)
+        ecc = _rs_remainder(block, divisor)
+        if i < num_short_blocks:
+            block.append(0)
+        blocks.append(block + ecc)
+
+    result = []
+    for i in range(len(blocks[0])):
+        for j, block in enumerate(blocks):
+            # Bỏ ô giữ chỗ của khối ngắn
+            if i != short_block_len - ecc_len or j >= num_short_blocks:
+                result.append(block[i])
+    return result
+
+
+class _Matrix:
+
+    def __init__(self, version: int):
+        self.version = version
+        self.size = version * 4 + 17
+        self.modules = [[False] * self.size for _ in range(self.size)]
+        self.is_function = [[False] * self.size for _ in range(self.size)]
+
+    def set_function(self, x: int, y: int, dark: bool) -> None:
+        self.modules[y][x] = dark
+        self.is_function[y][x] = True
+
+    def draw_function_patterns(self) -> None:
+        size = self.size
+        for i in range(size):
+            self.set_function(6, i, i % 2 == 0)
+            self.set_function(i, 6, i % 2 == 0)
+
+        for cx, cy in ((3, 3), (size - 4, 3), (3, size - 4)):
+            for dy in range(-4, 5):
+                for dx in range(-4, 5):
+                    x, y = cx + dx, cy + dy
+                    if 0 <= x < size and 0 <= y < size:
+                        self.set_function(x, y, max(abs(dx), abs(dy)) not in (2, 4))
+
+        positions = _alignment_positions(self.version)
+        last = len(positions) - 1
+        for i, cx in enumerate(positions):
+            for j, cy in enumerate(positions):
+                if (i, j) in ((0, 0), (0, last), (last, 0)):
+                    continue
+                for dy in range(-2, 3):
+                    for dx in range(-2, 3):
+                        self.set_function(cx + dx, cy + dy, max(abs(dx), abs(dy)) != 1)
+
+        self.draw_format_bits(0)
+        self.draw_version()
+
+    def draw_format_bits(self, mask: int) -> None:
+        data = ECC_FORMAT_BITS << 3 | mask
+        rem = data
+        for _ in range(10):
+            rem = (rem << 1) ^ ((rem >> 9) * 0x537)
+        bits = (data << 10 | rem) ^ 0x5412
+
+        def bit(i: int) -> bool:
+            return (bits >> i) & 1 != 0
+
+        size = self.size
+        for i in range(6):
+            self.set_function(8, i, bit(i))
+        self.set_function(8, 7, bit(6))
+        self.set_function(8, 8, bit(7))
+        self.set_function(7, 8, bit(8))
+        for i in range(9, 15):
+            self.set_function(14 - i, 8, bit(i))
+
+        for i in range(8):
+            self.set_function(size - 1 - i, 8, bit(i))
+        for i in range(8, 15):
+            self.set_function(8, size - 15 + i, bit(i))
+        self.set_function(8, size - 8, True)
+
+    def draw_version(self) -> None:
+        if self.version < 7:
+            return
+        rem = self.version
+        for _ in range(12):
+            rem = (rem << 1) ^ ((rem >> 11) * 0x1F25)
+        bits = self.version << 12 | rem
+        for i in range(18):
+            dark = (bits >> i) & 1 != 0
+            a, b = self.size - 11 + i % 3, i // 3
+            self.set_function(a, b, dark)
+            self.set_function(b, a, dark)
+
+    def draw_codewords(self, codewords: list[int]) -> None:
+        size = self.size
+        total = len(codewords) * 8
+        i = 0
+        right = size - 1
+        while right >= 1:
+            if right == 6:
+                right = 5
+            upward = (right + 1) & 2 == 0
+            for vert in range(size):
+                y = size - 1 - vert if upward else vert
+                for x in (right, right - 1):
+                    if not self.is_function[y][x] and i < total:
+                        self.modules[y][x] = (codewords[i >> 3] >> (7 - (i & 7))) & 1 != 0
+                        i += 1
+            right -= 2
+
+    def apply_mask(self, mask: int) -> None:
+        pattern = MASK_PATTERNS[mask]
+        for y in range(self.size):
+            row, function_row = self.modules[y], self.is_function[y]
+            for x in range(self.size):
+                if not function_row[x] and pattern(x, y):
+                    row[x] = not row[x]
+
+    def penalty(self) -> int:
+        modules = self.modules
+        size = self.size
+        columns = [list(column) for column in zip(*modules)]
+        score = 0
+
+        for line in modules + columns:
+            # Chuỗi >= 5 ô cùng màu
+            run = 1
+            for i in range(1, size):
+                if line[i] == line[i - 1]:
+                    run += 1
+                else:
+                    if run >= 5:
+                        score += run - 2
+                    run = 1
+            if run >= 5:
+                score += run - 2
+            # Mẫu giống finder 1:1:3:1:1 kèm 4 ô sáng
+            for i in range(size - 10):
+                if line[i:i + 11] in FINDER_LIKE:
+                    score += 40
+
+        # Khối 2x2 cùng màu
+        for y in range(size - 1):
+            for x in range(size - 1):
+                color = modules[y][x]
+                if color == modules[y][x + 1] == modules[y + 1][x] == modules[y + 1][x + 1]:
+                    score += 3
+
+        # Tỉ lệ ô tối lệch khỏi 50%
+        dark = sum(map(sum, modules))
+        total = size * size
+        k = (abs(dark * 20 - total * 10) + total - 1) // total - 1
+        return score + max(k, 0) * 10
+
+
+def encode(data: bytes, mask: int | None = None) -> list[list[bool]]:
+    """Mã hóa data thành ma trận QR; mask=None thì chọn mặt nạ có điểm phạt thấp nhất"""
+    for version in range(1, 41):
+        count_bits = 8 if version <= 9 else 16
+        if 4 + count_bits + len(data) * 8 <= _data_codewords(version) * 8:
+            break
+    else:
+        raise ValueError("Dữ liệu quá dài cho mã QR")
+
+    matrix = _Matrix(version)
+    matrix.draw_function_patterns()
+    matrix.draw_codewords(_add_ecc_and_interleave(_data_bits(data, version), version))
+
+    if mask is None:
+        best = None
+        for candidate in range(8):
+            matrix.apply_mask(candidate)
+            matrix.draw_format_bits(candidate)
+            score = matrix.penalty()
+            if best is None or score < best[0]:
+                best = (score, candidate)
+            # Mặt nạ XOR nên áp lại lần nữa để hoàn tác
+            matrix.apply_mask(candidate)
+        mask = best[1]
+
+    matrix.apply_mask(mask)
+    matrix.draw_format_bits(mask)
+    return matrix.modules
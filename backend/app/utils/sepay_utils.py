@@ -1,21 +1,62 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 import os
+import threading
 load_dotenv()
 
 # CONFIG
 SEPAY_API = os.getenv("SEPAY_API", "")
+# Đổi sang server giả lập khi kiểm thử
+SEPAY_API_URL = os.getenv("SEPAY_API_URL", "https://my.sepay.vn/userapi").rstrip("/")
 headers = {
         "Authorization": f"Bearer {SEPAY_API}",
         "Content-Type": "application/json"
     }
+# (connect, read) giây
+TIMEOUT = (5, 30)
+# Số giao dịch tối đa mỗi trang (giới hạn của SePay)
+PAGE_LIMIT = 5000
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """Session dùng chung (giữ kết nối keep-alive), tự thử lại lỗi mạng / 429 / 5xx"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            retry = Retry(
+                total=3,
+                backoff_factor=0.5,
+                status_forcelist=(429, 500, 502, 503, 504),
+                allowed_methods=("GET",),
+                respect_retry_after_header=True,
+            )
+            session = requests.Session()
+            session.headers.update(headers)
+            session.mount("https://", HTTPAdapter(max_retries=retry, pool_maxsize=4))
+            session.mount("http://", HTTPAdapter(max_retries=retry, pool_maxsize=4))
+            _session = session
+        return _session
 
 
 # Lấy danh sách giao dịch
-def getTransactionsList():
-    url = "https://my.sepay.vn/userapi/transactions/list"
-    
-    response = requests.get(url, headers=headers)
+def getTransactionsList(since_id=None, limit=None, **filters):
+    """
+    since_id: chỉ lấy giao dịch có id >= since_id; limit: số giao dịch tối đa (<= PAGE_LIMIT).
+    filters: các tham số lọc khác của SePay (account_number, transaction_date_min, ...).
+    """
+    params = {key: value for key, value in filters.items() if value is not None}
+    if since_id is not None:
+        params["since_id"] = since_id
+    if limit is not None:
+        params["limit"] = limit
+
+    response = get_session().get(f"{SEPAY_API_URL}/transactions/list", params=params, timeout=TIMEOUT)
+    response.raise_for_status()
     data = response.json()
     transactions = data.get("transactions", [])
     return transactions
@@ -23,10 +64,22 @@ def getTransactionsList():
 
 # Lấy chi tiết giao dịch theo ID
 def getTransactionDetail(transaction_id):
-    url = f"https://my.sepay.vn/userapi/transactions/details/{transaction_id}"
-
-    response = requests.get(url, headers=headers)
+    response = get_session().get(f"{SEPAY_API_URL}/transactions/details/{transaction_id}", timeout=TIMEOUT)
+    response.raise_for_status()
     data = response.json()
     transaction = data.get("transaction", [])
     return transaction
-    
\ No newline at end of file
+
+
+def iterTransactions(since_id=None, page_limit=PAGE_LIMIT, **filters):
+    """Duyệt sao kê theo id tăng dần từ since_id, từng trang page_limit giao dịch"""
+    while True:
+        raw = getTransactionsList(since_id=since_id, limit=page_limit, **filters)
+        page = sorted(
+            (item for item in raw if since_id is None or int(item["id"]) >= since_id),
+            key=lambda item: int(item["id"])
+        )
+        yield from page
+        if len(raw) < page_limit or not page:
+            return
+        since_id = int(page[-1]["id"]) + 1
@@ -0,0 +1,107 @@
+"""
+Biểu giá bậc thang (điện, nước) tính bằng số nguyên VNĐ.
+
+Mỗi biểu giá được biên dịch một lần thành các mốc bậc lũy kế và tiền lũy kế tại
+mỗi mốc, nên tiền của một chỉ số tiêu thụ chỉ cần 1 lần tìm nhị phân + vài phép
+nhân số nguyên. Kết quả khớp tuyệt đối với cách tính Decimal + ROUND_HALF_UP cũ.
+"""
+from bisect import bisect_right
+from decimal import Decimal
+
+
+class TieredTariff:
+    """Biểu giá bậc thang đã biên dịch (bất biến)"""
+
+    __slots__ = ("tiers", "surcharge_percent", "_breakpoints", "_prices", "_base_at", "_num", "_den")
+
+    def __init__(self, tiers: list[tuple], surcharge_percent):
+        """
+        tiers: danh sách (hạn mức bậc, đơn giá); hạn mức None/inf cho bậc cuối.
+        surcharge_percent: tổng thuế phí cộng thêm trên tiền gốc (VD: 8 cho 8% VAT).
+        """
+        if not tiers:
+            raise ValueError("Biểu giá phải có ít nhất 1 bậc")
+
+        breakpoints = []
+        prices = []
+        base_at = []
+        start = 0
+        base = 0
+        for index, (limit, price) in enumerate(tiers):
+            price = int(price)
+            breakpoints.append(start)
+            prices.append(price)
+            base_at.append(base)
+
+            is_last = index == len(tiers) - 1
+            if limit is None or limit == float('inf'):
+                if not is_last:
+                    raise ValueError("Chỉ bậc cuối được không giới hạn")
+                break
+            if int(limit) != limit or limit <= 0:
+                raise ValueError(f"Hạn mức bậc không hợp lệ: {limit}")
+            start += int(limit)
+            base += int(limit) * price
+
+        surcharge = Decimal(str(surcharge_percent))
+        num, den = ((Decimal(100) + surcharge) / Decimal(100)).as_integer_ratio()
+
+        self.tiers = tuple((limit, int(price)) for limit, price in tiers)
+        self.surcharge_percent = surcharge
+        self._breakpoints = tuple(breakpoints)
+        self._prices = tuple(prices)
+        self._base_at = tuple(base_at)
+        self._num = num
+        self._den = den
+
+    @staticmethod
+    def _to_decimal(value) -> Decimal:
+        return value if isinstance(value, Decimal) else Decimal(str(value))
+
+    def cost_many(self, consumptions) -> list[int]:
+        """
+        Tính tiền (VNĐ, đã gồm thuế phí, làm tròn half-up) cho cả mảng chỉ số tiêu thụ.
+        Toàn bộ mảng được đưa về số nguyên theo cùng một hệ số 10^k rồi tính một lượt.
+        """
+        values = [self._to_decimal(c) for c in consumptions]
+        if not values:
+            return []
+
+        digits = max(-v.as_tuple().exponent for v in values)
+        digits = max(digits, 0)
+        scale = 10 ** digits
+        units = [int(v.scaleb(digits)) for v in values]
+
+        breakpoints = [bp * scale for bp in self._breakpoints]
+        base_at = [b * scale for b in self._base_at]
+        prices = self._prices
+        num = self._num
+        # tiền = p / q với p = base * num, q = den * scale; làm tròn half-up: (2p + q) // 2q
+        q = self._den * scale
+        q2 = 2 * q
+
+        results = []
+        for u in units:
+            if u <= 0:
+                results.append(0)
+                continue
+            i = bisect_right(breakpoints, u) - 1
+            base = base_at[i] + (u - breakpoints[i]) * prices[i]
+            results.append((2 * base * num + q) // q2)
+        return results
+
+    def cost(self, consumption) -> int:
+        """Tính tiền cho một chỉ số tiêu thụ"""
+        return self.cost_many([consumption])[0]
+
+
+# Điện sinh hoạt 6 bậc + 8% VAT
+ELECTRICITY_TIERS = [
+    (50, 1984), (50, 2050), (100, 2380),
+    (100, 2998), (100, 3350), (float('inf'), 3460)
+]
+ELECTRICITY_TARIFF = TieredTariff(ELECTRICITY_TIERS, surcharge_percent=8)
+
+# Nước sạch 4 bậc + 10% phí BVMT + 5% VAT
+WATER_TIERS = [(10, 8500), (10, 9900), (10, 16000), (float('inf'), 27000)]
+WATER_TARIFF = TieredTariff(WATER_TIERS, surcharge_percent=15)
@@ -11,7 +11,16 @@ from sqlalchemy import text  # noqa: E402
 from fastapi.middleware.cors import CORSMiddleware  # noqa: E402
 from fastapi import FastAPI  # noqa: E402
 from apscheduler.schedulers.background import BackgroundScheduler # noqa: E402
-from backend.app.services.payment_service import PaymentService # noqa: E402
+from backend.app.services.payment_expiry_service import PaymentExpiryService, TICK_SECONDS # noqa: E402
+from backend.app.services.sepay_webhook_service import SepayWebhookService # noqa: E402
+from backend.app.services.sepay_reconciliation_service import SepayReconciliationService # noqa: E402
+from backend.app.services.billing_job_service import BillingJobService # noqa: E402
+from backend.app.services.meter_reading_service import MeterReadingService # noqa: E402
+from backend.app.services.notification_counter_service import NotificationCounterService # noqa: E402
+from backend.app.services.notification_retention_service import NotificationRetentionService # noqa: E402
+from backend.app.services.token_revocation_service import TokenRevocationService # noqa: E402
+from backend.app.services.principal_service import PrincipalService # noqa: E402
+from backend.app.utils.pagination import NEXT_CURSOR_HEADER # noqa: E402
 
 # Import 
 from backend.app.models import Base  # noqa: E402
@@ -42,6 +51,8 @@ app.add_middleware(
     allow_credentials=not allow_all,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Con trỏ trang kế của các danh sách phân trang keyset
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
 @app.get("/", tags=["meta"])
@@ -82,14 +93,100 @@ app.include_router(notifications.router, prefix="/api/notification", tags=["Noti
 
 
 def run_auto_cancel_job():
-    """Hàm này sẽ được gọi mỗi 60 giây"""
-    db = SessionLocal()
+    """Hàm này sẽ được gọi mỗi TICK_SECONDS giây (chỉ process giữ khóa leader thực sự hủy)"""
     try:
-        result = PaymentService.cancel_expired_transactions(db)
-        if result['canceled_count'] > 0:
-            print(f"[AUTO-JOB] Đã hủy {result['canceled_count']} giao dịch quá hạn 15 phút.")
+        canceled = PaymentExpiryService.tick()
+        if canceled > 0:
+            print(f"[AUTO-JOB] Đã hủy {canceled} giao dịch quá hạn 15 phút.")
     except Exception as e:
         print(f"[AUTO-JOB ERROR] {e}")
+
+def run_sepay_reconciliation():
+    """Đối soát sao kê SePay để bù webhook bị thất lạc (chỉ chạy khi đã cấu hình SEPAY_API, chỉ process leader chạy)"""
+    if not os.getenv("SEPAY_API"):
+        return
+    db = SessionLocal()
+    try:
+        if not PaymentExpiryService.is_leader():
+            return
+        result = SepayReconciliationService.run(db)
+        if result["enqueued_lines"] or result["discrepancies"]:
+            print(
+                f"[RECONCILIATION] Đọc {result['fetched_lines']} dòng sao kê, bù {result['enqueued_lines']} "
+                f"giao dịch thiếu webhook, {result['discrepancies']} chênh lệch."
+            )
+    except Exception as e:
+        print(f"[RECONCILIATION ERROR] {e}")
+    finally:
+        db.close()
+
+def run_resume_billing_jobs():
+    """Chạy tiếp các job tính hóa đơn bị bỏ dở (worker chết giữa chừng)"""
+    try:
+        resumed = BillingJobService.resume_pending()
+        if resumed > 0:
+            print(f"[BILLING-JOB] Đã đưa lại {resumed} job tính hóa đơn vào hàng đợi.")
+    except Exception as e:
+        print(f"[BILLING-JOB ERROR] {e}")
+
+def run_reconcile_notification_counters():
+    """Tính lại bộ đếm thông báo chưa đọc để sửa sai lệch (chỉ process leader chạy)"""
+    db = SessionLocal()
+    try:
+        if PaymentExpiryService.is_leader():
+            NotificationCounterService.reconcile(db)
+    except Exception as e:
+        print(f"[COUNTER ERROR] {e}")
+    finally:
+        db.close()
+
+def run_archive_notifications():
+    """Chuyển thông báo đã đọc quá hạn lưu giữ sang bảng lưu trữ (chỉ process leader chạy)"""
+    db = SessionLocal()
+    try:
+        if not PaymentExpiryService.is_leader():
+            return
+        metrics = NotificationRetentionService.run(db)
+        if metrics["archived"] or metrics["partitionsAdded"] or metrics["partitionsDropped"]:
+            print(
+                f"[RETENTION] Đã lưu trữ {metrics['archived']} thông báo trong {metrics['batches']} lô "
+                f"({metrics['seconds']}s), thêm {metrics['partitionsAdded']} / xóa "
+                f"{metrics['partitionsDropped']} partition."
+            )
+    except Exception as e:
+        print(f"[RETENTION ERROR] {e}")
+    finally:
+        db.close()
+
+def run_sync_revoked_tokens():
+    """Nạp danh sách tài khoản bị vô hiệu hóa để từ chối token của họ"""
+    db = SessionLocal()
+    try:
+        TokenRevocationService.sync(db)
+    except Exception as e:
+        print(f"[AUTH ERROR] Không thể đồng bộ danh sách thu hồi token: {e}")
+    finally:
+        db.close()
+
+def run_sync_principal_changes():
+    """Nạp mốc thay đổi cư dân do process khác ghi để không tin claim residentID cũ"""
+    db = SessionLocal()
+    try:
+        PrincipalService.sync(db)
+    except Exception as e:
+        print(f"[AUTH ERROR] Không thể đồng bộ thay đổi cư dân: {e}")
+    finally:
+        db.close()
+
+def run_backfill_latest_readings():
+    """Dựng bảng METER_READING_LATEST từ dữ liệu cũ nếu bảng còn trống"""
+    db = SessionLocal()
+    try:
+        filled = MeterReadingService.backfill_latest_if_empty(db)
+        if filled > 0:
+            print(f"[INFO] Đã dựng chỉ số mới nhất cho {filled} căn hộ.")
+    except Exception as e:
+        print(f"[ERROR] Không thể dựng METER_READING_LATEST: {e}")
     finally:
         db.close()
 
@@ -105,9 +202,22 @@ def on_startup():
         print(f"[INFO] Models loaded: {len(Base.metadata.tables)} tables")
     except Exception as e:
         print(f"[ERROR] Database connection failed: {e}")
+    run_sync_revoked_tokens()
+    run_sync_principal_changes()
+    run_backfill_latest_readings()
+    run_reconcile_notification_counters()
+    run_resume_billing_jobs()
+    SepayWebhookService.start_workers()
     try:
         scheduler = BackgroundScheduler()
-        scheduler.add_job(run_auto_cancel_job, 'interval', minutes=1)
+        scheduler.add_job(run_auto_cancel_job, 'interval', seconds=TICK_SECONDS)
+        scheduler.add_job(run_resume_billing_jobs, 'interval', minutes=5)
+        scheduler.add_job(run_sync_revoked_tokens, 'interval', minutes=1)
+        scheduler.add_job(run_sync_principal_changes, 'interval', minutes=1)
+        scheduler.add_job(run_sepay_reconciliation, 'interval', minutes=30)
+        scheduler.add_job(run_reconcile_notification_counters, 'interval', minutes=10)
+        # Giờ thấp điểm
+        scheduler.add_job(run_archive_notifications, 'cron', hour=3)
         scheduler.start()
         print("[INFO] --> Đã khởi động bộ quét giao dịch quá hạn.")
     except Exception as e:
@@ -0,0 +1,108 @@
+"""
+Cấu hình chung cho pytest (chạy từ thư mục gốc repo: python -m pytest backend/tests).
+
+Các bài đo hiệu năng đánh dấu @pytest.mark.benchmark, chỉ chạy khi đặt RUN_BENCHMARKS=1.
+"""
+import os
+
+import pytest
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "benchmark: bài đo hiệu năng, chạy khi RUN_BENCHMARKS=1")
+
+
+def pytest_collection_modifyitems(config, items):
+    if os.getenv("RUN_BENCHMARKS"):
+        return
+    skip = pytest.mark.skip(reason="Đặt RUN_BENCHMARKS=1 để chạy bài đo hiệu năng")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture
+def engine():
+    """
+    SQLite trong bộ nhớ với đủ bảng của models (xem sqlite_compat); dùng chung 1 kết nối
+    cho mọi thread
+    """
+    from sqlalchemy.pool import StaticPool
+
+    from backend.tests import sqlite_compat
+
+    engine = sqlite_compat.create_engine(
+        "sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False}
+    )
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def concurrent_engine(tmp_path):
+    """
+    SQLite trên file cho test đồng thời: mỗi thread một kết nối, transaction mở bằng
+    BEGIN IMMEDIATE nên các transaction ghi chạy lần lượt (gần với khóa dòng của MySQL
+    nhưng thô hơn: khóa cả DB).
+    """
+    from backend.tests import sqlite_compat
+
+    engine = sqlite_compat.create_engine(
+        f"sqlite:///{tmp_path / 'test.db'}", serialized_writes=True, connect_args={"timeout": 30}
+    )
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture
+def concurrent_session_factory(concurrent_engine):
+    from sqlalchemy.orm import sessionmaker
+
+    return sessionmaker(bind=concurrent_engine, autoflush=False)
+
+
+@pytest.fixture
+def session_factory(engine):
+    from sqlalchemy.orm import sessionmaker
+
+    return sessionmaker(bind=engine, autoflush=False)
+
+
+@pytest.fixture
+def db(session_factory):
+    session = session_factory()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def count_queries(engine):
+    """count_queries() -> ngữ cảnh đếm số câu SQL gửi xuống DB"""
+    from contextlib import contextmanager
+
+    from sqlalchemy import event
+
+    @contextmanager
+    def counter():
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+    return counter
+
+
+@pytest.fixture
+def seed(db):
+    """seed(apartments=2) dựng dữ liệu mẫu trong db (xem factories.seed_apartments)"""
+    from backend.tests.factories import seed_apartments
+
+    return lambda apartments=2, building_id="B0": seed_apartments(db, apartments, building_id)
@@ -0,0 +1,43 @@
+"""Dữ liệu mẫu dùng chung cho các test"""
+from decimal import Decimal
+
+from sqlalchemy.orm import Session
+
+from backend.app import models
+from backend.app.models.meter_reading import MeterReading
+
+
+def seed_apartments(db: Session, apartments: int = 2, building_id: str = "B0") -> list[str]:
+    """
+    Tạo 1 tòa nhà, 1 kế toán (accountantID=1), các căn hộ A0000.. mỗi căn 1 cư dân
+    (tài khoản u0, u1, ...) kèm chỉ số tháng 3/2026; trả về danh sách apartmentID.
+    """
+    db.add(models.Account(username="acc", password="x", role="Accountant"))
+    db.add(models.Accountant(accountantID=1, username="acc"))
+    db.add(models.Building(buildingID=building_id))
+    db.add(models.ServiceFee(serviceName="Phí quản lý", unitPrice=100000, buildingID=building_id))
+    apartment_ids = []
+    for i in range(apartments):
+        apartment_id = f"A{i:04d}"
+        db.add(models.Apartment(apartmentID=apartment_id, buildingID=building_id))
+        db.add(models.Account(username=f"u{i}", password="x", role="Resident"))
+        db.add(models.Resident(apartmentID=apartment_id, fullName=f"Cư dân {i}", username=f"u{i}"))
+        db.add(MeterReading(
+            apartmentID=apartment_id, month=3, year=2026,
+            oldElectricity=Decimal("100"), newElectricity=Decimal(150 + i * 10),
+            oldWater=Decimal("10"), newWater=Decimal(20 + i)
+        ))
+        apartment_ids.append(apartment_id)
+    db.commit()
+    return apartment_ids
+
+
+def seed_bills(db: Session, apartment_id: str, amounts: list[int]) -> list[int]:
+    """Hóa đơn chưa thanh toán của căn hộ; trả về billID theo thứ tự amounts"""
+    bills = [
+        models.Bill(apartmentID=apartment_id, amount=amount, total=amount, typeOfBill="SERVICE", status="Unpaid")
+        for amount in amounts
+    ]
+    db.add_all(bills)
+    db.commit()
+    return [bill.billID for bill in bills]
@@ -0,0 +1,80 @@
+"""
+Cho phép chạy test trên SQLite trong bộ nhớ thay cho MySQL.
+
+- INSERT ... ON DUPLICATE KEY UPDATE (sqlalchemy.dialects.mysql.insert) được dịch sang
+  ON CONFLICT DO UPDATE của SQLite, cột stmt.inserted[...] thành excluded.<cột>.
+- INSERT có prefix_with("IGNORE", dialect="mysql") thành INSERT OR IGNORE.
+- Hàm IF(điều kiện, a, b) của MySQL được đăng ký cho mỗi kết nối SQLite.
+
+Khác biệt cần nhớ: SQLite tính mọi biểu thức SET trên dòng cũ, còn MySQL gán lần lượt từ
+trái sang phải (biểu thức sau thấy giá trị cột đã gán trước). Test phụ thuộc thứ tự gán
+phải kiểm tra riêng theo ngữ nghĩa của MySQL.
+"""
+import importlib
+import pkgutil
+
+import sqlalchemy
+from sqlalchemy import event, literal_column
+from sqlalchemy.dialects.mysql.dml import OnDuplicateClause
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql import coercions, elements, roles, visitors
+from sqlalchemy.sql.dml import Insert
+
+import backend.app.models as models
+
+for _module in pkgutil.iter_modules(models.__path__):
+    importlib.import_module(f"backend.app.models.{_module.name}")
+
+
+@compiles(Insert, "sqlite")
+def _insert_ignore(element, compiler, **kw):
+    if any(dialect == "mysql" and getattr(prefix, "text", None) == "IGNORE" for prefix, dialect in element._prefixes):
+        element = element.prefix_with("OR IGNORE")
+    return compiler.visit_insert(element, **kw)
+
+
+@compiles(OnDuplicateClause, "sqlite")
+def _on_duplicate_key_update(element, compiler, **kw):
+    statement = compiler.current_executable
+    updates = {
+        coercions.expect_as_key(roles.DMLColumnRole, key): value
+        for key, value in element.update.items()
+    }
+
+    def replace(clause, **_):
+        if isinstance(clause, elements.ColumnClause) and clause.table is element.inserted_alias:
+            return literal_column(f"excluded.{compiler.preparer.quote(clause.name)}")
+        return None
+
+    clauses = []
+    for key, value in updates.items():
+        column = statement.table.c[key]
+        if coercions._is_literal(value):
+            value = elements.BindParameter(None, value, type_=column.type)
+        else:
+            value = visitors.replacement_traverse(value, {}, replace)
+        clauses.append(f"{compiler.preparer.quote(column.name)} = {compiler.process(value.self_group(), use_schema=False)}")
+
+    # INSERT ... SELECT cần WHERE để SQLite không hiểu ON CONFLICT là mệnh đề JOIN
+    prefix = " WHERE true" if statement.select is not None and statement.select.whereclause is None else ""
+    return f"{prefix} ON CONFLICT DO UPDATE SET {', '.join(clauses)}"
+
+
+def create_engine(url: str, serialized_writes: bool = False, **kwargs):
+    """Engine SQLite đã tạo đủ bảng; serialized_writes: mở transaction bằng BEGIN IMMEDIATE"""
+    engine = sqlalchemy.create_engine(url, **kwargs)
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, _):
+        dbapi_connection.create_function("IF", 3, lambda condition, a, b: a if condition else b, deterministic=True)
+        if serialized_writes:
+            # Tự quản lý BEGIN thay cho pysqlite
+            dbapi_connection.isolation_level = None
+
+    if serialized_writes:
+        @event.listens_for(engine, "begin")
+        def on_begin(conn):
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+    models.Base.metadata.create_all(engine)
+    return engine
@@ -0,0 +1,67 @@
+"""
+Gạch nợ theo lô: số câu SQL mỗi lần gạch nợ không đổi theo số hóa đơn trong giao dịch,
+cho cả hai kênh (webhook SePay và kế toán xác nhận).
+"""
+from backend.app.models.bill import Bill
+from backend.app.models.payment_transaction import PaymentTransaction
+from backend.app.models.resident import Resident
+from backend.app.services.bill_settlement_service import BillSettlementService
+from backend.app.services.offline_payment_service import OfflinePaymentService
+from backend.app.services.payment_service import PaymentService
+from backend.tests.factories import seed_bills
+
+SIZES = (1, 5, 40)
+
+
+def open_transactions(db, seed) -> list[tuple[int, list[int]]]:
+    """Mỗi căn hộ một giao dịch Pending với SIZES[i] hóa đơn"""
+    transactions = []
+    for apartment_id, size in zip(seed(apartments=len(SIZES)), SIZES):
+        bill_ids = seed_bills(db, apartment_id, [10000 + i for i in range(size)])
+        resident_id = db.query(Resident.residentID).filter(Resident.apartmentID == apartment_id).scalar()
+        trans_id = PaymentService.create_qr_transaction(db, resident_id, bill_ids)["transaction_id"]
+        transactions.append((trans_id, bill_ids))
+    return transactions
+
+
+def amount_of(db, trans_id: int) -> float:
+    return float(db.get(PaymentTransaction, trans_id).amount)
+
+
+def test_settle_query_count_is_constant(db, seed, count_queries):
+    counts = []
+    for trans_id, bill_ids in open_transactions(db, seed):
+        with count_queries() as statements:
+            bill_types = BillSettlementService.settle(db, trans_id)
+        db.commit()
+        counts.append(len(statements))
+        assert bill_types == ["SERVICE"]
+        assert {status for status, in db.query(Bill.status).filter(Bill.billID.in_(bill_ids))} == {"Paid"}
+    assert counts == [2] * len(SIZES)
+
+
+def test_sepay_settlement_query_count_is_constant(db, seed, count_queries):
+    counts = []
+    for trans_id, bill_ids in open_transactions(db, seed):
+        amount = amount_of(db, trans_id)
+        with count_queries() as statements:
+            result = PaymentService.process_sepay_webhook(
+                db, f"BM{trans_id} thanh toan", amount, gateway_id=str(trans_id),
+                transaction_date="2026-03-10 08:00:00"
+            )
+        counts.append(len(statements))
+        assert result["success"], result
+        assert {status for status, in db.query(Bill.status).filter(Bill.billID.in_(bill_ids))} == {"Paid"}
+    assert len(set(counts)) == 1, counts
+
+
+def test_offline_settlement_query_count_is_constant(db, seed, count_queries):
+    counts = []
+    for trans_id, bill_ids in open_transactions(db, seed):
+        amount = amount_of(db, trans_id)
+        with count_queries() as statements:
+            result = OfflinePaymentService.process_webhook(db, f"BM{trans_id}", amount)
+        counts.append(len(statements))
+        assert result["success"], result
+        assert {status for status, in db.query(Bill.status).filter(Bill.billID.in_(bill_ids))} == {"Paid"}
+    assert len(set(counts)) == 1, counts
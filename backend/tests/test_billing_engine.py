@@ -0,0 +1,68 @@
+"""Tính lại hóa đơn (ghi đè) với hóa đơn đang được một giao dịch chờ thanh toán giữ chỗ"""
+from decimal import Decimal
+
+from backend.app.models.bill import Bill
+from backend.app.models.meter_reading import MeterReading
+from backend.app.models.payment_transaction import PaymentTransaction
+from backend.app.models.resident import Resident
+from backend.app.services.billing_engine import BillingEngine
+from backend.app.services.payment_core import OFFLINE, PaymentCore
+
+
+def _bills(db, apartment_id: str) -> dict:
+    return {bill.typeOfBill: bill for bill in db.query(Bill).filter(Bill.apartmentID == apartment_id)}
+
+
+def test_rebill_cancels_live_transaction_holding_changed_bills(db, seed):
+    apartment_id, other_id = seed(apartments=2)
+    BillingEngine.run(db, 3, 2026, accountant_id=1, deadline_day=10)
+    resident_id = db.query(Resident.residentID).filter(Resident.apartmentID == apartment_id).scalar()
+
+    bills = _bills(db, apartment_id)
+    held = [bills["ELECTRICITY"].billID, bills["SERVICE"].billID]
+    trans_id = PaymentCore.create_transaction(db, OFFLINE, resident_id, held)["transaction_id"]
+    other = _bills(db, other_id)
+    other_trans = PaymentCore.create_transaction(
+        db, OFFLINE, resident_id, [other["ELECTRICITY"].billID]
+    )["transaction_id"]
+
+    # Sửa chỉ số điện của căn hộ: chỉ hóa đơn điện đổi số tiền
+    db.query(MeterReading).filter(MeterReading.apartmentID == apartment_id)\
+        .update({MeterReading.newElectricity: Decimal("400")})
+    db.commit()
+    report = BillingEngine.run(db, 3, 2026, accountant_id=1, deadline_day=10, overwrite=True)
+    db.expire_all()
+
+    assert report["bills_updated"] == 1
+    assert report["transactions_cancelled"] == 1
+    assert db.get(PaymentTransaction, trans_id).status == "Expired"
+    # Mọi hóa đơn của giao dịch bị hủy được nhả, kể cả hóa đơn không đổi
+    assert {bill_id: db.get(Bill, bill_id).reservedTransID for bill_id in held} == {bill_id: None for bill_id in held}
+    # Giao dịch của căn hộ khác không bị ảnh hưởng
+    assert db.get(PaymentTransaction, other_trans).status == "Pending"
+    assert db.get(Bill, other["ELECTRICITY"].billID).reservedTransID == other_trans
+
+    # QR cũ trả đủ số tiền cũ không gạch nợ hóa đơn đã đổi
+    old_amount = db.get(PaymentTransaction, trans_id).amount
+    assert PaymentCore.settle(db, OFFLINE, f"BM{trans_id}", old_amount)["success"] is False
+    assert db.get(Bill, held[0]).status == "Unpaid"
+
+    # Tạo giao dịch mới với số tiền mới ngay, không phải chờ hết hạn
+    result = PaymentCore.create_transaction(db, OFFLINE, resident_id, held)
+    assert result["transaction_id"] != trans_id
+    assert result["total_amount"] == sum(db.get(Bill, bill_id).amount for bill_id in held)
+
+
+def test_rebill_without_changes_keeps_reservation(db, seed):
+    apartment_id, = seed(apartments=1)
+    BillingEngine.run(db, 3, 2026, accountant_id=1, deadline_day=10)
+    resident_id = db.query(Resident.residentID).filter(Resident.apartmentID == apartment_id).scalar()
+    bill_ids = [bill.billID for bill in _bills(db, apartment_id).values()]
+    trans_id = PaymentCore.create_transaction(db, OFFLINE, resident_id, bill_ids)["transaction_id"]
+
+    report = BillingEngine.run(db, 3, 2026, accountant_id=1, deadline_day=10, overwrite=True)
+    db.expire_all()
+
+    assert report["transactions_cancelled"] == 0
+    assert db.get(PaymentTransaction, trans_id).status == "Pending"
+    assert all(db.get(Bill, bill_id).reservedTransID == trans_id for bill_id in bill_ids)
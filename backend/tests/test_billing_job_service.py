@@ -0,0 +1,78 @@
+"""
+Job tính hóa đơn chế độ sharded chạy lại sau crash: shard đã commit hóa đơn nhưng chưa kịp
+ghi tiến độ được ghi nhận là xong, không làm cả job lỗi vì kỳ đã có hóa đơn.
+"""
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from backend.app import models
+from backend.app.models.bill import Bill
+from backend.app.models.billing_job import BillingJob
+from backend.app.services import billing_engine, billing_job_service
+from backend.app.services.billing_engine import BillingEngine
+from backend.app.services.billing_job_service import STALE_AFTER, BillingJobService
+
+
+@pytest.fixture(autouse=True)
+def worker_sessions(session_factory, monkeypatch):
+    monkeypatch.setattr(billing_job_service, "SessionLocal", session_factory)
+    monkeypatch.setattr(billing_engine, "SessionLocal", session_factory)
+
+
+def seed_two_buildings(db, seed) -> None:
+    seed(apartments=2, building_id="B0")
+    db.add(models.Building(buildingID="B1"))
+    db.add(models.Apartment(apartmentID="A1000", buildingID="B1"))
+    db.commit()
+
+
+def crashed_job(db, overwrite: bool = False) -> int:
+    """Job sharded đã bắt đầu rồi worker chết (heartbeat quá hạn, chưa shard nào ghi tiến độ)"""
+    started = datetime.now() - STALE_AFTER * 2
+    job = BillingJob(
+        month=3, year=2026, deadlineDay=10, overwrite=overwrite, accountantID=1, sharded=True,
+        status="RUNNING", lastApartmentID="", totalApartments=3,
+        startedDate=started, heartbeatAt=started, createdDate=started
+    )
+    db.add(job)
+    db.commit()
+    return job.jobID
+
+
+def test_resume_treats_committed_shard_as_done(db, seed):
+    seed_two_buildings(db, seed)
+    job_id = crashed_job(db)
+    # Shard B0 đã commit hóa đơn trước khi worker chết
+    BillingEngine.run(db, 3, 2026, accountant_id=1, deadline_day=10,
+                      apartment_ids=BillingEngine.apartments_of_buildings(["B0"]))
+
+    BillingJobService.execute(job_id)
+
+    db.expire_all()
+    job = db.get(BillingJob, job_id)
+    assert job.status == "SUCCEEDED", job.error
+    shards = json.loads(job.report)["shards"]
+    assert shards["B0"]["ok"] and shards["B0"].get("recovered")
+    assert shards["B1"]["ok"] and not shards["B1"].get("recovered")
+    assert job.processedApartments == 3
+    # Không tạo trùng hóa đơn cho B0
+    assert db.query(Bill).filter(Bill.apartmentID == "A0000").count() == 3
+    assert job.billsCreated == db.query(Bill).count()
+
+
+def test_resume_still_fails_on_bills_from_before_the_job(db, seed):
+    seed_two_buildings(db, seed)
+    BillingEngine.run(db, 3, 2026, accountant_id=1, deadline_day=10,
+                      apartment_ids=BillingEngine.apartments_of_buildings(["B0"]))
+    db.query(Bill).update({Bill.createDate: datetime.now() - timedelta(days=1)})
+    db.commit()
+    job_id = crashed_job(db)
+
+    BillingJobService.execute(job_id)
+
+    db.expire_all()
+    job = db.get(BillingJob, job_id)
+    assert job.status == "FAILED"
+    assert not json.loads(job.report)["shards"]["B0"]["ok"]
@@ -0,0 +1,108 @@
+"""
+METER_READING_LATEST phải giữ đúng kỳ mới nhất, kể cả khi qua năm.
+
+ON DUPLICATE KEY UPDATE của MySQL gán lần lượt từ trái sang phải; SQLite (và
+sqlite_compat) tính mọi phép gán trên dòng cũ nên không tái hiện được lỗi thứ tự gán.
+mysql_upsert() dưới đây chạy từng phép gán của câu lệnh thật bằng một câu UPDATE riêng
+theo đúng thứ tự, tức đúng ngữ nghĩa của MySQL.
+"""
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import insert, literal, update
+from sqlalchemy.sql import visitors
+
+from backend.app.models.meter_reading_latest import MeterReadingLatest
+from backend.app.services.meter_reading_service import MeterReadingService, READING_COLUMNS
+
+
+class _Capture:
+    def __init__(self):
+        self.calls = []
+
+    def execute(self, stmt, params=None):
+        self.calls.append((stmt, params))
+
+
+def mysql_upsert(db, rows: list[dict]) -> None:
+    """refresh_latest(rows) theo ngữ nghĩa ON DUPLICATE KEY UPDATE của MySQL"""
+    capture = _Capture()
+    MeterReadingService.refresh_latest(capture, rows)
+    (stmt, params), = capture.calls
+    clause = stmt._post_values_clause
+    table = stmt.table
+
+    for row in params:
+        key = table.c.apartmentID == row["apartmentID"]
+        if db.execute(table.select().where(key)).first() is None:
+            db.execute(insert(table).values(row))
+            continue
+
+        def bind_inserted(element, **_):
+            if getattr(element, "table", None) is clause.inserted_alias:
+                return literal(row[element.name], type_=table.c[element.name].type)
+            return None
+
+        for column, value in clause.update.items():
+            db.execute(update(table).where(key).values({column: visitors.replacement_traverse(value, {}, bind_inserted)}))
+    db.commit()
+
+
+def _row(apartment_id: str, month: int, year: int, base: int) -> dict:
+    return {
+        "apartmentID": apartment_id, "month": month, "year": year,
+        "oldElectricity": Decimal(base), "newElectricity": Decimal(base + 50),
+        "oldWater": Decimal(base // 10), "newWater": Decimal(base // 10 + 5),
+    }
+
+
+@pytest.fixture
+def apartment(seed):
+    return seed(apartments=1)[0]
+
+
+def _latest(db, apartment_id: str) -> MeterReadingLatest:
+    db.expire_all()
+    return db.get(MeterReadingLatest, apartment_id)
+
+
+def test_assignment_order_sets_month_before_year():
+    capture = _Capture()
+    MeterReadingService.refresh_latest(capture, [_row("A0000", 1, 2026, 100)])
+    (stmt, _), = capture.calls
+    order = [getattr(column, "key", column) for column in stmt._post_values_clause.update]
+    assert order[-2:] == ["month", "year"]
+    assert set(order[:-2]) == set(READING_COLUMNS) | {"updatedAt"}
+
+
+def test_newer_period_across_year_boundary(db, apartment):
+    mysql_upsert(db, [_row(apartment, 12, 2025, 100)])
+    mysql_upsert(db, [_row(apartment, 1, 2026, 150)])
+
+    latest = _latest(db, apartment)
+    assert (latest.month, latest.year) == (1, 2026)
+    assert latest.newElectricity == Decimal(200)
+
+    # Kỳ 2/2026 lấy thẳng từ index, không phải tra lịch sử
+    baseline = MeterReadingService.baselines(db, [apartment], 2, 2026)[apartment]
+    assert (baseline["month"], baseline["year"]) == (1, 2026)
+    assert baseline["newElectricity"] == Decimal(200)
+
+
+def test_older_period_does_not_move_index_back(db, apartment):
+    mysql_upsert(db, [_row(apartment, 1, 2026, 150)])
+    mysql_upsert(db, [_row(apartment, 12, 2025, 100)])
+    mysql_upsert(db, [_row(apartment, 6, 2025, 50)])
+
+    latest = _latest(db, apartment)
+    assert (latest.month, latest.year) == (1, 2026)
+    assert latest.newElectricity == Decimal(200)
+
+
+def test_same_period_overwrites_readings(db, apartment):
+    mysql_upsert(db, [_row(apartment, 12, 2025, 100)])
+    mysql_upsert(db, [_row(apartment, 12, 2025, 120)])
+
+    latest = _latest(db, apartment)
+    assert (latest.month, latest.year) == (12, 2025)
+    assert latest.newElectricity == Decimal(170)
@@ -0,0 +1,97 @@
+"""
+Bộ đếm thông báo chưa đọc: cư dân chưa có dòng bộ đếm được tạo với số đếm đầy đủ, cache
+chỉ đổi khi transaction commit, lượt đọc không commit thay bên gọi.
+"""
+from datetime import datetime
+
+import pytest
+
+from backend.app.models.notification import Notification
+from backend.app.models.notification_broadcast import NotificationBroadcast
+from backend.app.models.notification_counter import NotificationCounter
+from backend.app.models.resident import Resident
+from backend.app.services.notification_counter_service import NotificationCounterService
+from backend.app.services.notification_service import NotificationService
+
+
+@pytest.fixture(autouse=True)
+def empty_cache(monkeypatch):
+    monkeypatch.setattr(NotificationCounterService, "_counters", {})
+    monkeypatch.setattr(NotificationCounterService, "_broadcast_total", (0.0, 0))
+
+
+def notification(resident_id: int, title: str = "Thông báo") -> dict:
+    return {"residentID": resident_id, "title": title, "type": "GENERAL", "isRead": False,
+            "createdDate": datetime.now()}
+
+
+def seed_unread(db, seed, count: int) -> int:
+    """Cư dân có count thông báo chưa đọc, chưa có dòng bộ đếm"""
+    seed(apartments=1)
+    resident_id = db.query(Resident.residentID).scalar()
+    db.add_all([Notification(**notification(resident_id, f"Cũ {i}")) for i in range(count)])
+    db.commit()
+    return resident_id
+
+
+def stored(db, resident_id: int) -> tuple:
+    db.expire_all()
+    row = db.get(NotificationCounter, resident_id)
+    return row and (row.unreadCount, row.broadcastReadCount)
+
+
+def test_new_notification_seeds_missing_counter_with_full_count(db, seed):
+    resident_id = seed_unread(db, seed, 5)
+
+    NotificationService.insert_many(db, [notification(resident_id)])
+    db.commit()
+
+    assert stored(db, resident_id) == (6, 0)
+    assert NotificationCounterService.get_unread(db, resident_id) == 6
+
+    NotificationService.insert_many(db, [notification(resident_id), notification(resident_id)])
+    db.commit()
+    assert stored(db, resident_id) == (8, 0)
+    assert NotificationCounterService.get_unread(db, resident_id) == 8
+
+
+def test_reads_on_missing_counter_keep_full_count(db, seed):
+    resident_id = seed_unread(db, seed, 5)
+    db.add_all([NotificationBroadcast(title=f"Chung {i}", createdDate=datetime.now()) for i in range(3)])
+    db.commit()
+    first = db.query(Notification.notificationID).filter(Notification.residentID == resident_id).first()[0]
+
+    NotificationService.mark_read(db, resident_id, first)
+    assert stored(db, resident_id) == (4, 0)
+
+    db.query(NotificationCounter).delete()
+    db.commit()
+    broadcast_id = db.query(NotificationBroadcast.broadcastID).first()[0]
+    NotificationService.mark_read(db, resident_id, -broadcast_id)
+    assert stored(db, resident_id) == (4, 1)
+    assert NotificationCounterService.get_unread(db, resident_id) == 4 + 2
+
+
+def test_rolled_back_change_leaves_cache_untouched(db, seed):
+    resident_id = seed_unread(db, seed, 5)
+    assert NotificationCounterService.get_unread(db, resident_id) == 5
+
+    NotificationService.insert_many(db, [notification(resident_id)])
+    db.rollback()
+    assert NotificationCounterService.get_unread(db, resident_id) == 5
+    assert stored(db, resident_id) == (5, 0)
+
+    NotificationService.insert_many(db, [notification(resident_id)])
+    db.commit()
+    assert NotificationCounterService.get_unread(db, resident_id) == 6
+
+
+def test_counter_seed_does_not_commit_caller_work(db, seed):
+    resident_id = seed_unread(db, seed, 2)
+    db.add(Notification(**notification(resident_id, "Chưa commit")))
+
+    assert NotificationCounterService.get_unread(db, resident_id) == 2
+    db.rollback()
+
+    assert stored(db, resident_id) == (2, 0)
+    assert db.query(Notification).filter(Notification.title == "Chưa commit").count() == 0
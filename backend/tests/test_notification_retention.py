@@ -0,0 +1,57 @@
+"""Danh sách thông báo đọc tiếp vào bảng lưu trữ ngay sau lượt lưu trữ, không phụ thuộc cache"""
+from datetime import datetime, timedelta
+
+from backend.app.models.notification import Notification
+from backend.app.models.notification_archive import NotificationArchive
+from backend.app.models.resident import Resident
+from backend.app.services.notification_retention_service import NotificationRetentionService
+from backend.app.services.notification_service import NotificationService
+
+
+def _seed_feed(db, seed) -> int:
+    seed(apartments=1)
+    resident_id = db.query(Resident.residentID).scalar()
+    now = datetime.now().replace(microsecond=0)
+    for days in (1, 2, 3, 400, 401, 402):
+        db.add(Notification(
+            residentID=resident_id, title=f"Thông báo {days}", type="GENERAL",
+            isRead=days > 100, createdDate=now - timedelta(days=days)
+        ))
+    db.commit()
+    return resident_id
+
+
+def _feed(db, resident_id: int, limit: int) -> list[str]:
+    titles, cursor = [], None
+    while True:
+        page = NotificationService.list_for_resident(db, resident_id, limit=limit, cursor=cursor)
+        titles += [n.title for n in page]
+        if len(page) < limit:
+            return titles
+        cursor = (page[-1].createdDate, page[-1].notificationID)
+
+
+def test_feed_reads_archive_right_after_archiving(db, seed, monkeypatch):
+    monkeypatch.setenv("NOTIFICATION_RETENTION_DAYS", "180")
+    monkeypatch.setattr("backend.app.services.notification_retention_service.BATCH_PAUSE_SECONDS", 0)
+    resident_id = _seed_feed(db, seed)
+    before = _feed(db, resident_id, limit=2)
+
+    metrics = NotificationRetentionService.run(db)
+
+    assert metrics["archived"] == 3
+    assert db.query(NotificationArchive).count() == 3
+    assert _feed(db, resident_id, limit=2) == before
+    assert len(before) == 6
+
+
+def test_recent_page_skips_archive_queries(db, seed, count_queries, monkeypatch):
+    monkeypatch.setenv("NOTIFICATION_RETENTION_DAYS", "180")
+    monkeypatch.setattr("backend.app.services.notification_retention_service.BATCH_PAUSE_SECONDS", 0)
+    resident_id = _seed_feed(db, seed)
+    NotificationRetentionService.run(db)
+
+    with count_queries() as statements:
+        page = NotificationService.list_for_resident(db, resident_id, limit=2)
+    assert [n.title for n in page] == ["Thông báo 1", "Thông báo 2"]
+    assert not any("NOTIFICATION_ARCHIVE" in statement for statement in statements)
@@ -0,0 +1,98 @@
+"""
+Job hủy giao dịch quá hạn: leader nhặt cả giao dịch tạo / mở lại ở worker khác (không gọi
+schedule() trong process leader), kể cả giao dịch mở lại giữ transID cũ.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from backend.app.models.payment_transaction import PaymentTransaction
+from backend.app.models.resident import Resident
+from backend.app.services import payment_core, payment_expiry_service
+from backend.app.services.payment_expiry_service import PAYMENT_TIMEOUT, PaymentExpiryService
+from backend.app.services.payment_service import PaymentService
+from backend.tests.factories import seed_bills
+
+
+class Clock(datetime):
+    current = datetime(2026, 3, 10, 8, 0)
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls.current
+
+    @classmethod
+    def advance(cls, delta: timedelta) -> None:
+        cls.current += delta
+
+
+@pytest.fixture
+def leader(engine, session_factory, monkeypatch):
+    monkeypatch.setattr(Clock, "current", Clock.current)
+    monkeypatch.setattr(payment_expiry_service, "datetime", Clock)
+    monkeypatch.setattr(payment_core, "datetime", Clock)
+    monkeypatch.setattr(payment_expiry_service, "SessionLocal", session_factory)
+    monkeypatch.setattr(payment_expiry_service, "get_engine", lambda: engine)
+    # Giao dịch được tạo ở worker khác: process này không được báo qua schedule()
+    monkeypatch.setattr(PaymentExpiryService, "schedule", staticmethod(lambda trans_id, created_date: None))
+    yield
+    PaymentExpiryService._release_leadership()
+
+
+def status_of(db, trans_id: int) -> str:
+    db.expire_all()
+    return db.get(PaymentTransaction, trans_id).status
+
+
+def test_transaction_reopened_in_another_worker_expires(db, seed, leader):
+    apartment_id, = seed(apartments=1)
+    bill_ids = seed_bills(db, apartment_id, [100000])
+    resident_id = db.query(Resident.residentID).scalar()
+
+    trans_id = PaymentService.create_qr_transaction(db, resident_id, bill_ids)["transaction_id"]
+    assert PaymentExpiryService.tick() == 0
+    Clock.advance(PAYMENT_TIMEOUT + timedelta(minutes=1))
+    assert PaymentExpiryService.tick() == 1
+    assert status_of(db, trans_id) == "Expired"
+
+    # Nhiều giao dịch mới sau đó: transID của giao dịch cũ tụt xa khỏi các id mới nhất
+    db.add_all([
+        PaymentTransaction(residentID=resident_id, amount=1000, status="Success", createdDate=Clock.now())
+        for _ in range(300)
+    ])
+    db.commit()
+    Clock.advance(timedelta(minutes=4))
+    assert PaymentExpiryService.tick() == 0
+
+    # Cư dân mở lại QR ở worker khác: cùng transID, createdDate mới
+    assert PaymentService.create_qr_transaction(db, resident_id, bill_ids)["transaction_id"] == trans_id
+    assert status_of(db, trans_id) == "Pending"
+    Clock.advance(timedelta(seconds=5))
+    assert PaymentExpiryService.tick() == 0
+
+    Clock.advance(PAYMENT_TIMEOUT)
+    assert PaymentExpiryService.tick() == 1
+    assert status_of(db, trans_id) == "Expired"
+
+
+def test_stale_deadline_does_not_expire_reopened_transaction(db, seed, leader):
+    apartment_id, = seed(apartments=1)
+    bill_ids = seed_bills(db, apartment_id, [100000])
+    resident_id = db.query(Resident.residentID).scalar()
+
+    trans_id = PaymentService.create_qr_transaction(db, resident_id, bill_ids)["transaction_id"]
+    assert PaymentExpiryService.tick() == 0
+
+    # Mở lại ngay trước hạn cũ (giao dịch đã bị hủy ở nơi khác)
+    Clock.advance(PAYMENT_TIMEOUT - timedelta(seconds=10))
+    db.query(PaymentTransaction).filter(PaymentTransaction.transID == trans_id).update({"status": "Expired"})
+    db.commit()
+    assert PaymentService.create_qr_transaction(db, resident_id, bill_ids)["transaction_id"] == trans_id
+
+    # Hạn cũ tới: không hủy vì createdDate đã đổi; hạn mới vẫn còn trong heap
+    Clock.advance(timedelta(seconds=20))
+    assert PaymentExpiryService.tick() == 0
+    assert status_of(db, trans_id) == "Pending"
+    Clock.advance(PAYMENT_TIMEOUT)
+    assert PaymentExpiryService.tick() == 1
+    assert status_of(db, trans_id) == "Expired"
@@ -0,0 +1,74 @@
+"""Link ảnh QR thanh toán: chỉ mở được bằng link có chữ ký, còn hạn, đúng giao dịch"""
+import time
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from backend.app.api.payments import get_payment_qr
+from backend.app.core.security import sign_link
+from backend.app.models.resident import Resident
+from backend.app.services import payment_core
+from backend.app.services.payment_core import PaymentCore
+from backend.app.services.payment_service import PaymentService
+from backend.tests.factories import seed_bills
+
+
+@pytest.fixture(autouse=True)
+def bank_account(monkeypatch, tmp_path):
+    monkeypatch.setattr(payment_core, "_bank_config", {
+        "bank_id": "MB", "bank_account": "0123456789", "template": "compact2"
+    })
+    monkeypatch.setenv("QR_CACHE_DIR", str(tmp_path))
+
+
+def request() -> Request:
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": [], "query_string": b""})
+
+
+def open_transaction(db, seed) -> tuple[int, dict]:
+    apartment_id, = seed(apartments=1)
+    bill_ids = seed_bills(db, apartment_id, [100000])
+    resident_id = db.query(Resident.residentID).scalar()
+    result = PaymentService.create_qr_transaction(db, resident_id, bill_ids)
+    url = urlparse(result["qr_url"])
+    assert url.path == f"{payment_core.QR_IMAGE_PATH}/{result['transaction_id']}"
+    return result["transaction_id"], {key: values[0] for key, values in parse_qs(url.query).items()}
+
+
+def test_signed_link_serves_image(db, seed):
+    trans_id, params = open_transaction(db, seed)
+
+    response = get_payment_qr(
+        trans_id, request(), expires=int(params["expires"]), signature=params["signature"],
+        image_format="png", db=db
+    )
+
+    assert response.status_code == 200
+    assert response.body.startswith(b"\x89PNG")
+
+
+def test_link_of_another_transaction_is_rejected(db, seed):
+    trans_id, params = open_transaction(db, seed)
+
+    with pytest.raises(HTTPException) as error:
+        get_payment_qr(
+            trans_id + 1, request(), expires=int(params["expires"]), signature=params["signature"],
+            image_format="png", db=db
+        )
+    assert error.value.status_code == 403
+
+
+def test_unsigned_or_expired_link_is_rejected(db, seed):
+    trans_id, params = open_transaction(db, seed)
+    expired = int(time.time()) - 1
+
+    for expires, signature in (
+        (int(params["expires"]) + 60, params["signature"]),
+        (expired, sign_link(PaymentCore.qr_resource(trans_id), expired)),
+        (int(params["expires"]), "0" * 64),
+    ):
+        with pytest.raises(HTTPException) as error:
+            get_payment_qr(trans_id, request(), expires=expires, signature=signature, image_format="png", db=db)
+        assert error.value.status_code == 403
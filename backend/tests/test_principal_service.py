@@ -0,0 +1,81 @@
+"""
+Claim residentID trong token: process sửa cư dân bỏ claim cũ ngay, process khác bỏ sau lần
+đồng bộ kế tiếp (mốc thay đổi lưu trong DB), không phải đợi token hết hạn.
+"""
+import time
+
+import pytest
+
+from backend.app.models.resident import Resident
+from backend.app.schemas.auth import TokenData
+from backend.app.services.principal_service import PrincipalService
+
+
+@pytest.fixture(autouse=True)
+def fresh_process(monkeypatch):
+    monkeypatch.setattr(PrincipalService, "_contexts", {})
+    monkeypatch.setattr(PrincipalService, "_changed", {})
+
+
+def other_process(monkeypatch) -> None:
+    """Trạng thái trong bộ nhớ của một worker khác (chưa biết gì về thay đổi)"""
+    monkeypatch.setattr(PrincipalService, "_contexts", {})
+    monkeypatch.setattr(PrincipalService, "_changed", {})
+
+
+def move_resident(db, username: str, to_username: str) -> int:
+    """Gán hồ sơ cư dân của username sang tài khoản khác; trả về residentID"""
+    resident = db.query(Resident).filter(Resident.username == username).one()
+    resident.username = to_username
+    db.commit()
+    PrincipalService.invalidate(db, username, to_username)
+    return resident.residentID
+
+
+def test_stale_claim_rejected_in_other_process_after_sync(db, seed, monkeypatch):
+    seed(apartments=2)
+    resident_id = db.query(Resident.residentID).filter(Resident.username == "u0").scalar()
+    token = TokenData(username="u0", role="Resident", residentID=resident_id, iat=int(time.time()) - 60)
+    assert PrincipalService.resident_id(db, token) == resident_id
+
+    db.query(Resident).filter(Resident.username == "u1").delete()
+    db.commit()
+    move_resident(db, "u0", "u1")
+    # Process đã sửa: bỏ claim ngay
+    assert PrincipalService.resident_id(db, token) is None
+
+    other_process(monkeypatch)
+    assert PrincipalService.resident_id(db, token) == resident_id
+    assert PrincipalService.sync(db) == 2
+    assert PrincipalService.resident_id(db, token) is None
+    assert PrincipalService.resident_id(db, TokenData(username="u1", role="Resident", iat=int(time.time()) - 60)) \
+        == resident_id
+
+
+def test_tokens_issued_after_change_keep_using_claim(db, seed, count_queries):
+    seed(apartments=1)
+    resident_id = move_resident(db, "u0", "u0")
+    PrincipalService.sync(db)
+
+    token = TokenData(username="u0", role="Resident", residentID=resident_id, iat=int(time.time()) + 1)
+    with count_queries() as statements:
+        assert PrincipalService.resident_id(db, token) == resident_id
+    assert statements == []
+
+
+def test_sync_drops_cached_context_of_changed_accounts(db, seed, monkeypatch):
+    seed(apartments=2)
+    token = TokenData(username="u0", role="Resident", iat=int(time.time()) - 60)
+    assert PrincipalService.get(db, token).apartmentID == "A0000"
+
+    # Worker khác chuyển cư dân sang căn hộ khác
+    cached = dict(PrincipalService._contexts)
+    db.query(Resident).filter(Resident.username == "u0").update({Resident.apartmentID: "A0001"})
+    db.commit()
+    PrincipalService.invalidate(db, "u0")
+    other_process(monkeypatch)
+    monkeypatch.setattr(PrincipalService, "_contexts", cached)
+    assert PrincipalService.get(db, token).apartmentID == "A0000"
+
+    PrincipalService.sync(db)
+    assert PrincipalService.get(db, token).apartmentID == "A0001"
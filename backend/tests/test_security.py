@@ -0,0 +1,108 @@
+"""
+Cache token đã xác thực: lần lặp lại không verify chữ ký, token bị thu hồi / hết hạn / ký
+bằng khóa đã bỏ vẫn bị từ chối; bài đo chi phí xác thực mỗi request trước và sau cache.
+"""
+import time
+import timeit
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import pytest
+from jose import jwt
+
+from backend.app.core import security
+from backend.app.core.db import get_secret_key
+from backend.app.core.security import ALGORITHM, create_access_token, decode_access_token
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache(monkeypatch):
+    monkeypatch.setattr(security, "_token_cache", OrderedDict())
+    monkeypatch.setattr(security, "_revoked", frozenset())
+    monkeypatch.setattr(security, "_secret_keys", None)
+    yield
+    monkeypatch.undo()
+    security._secret_keys = None
+
+
+@pytest.fixture
+def verify_calls(monkeypatch):
+    calls = []
+    verify = security._verify
+    monkeypatch.setattr(security, "_verify", lambda token: calls.append(token) or verify(token))
+    return calls
+
+
+def test_repeated_token_is_verified_once(verify_calls):
+    token = create_access_token("u0", "Resident", resident_id=7)
+
+    claims = [decode_access_token(token) for _ in range(3)]
+
+    assert verify_calls == [token]
+    assert claims[0]["residentID"] == 7 and claims[0] == claims[2]
+    # Bên gọi sửa dict trả về không làm hỏng cache
+    claims[0]["role"] = "Admin"
+    assert decode_access_token(token)["role"] == "Resident"
+
+
+def test_revoked_account_rejected_on_cache_hit(verify_calls):
+    token = create_access_token("u0", "Resident")
+    assert decode_access_token(token)
+
+    security.revoke_username("u0")
+
+    assert decode_access_token(token) is None
+    assert verify_calls == [token]
+    security.set_revoked_usernames([])
+    assert decode_access_token(token)
+
+
+def test_expired_cache_entry_rejected():
+    token = jwt.encode(
+        {"username": "u0", "role": "Resident", "exp": datetime.utcnow() + timedelta(seconds=2)},
+        get_secret_key(), algorithm=ALGORITHM
+    )
+    assert decode_access_token(token)
+    key, (claims, expires) = next(iter(security._token_cache.items()))
+    security._token_cache[key] = (claims, time.time() - 1)
+
+    assert decode_access_token(token) is None
+    assert not security._token_cache
+
+
+def test_rotation_accepts_previous_key_until_dropped(monkeypatch):
+    old_token = create_access_token("u0", "Resident")
+
+    monkeypatch.setenv("SECRET_KEY", "rotated-secret-key")
+    monkeypatch.setenv("SECRET_KEY_PREVIOUS", "test-secret-key")
+    security.rotate_secret_keys()
+    assert decode_access_token(old_token)["username"] == "u0"
+    assert jwt.decode(create_access_token("u1", "Resident"), "rotated-secret-key", algorithms=[ALGORITHM])
+
+    monkeypatch.delenv("SECRET_KEY_PREVIOUS")
+    security.rotate_secret_keys()
+    assert decode_access_token(old_token) is None
+
+
+@pytest.mark.benchmark
+def test_auth_overhead_per_request():
+    """Chi phí decode mỗi request: verify mọi lần (như trước) / cache trúng / cache trượt"""
+    tokens = [create_access_token(f"u{i}", "Resident", resident_id=i) for i in range(1000)]
+    token = tokens[0]
+    decode_access_token(token)
+    rounds = 5000
+
+    def uncached():
+        # Đường cũ: đọc SECRET_KEY từ environment rồi verify chữ ký ở mọi request
+        jwt.decode(token, get_secret_key(), algorithms=[ALGORITHM])
+
+    before = min(timeit.repeat(uncached, number=rounds, repeat=3)) / rounds
+    hit = min(timeit.repeat(lambda: decode_access_token(token), number=rounds, repeat=3)) / rounds
+    started = time.perf_counter()
+    for other in tokens[1:]:
+        decode_access_token(other)
+    miss = (time.perf_counter() - started) / (len(tokens) - 1)
+    print(f"\nXác thực mỗi request: trước {before * 1e6:.1f}us, cache trúng {hit * 1e6:.1f}us, "
+          f"cache trượt {miss * 1e6:.1f}us")
+
+    assert hit * 5 < before
@@ -0,0 +1,186 @@
+"""
+Đối soát sao kê SePay với server giả lập chạy cục bộ: đọc tiếp theo since-cursor, theo trang,
+thử lại khi SePay lỗi tạm thời, bù webhook thất lạc và báo cáo chênh lệch.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from backend.app.models.bill import Bill
+from backend.app.models.payment_transaction import PaymentTransaction
+from backend.app.models.resident import Resident
+from backend.app.models.sepay_webhook_event import SepayWebhookEvent
+from backend.app.services import sepay_webhook_service
+from backend.app.services.payment_service import PaymentService
+from backend.app.services.sepay_reconciliation_service import SepayReconciliationService
+from backend.app.services.sepay_webhook_service import SepayWebhookService
+from backend.app.utils import sepay_utils
+from backend.tests.factories import seed_bills
+
+
+class StubSepay:
+    """API /transactions/list của SePay: lọc id >= since_id, tối đa limit dòng mỗi trang"""
+
+    def __init__(self):
+        self.lines = []
+        self.requests = []
+        # Số lần trả 503 trước khi trả dữ liệu
+        self.failures = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = {key: values[0] for key, values in parse_qs(url.query).items()}
+                stub.requests.append((url.path, params))
+                if stub.failures:
+                    stub.failures -= 1
+                    self.send_response(503)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                since_id = int(params.get("since_id", 0))
+                page = [line for line in stub.lines if line["id"] >= since_id][:int(params.get("limit", 5000))]
+                body = json.dumps({"status": 200, "messages": {"success": True}, "transactions": page}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def add(self, sepay_id: int, content: str, amount_in: float = 0, amount_out: float = 0) -> None:
+        self.lines.append({
+            "id": sepay_id, "bank_brand_name": "MBBank", "account_number": "0123456789",
+            "transaction_date": "2026-03-10 08:00:00", "amount_out": str(amount_out),
+            "amount_in": str(amount_in), "accumulated": "0", "transaction_content": content,
+            "reference_number": f"FT{sepay_id}", "code": None, "sub_account": None,
+        })
+
+    def pages(self) -> list:
+        return [params.get("since_id") for path, params in self.requests if path == "/transactions/list"]
+
+
+@pytest.fixture
+def sepay(monkeypatch, session_factory):
+    stub = StubSepay()
+    thread = threading.Thread(target=stub.server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(sepay_utils, "SEPAY_API_URL", stub.url)
+    monkeypatch.setattr(sepay_webhook_service, "SessionLocal", session_factory)
+    yield stub
+    stub.server.shutdown()
+    stub.server.server_close()
+
+
+def open_transaction(db, apartment_id: str, amounts: list[int]) -> tuple[int, float]:
+    bill_ids = seed_bills(db, apartment_id, amounts)
+    resident_id = db.query(Resident.residentID).filter(Resident.apartmentID == apartment_id).scalar()
+    trans_id = PaymentService.create_qr_transaction(db, resident_id, bill_ids)["transaction_id"]
+    return trans_id, float(db.get(PaymentTransaction, trans_id).amount)
+
+
+def test_reconcile_settles_missed_webhooks_and_reports_discrepancies(db, seed, sepay):
+    first, second, third = seed(apartments=3)
+    missed, missed_amount = open_transaction(db, first, [100000, 50000])
+    delivered, delivered_amount = open_transaction(db, second, [70000])
+    short, short_amount = open_transaction(db, third, [90000])
+
+    sepay.add(101, f"BM{missed} thanh toan", missed_amount)
+    sepay.add(102, f"BM{delivered} thanh toan", delivered_amount)
+    sepay.add(103, "chuyen tien nha", 20000)
+    sepay.add(104, "BM999999 thanh toan", 30000)
+    sepay.add(105, f"BM{short} thanh toan", short_amount - 1000)
+    sepay.add(106, "rut tien", amount_out=500000)
+    # Webhook 102 đã về và đã gạch nợ
+    SepayWebhookService.receive(db, {
+        "id": 102, "content": f"BM{delivered} thanh toan", "transferAmount": delivered_amount,
+        "transactionDate": "2026-03-10 08:00:00",
+    })
+    SepayWebhookService.drain_once()
+    # SePay lỗi tạm thời: session dùng chung tự thử lại
+    sepay.failures = 1
+
+    result = SepayReconciliationService.run(db)
+
+    assert result["status"] == "SUCCEEDED", result["error"]
+    assert (result["since_id"], result["last_id"]) == (None, 106)
+    assert (result["fetched_lines"], result["matched_lines"], result["enqueued_lines"]) == (6, 3, 2)
+    assert sorted(entry["type"] for entry in result["report"]) == ["NO_CODE", "UNDERPAID", "UNKNOWN_TRANSACTION"]
+    assert result["discrepancies"] == 3
+    assert len(sepay.pages()) == 2
+
+    # Khoản thiếu tiền cũng vào inbox và bị worker từ chối như webhook thường
+    assert SepayWebhookService.drain_once() == 2
+    db.expire_all()
+    assert db.get(SepayWebhookEvent, 105).status == "REJECTED"
+    statuses = dict(db.query(PaymentTransaction.transID, PaymentTransaction.status))
+    assert (statuses[missed], statuses[delivered], statuses[short]) == ("Success", "Success", "Failed")
+    assert [status for status, in db.query(Bill.status).filter(Bill.apartmentID == first)] == ["Paid", "Paid"]
+
+
+def test_reconcile_continues_from_last_cursor(db, seed, sepay):
+    apartment_id, = seed(apartments=1)
+    trans_id, amount = open_transaction(db, apartment_id, [100000])
+    sepay.add(201, "chuyen tien nha", 10000)
+    sepay.add(202, "rut tien", amount_out=10000)
+
+    first = SepayReconciliationService.run(db)
+    assert (first["last_id"], first["fetched_lines"], first["discrepancies"]) == (202, 2, 1)
+
+    sepay.add(203, f"BM{trans_id}", amount)
+    second = SepayReconciliationService.run(db)
+
+    assert sepay.pages() == [None, "203"]
+    assert (second["since_id"], second["last_id"]) == (203, 203)
+    assert (second["fetched_lines"], second["enqueued_lines"], second["discrepancies"]) == (1, 1, 0)
+    assert db.query(SepayWebhookEvent.sepayID).scalar() == 203
+
+    # Không có dòng mới: cursor giữ nguyên
+    third = SepayReconciliationService.run(db)
+    assert (third["since_id"], third["last_id"], third["fetched_lines"]) == (204, 203, 0)
+
+
+def test_reconcile_pages_through_statement(db, seed, sepay):
+    lines = 2 * sepay_utils.PAGE_LIMIT + 7
+    for sepay_id in range(1, lines + 1):
+        sepay.add(sepay_id, "rut tien", amount_out=1000)
+
+    result = SepayReconciliationService.run(db)
+
+    assert (result["fetched_lines"], result["last_id"], result["discrepancies"]) == (lines, lines, 0)
+    assert sepay.pages() == [None, str(sepay_utils.PAGE_LIMIT + 1), str(2 * sepay_utils.PAGE_LIMIT + 1)]
+
+
+@pytest.mark.benchmark
+def test_reconcile_day_statement_in_one_pass(db, seed, sepay):
+    """Sao kê một ngày 100k dòng: tiền vào có / không có mã, tiền ra"""
+    apartment_id, = seed(apartments=1)
+    trans_id, amount = open_transaction(db, apartment_id, [100000])
+    lines = 100_000
+    for sepay_id in range(1, lines):
+        if sepay_id % 3 == 0:
+            sepay.add(sepay_id, f"BM{1_000_000 + sepay_id} thanh toan", 50000)
+        elif sepay_id % 3 == 1:
+            sepay.add(sepay_id, "chuyen tien", 20000)
+        else:
+            sepay.add(sepay_id, "rut tien", amount_out=20000)
+    sepay.add(lines, f"BM{trans_id}", amount)
+
+    started = time.perf_counter()
+    result = SepayReconciliationService.run(db)
+    seconds = time.perf_counter() - started
+    print(f"\nĐối soát {result['fetched_lines']} dòng trong {seconds:.2f}s ({len(sepay.pages())} trang)")
+
+    assert result["status"] == "SUCCEEDED", result["error"]
+    assert (result["fetched_lines"], result["enqueued_lines"]) == (lines, 1)
+    assert len(sepay.pages()) == lines // sepay_utils.PAGE_LIMIT + 1
@@ -0,0 +1,202 @@
+"""
+Tải thử inbox webhook SePay: bắn song song nhiều webhook trùng (cùng id SePay, và một
+khoản chuyển thứ hai cùng mã BM) trong khi nhiều worker cùng xử lý; hóa đơn chỉ được
+gạch nợ đúng một lần. Lỗi DB khi gạch nợ đưa webhook về FAILED và được thử lại.
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from backend.app.models.bill import Bill
+from backend.app.models.notification import Notification
+from backend.app.models.payment_transaction import PaymentTransaction
+from backend.app.models.resident import Resident
+from backend.app.models.sepay_webhook_event import SepayWebhookEvent
+from backend.app.schemas.payment import SePayWebhookPayload
+from backend.app.services import sepay_webhook_service
+from backend.app.services.bill_settlement_service import BillSettlementService
+from backend.app.services.payment_service import PaymentService
+from backend.app.services.sepay_reconciliation_service import SepayReconciliationService
+from backend.app.services.sepay_webhook_service import MAX_ATTEMPTS, SepayWebhookService
+from backend.tests.factories import seed_apartments, seed_bills
+
+REQUESTS = 60
+WORKERS = 4
+
+
+def payload(sepay_id: int, content: str, amount: int) -> dict:
+    return SePayWebhookPayload(
+        id=sepay_id, gateway="MBBank", transactionDate="2026-03-10 08:00:00", accountNumber="0123456789",
+        content=content, transferType="in", transferAmount=amount, accumulated=0,
+        referenceCode=f"FT{sepay_id}", description=content
+    ).model_dump()
+
+
+@pytest.fixture
+def inbox(concurrent_session_factory, monkeypatch):
+    monkeypatch.setattr(sepay_webhook_service, "SessionLocal", concurrent_session_factory)
+    yield
+    SepayWebhookService.stop_workers()
+
+
+def drain(session_factory, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        db = session_factory()
+        try:
+            pending = db.query(SepayWebhookEvent).filter(
+                SepayWebhookEvent.status.in_(("RECEIVED", "PROCESSING"))
+            ).count()
+        finally:
+            db.close()
+        if not pending:
+            return
+        time.sleep(0.05)
+    raise AssertionError("Inbox chưa xử lý xong")
+
+
+def test_parallel_duplicate_webhooks_settle_exactly_once(concurrent_session_factory, inbox, monkeypatch):
+    db = concurrent_session_factory()
+    apartment_id, = seed_apartments(db, apartments=1)
+    bill_ids = seed_bills(db, apartment_id, [100000, 250000, 50000])
+    resident_id = db.query(Resident.residentID).scalar()
+    trans_id = PaymentService.create_qr_transaction(db, resident_id, bill_ids)["transaction_id"]
+    db.close()
+
+    settled = []
+    settle = BillSettlementService.settle
+    monkeypatch.setattr(BillSettlementService, "settle", staticmethod(
+        lambda session, tid: settled.append(tid) or settle(session, tid)
+    ))
+
+    # SePay gửi lại cùng id 9001 nhiều lần; 9002 là khoản chuyển thứ hai cùng mã BM
+    payloads = [payload(9001 if i % 3 else 9002, f"BM{trans_id} thanh toan", 400000) for i in range(REQUESTS)]
+    accepted = []
+    start = threading.Barrier(REQUESTS + WORKERS)
+
+    def webhook(data):
+        start.wait()
+        session = concurrent_session_factory()
+        try:
+            accepted.append(SepayWebhookService.receive(session, data))
+        finally:
+            session.close()
+
+    def worker():
+        start.wait()
+        SepayWebhookService._worker_loop()
+
+    threads = [threading.Thread(target=webhook, args=(data,)) for data in payloads]
+    workers = [threading.Thread(target=worker, daemon=True) for _ in range(WORKERS)]
+    started = time.perf_counter()
+    for thread in threads + workers:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    ack_seconds = time.perf_counter() - started
+    drain(concurrent_session_factory)
+    SepayWebhookService.stop_workers()
+    print(f"\n{REQUESTS} webhook ghi nhận trong {ack_seconds:.2f}s, xử lý xong sau {time.perf_counter() - started:.2f}s")
+
+    db = concurrent_session_factory()
+    try:
+        assert sorted(accepted) == [False] * (REQUESTS - 2) + [True] * 2
+        events = dict(db.query(SepayWebhookEvent.sepayID, SepayWebhookEvent.status))
+        assert events == {9001: "PROCESSED", 9002: "PROCESSED"}
+
+        assert settled == [trans_id]
+        assert db.get(PaymentTransaction, trans_id).status == "Success"
+        assert [status for status, in db.query(Bill.status).filter(Bill.billID.in_(bill_ids))] == ["Paid"] * 3
+        assert db.query(Notification).filter(Notification.type == "PAYMENT_RESULT").count() == 1
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def failing_settle(monkeypatch):
+    """Lần gạch nợ đầu tiên gặp lỗi khóa của DB"""
+    settle = BillSettlementService.settle
+    calls = []
+
+    def flaky(session, trans_id):
+        calls.append(trans_id)
+        if len(calls) == 1:
+            raise OperationalError("UPDATE BILL", {}, Exception("Lock wait timeout exceeded"))
+        return settle(session, trans_id)
+
+    monkeypatch.setattr(BillSettlementService, "settle", staticmethod(flaky))
+    return calls
+
+
+def open_transaction(db) -> tuple[int, list[int]]:
+    apartment_id, = seed_apartments(db, apartments=1)
+    bill_ids = seed_bills(db, apartment_id, [100000, 250000])
+    resident_id = db.query(Resident.residentID).scalar()
+    return PaymentService.create_qr_transaction(db, resident_id, bill_ids)["transaction_id"], bill_ids
+
+
+def test_db_error_marks_failed_and_retries_with_backoff(db, failing_settle):
+    trans_id, bill_ids = open_transaction(db)
+    SepayWebhookService.receive(db, payload(9101, f"BM{trans_id}", 350000))
+
+    assert SepayWebhookService.claim_batch(db) == [9101]
+    assert SepayWebhookService.process_event(db, 9101) == "FAILED"
+    event = db.get(SepayWebhookEvent, 9101)
+    assert event.attempts == 1 and "Lock wait timeout" in event.result
+    assert event.nextAttemptAt > datetime.now()
+    # Lỗi được rollback: giao dịch vẫn chờ thanh toán, chưa tới lượt thử lại thì không được nhận
+    assert db.get(PaymentTransaction, trans_id).status == "Pending"
+    assert SepayWebhookService.claim_batch(db) == []
+
+    db.query(SepayWebhookEvent).update({SepayWebhookEvent.nextAttemptAt: datetime.now() - timedelta(seconds=1)})
+    db.commit()
+    assert SepayWebhookService.claim_batch(db) == [9101]
+    assert SepayWebhookService.process_event(db, 9101) == "PROCESSED"
+    db.expire_all()
+    assert db.get(PaymentTransaction, trans_id).status == "Success"
+    assert [status for status, in db.query(Bill.status).filter(Bill.billID.in_(bill_ids))] == ["Paid"] * 2
+
+
+def test_retry_delay_doubles_and_stops_after_max_attempts(db, monkeypatch):
+    assert SepayWebhookService.retry_delay(2) == 2 * SepayWebhookService.retry_delay(1)
+    assert SepayWebhookService.retry_delay(50) == SepayWebhookService.retry_delay(MAX_ATTEMPTS + 5)
+
+    monkeypatch.setattr(PaymentService, "process_sepay_webhook", staticmethod(
+        lambda **kwargs: (_ for _ in ()).throw(OperationalError("SELECT", {}, Exception("gone away")))
+    ))
+    SepayWebhookService.receive(db, payload(9102, "BM1", 1000))
+    db.query(SepayWebhookEvent).update({
+        SepayWebhookEvent.status: "PROCESSING", SepayWebhookEvent.attempts: MAX_ATTEMPTS - 1
+    })
+    db.commit()
+    assert SepayWebhookService.process_event(db, 9102) == "FAILED"
+    event = db.get(SepayWebhookEvent, 9102)
+    assert (event.attempts, event.nextAttemptAt) == (MAX_ATTEMPTS, None)
+    assert SepayWebhookService.claim_batch(db) == []
+
+
+def test_reconciliation_requeues_failed_webhooks(db, failing_settle):
+    trans_id, _ = open_transaction(db)
+    data = payload(9103, f"BM{trans_id} thanh toan", 350000)
+    SepayWebhookService.receive(db, data)
+    SepayWebhookService.claim_batch(db)
+    assert SepayWebhookService.process_event(db, 9103) == "FAILED"
+
+    line = {
+        "id": data["id"], "bank_brand_name": data["gateway"], "transaction_date": data["transactionDate"],
+        "account_number": data["accountNumber"], "transaction_content": data["content"],
+        "amount_in": str(data["transferAmount"]), "amount_out": "0", "accumulated": "0",
+        "reference_number": data["referenceCode"],
+    }
+    result = SepayReconciliationService.run(db, lines=[line])
+    assert result["enqueued_lines"] == 1
+    db.expire_all()
+    assert db.get(SepayWebhookEvent, 9103).status == "RECEIVED"
+
+    assert SepayWebhookService.claim_batch(db) == [9103]
+    assert SepayWebhookService.process_event(db, 9103) == "PROCESSED"
+    db.expire_all()
+    assert db.get(PaymentTransaction, trans_id).status == "Success"
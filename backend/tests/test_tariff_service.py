@@ -0,0 +1,56 @@
+"""Cache biểu giá phải nhận ra mọi lần sửa, kể cả hai lần sửa trong cùng một giây"""
+import datetime as dt
+
+import pytest
+
+from backend.app.schemas.tariff import TariffScheduleCreate
+from backend.app.services.tariff_service import TariffService
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache():
+    TariffService.invalidate()
+    yield
+    TariffService.invalidate()
+
+
+def _schedule(price: int) -> TariffScheduleCreate:
+    return TariffScheduleCreate(
+        tariffType="WATER",
+        effectiveFrom=dt.date(2026, 1, 1),
+        tiers=[{"limit": 10, "price": price}, {"limit": None, "price": 27000}],
+        surchargePercent=15
+    )
+
+
+def _water_price(db) -> int:
+    snapshot = TariffService.snapshot(db)
+    _, tariff = TariffService.resolve(snapshot, "WATER", None, dt.date(2026, 2, 1))
+    return tariff.tiers[0][1]
+
+
+def test_edit_from_another_process_in_same_second_is_picked_up(db, monkeypatch):
+    # DATETIME của MySQL chỉ chính xác tới giây: cả hai lần sửa cùng một updatedAt
+    same_second = dt.datetime(2026, 1, 1, 8, 0, 0)
+    schedule = TariffService.upsert_schedule(db, _schedule(8500))
+    schedule.updatedAt = same_second
+    db.commit()
+    assert _water_price(db) == 8500
+
+    # Process khác sửa: process này không được gọi invalidate()
+    monkeypatch.setattr(TariffService, "invalidate", staticmethod(lambda: None))
+    schedule = TariffService.upsert_schedule(db, _schedule(9000))
+    schedule.updatedAt = same_second
+    db.commit()
+
+    assert schedule.revision == 2
+    assert _water_price(db) == 9000
+
+
+def test_unchanged_stamp_reuses_snapshot(db, count_queries):
+    TariffService.upsert_schedule(db, _schedule(8500))
+    first = TariffService.snapshot(db)
+
+    with count_queries() as statements:
+        assert TariffService.snapshot(db) is first
+    assert len(statements) == 1
@@ -0,0 +1,69 @@
+"""TieredTariff.cost_many phải khớp tuyệt đối với bản tham chiếu Decimal tính từng chỉ số"""
+import random
+import time
+from decimal import Decimal
+
+import pytest
+
+from backend.app.services.accounting_services import AccountingService
+from backend.app.utils.tariff_utils import ELECTRICITY_TARIFF, WATER_TARIFF, TieredTariff
+
+CASES = [
+    (ELECTRICITY_TARIFF, AccountingService.calculate_electricity_cost),
+    (WATER_TARIFF, AccountingService.calculate_water_cost),
+]
+
+
+def _readings(count: int, upper: int, seed: int = 2026) -> list[Decimal]:
+    """Chỉ số ngẫu nhiên 2 chữ số thập phân, kèm các mốc bậc và giá trị biên"""
+    rng = random.Random(seed)
+    values = [Decimal(rng.randrange(0, upper * 100)) / 100 for _ in range(count)]
+    values += [Decimal(v) for v in (0, 1, 10, 20, 30, 50, 100, 200, 300, 400, 401)]
+    values += [Decimal("-3"), Decimal("0.01"), Decimal("49.99"), Decimal("50.01"), Decimal("81.71")]
+    return values
+
+
+@pytest.mark.parametrize("tariff, reference", CASES)
+def test_cost_many_matches_reference(tariff, reference):
+    values = _readings(20000, 600)
+    expected = [int(reference(v)) for v in values]
+    assert tariff.cost_many(values) == expected
+
+
+@pytest.mark.parametrize("tariff, reference", CASES)
+def test_cost_many_accepts_mixed_precision(tariff, reference):
+    # Một mảng gồm số nguyên, float và Decimal nhiều chữ số thập phân
+    values = [12, 57.5, Decimal("123.456"), Decimal("0.005"), 250.25]
+    assert tariff.cost_many(values) == [int(reference(v)) for v in values]
+    assert [tariff.cost(v) for v in values] == tariff.cost_many(values)
+
+
+def test_cost_many_empty():
+    assert ELECTRICITY_TARIFF.cost_many([]) == []
+
+
+def test_invalid_tiers():
+    with pytest.raises(ValueError):
+        TieredTariff([], surcharge_percent=0)
+    with pytest.raises(ValueError):
+        TieredTariff([(None, 100), (10, 200)], surcharge_percent=0)
+    with pytest.raises(ValueError):
+        TieredTariff([(1.5, 100), (None, 200)], surcharge_percent=0)
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("tariff, reference", CASES)
+def test_benchmark_one_million_readings(tariff, reference):
+    values = _readings(1_000_000, 600)
+
+    started = time.perf_counter()
+    batch = tariff.cost_many(values)
+    batch_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    expected = [int(reference(v)) for v in values]
+    reference_seconds = time.perf_counter() - started
+
+    print(f"\n{len(values)} chỉ số: cost_many {batch_seconds:.2f}s, từng chỉ số {reference_seconds:.2f}s")
+    assert batch == expected
+    assert batch_seconds < reference_seconds
@@ -7,7 +7,8 @@ USE ApartmentManagement;
 CREATE TABLE IF NOT EXISTS ACCOUNT (
     username VARCHAR(50) PRIMARY KEY,
     password VARCHAR(255) NOT NULL,
-    role VARCHAR(20)
+    role VARCHAR(20),
+    principalChangedAt DATETIME NULL
 );
 
 -- BUILDING_MANAGER
@@ -69,6 +70,8 @@ CREATE TABLE IF NOT EXISTS BILL (
     total DECIMAL(18, 0),
     status VARCHAR(20),
     paymentMethod VARCHAR(50),
+    inputHash VARCHAR(40) NULL,
+    reservedTransID INT NULL,
     FOREIGN KEY (apartmentID) REFERENCES APARTMENT(apartmentID),
     FOREIGN KEY (accountantID) REFERENCES ACCOUNTANT(accountantID)
 );
@@ -129,6 +132,8 @@ CREATE INDEX IDX_BILL_DEADLINE ON BILL(deadline);
 CREATE INDEX IDX_BILL_CREATEDATE ON BILL(createDate);
 CREATE INDEX IDX_PAYMENTTX_STATUS ON PAYMENT_TRANSACTION(status);
 CREATE INDEX IDX_PAYMENTTX_CREATEDDATE ON PAYMENT_TRANSACTION(createdDate);
+CREATE INDEX IDX_PAYMENTTX_RESIDENT_CREATED ON PAYMENT_TRANSACTION(residentID, createdDate, transID);
+CREATE INDEX IDX_PAYMENTTX_STATUS_CREATED ON PAYMENT_TRANSACTION(status, createdDate);
 
 -- Tối ưu tra cứu theo username
 CREATE INDEX IDX_BUILDINGMANAGER_USERNAME ON BUILDING_MANAGER(username);
@@ -143,3 +148,173 @@ CREATE UNIQUE INDEX UQ_RESIDENT_USERNAME ON RESIDENT(username);
 
 -- Tránh lặp cùng 1 bill trong cùng 1 giao dịch
 CREATE UNIQUE INDEX UQ_TXDETAIL_TRANS_BILL ON TRANSACTION_DETAIL(transID, billID);
+
+-- =============================
+-- BIỂU GIÁ BẬC THANG (điện, nước) theo ngày hiệu lực
+-- =============================
+CREATE TABLE IF NOT EXISTS TARIFF_SCHEDULE (
+    scheduleID INT AUTO_INCREMENT PRIMARY KEY,
+    tariffType VARCHAR(20) NOT NULL,
+    buildingID VARCHAR(10) NULL,
+    effectiveFrom DATE NOT NULL,
+    tiers TEXT NOT NULL,
+    surchargePercent DECIMAL(5, 2) NOT NULL DEFAULT 0,
+    revision INT NOT NULL DEFAULT 1,
+    updatedAt DATETIME DEFAULT CURRENT_TIMESTAMP() ON UPDATE CURRENT_TIMESTAMP(),
+    FOREIGN KEY (buildingID) REFERENCES BUILDING(buildingID),
+    CONSTRAINT UQ_TARIFF_TYPE_BUILDING_DATE UNIQUE (tariffType, buildingID, effectiveFrom)
+);
+CREATE INDEX IDX_TARIFF_BUILDINGID ON TARIFF_SCHEDULE(buildingID);
+
+-- =============================
+-- HÀNG ĐỢI JOB TÍNH HÓA ĐƠN
+-- =============================
+CREATE TABLE IF NOT EXISTS BILLING_JOB (
+    jobID INT AUTO_INCREMENT PRIMARY KEY,
+    month INT NOT NULL,
+    year INT NOT NULL,
+    deadlineDay INT NOT NULL DEFAULT 10,
+    overwrite TINYINT(1) NOT NULL DEFAULT 0,
+    accountantID INT,
+    buildingIDs TEXT NULL,
+    sharded TINYINT(1) NOT NULL DEFAULT 0,
+    status VARCHAR(20) NOT NULL DEFAULT 'QUEUED',
+    cancelRequested TINYINT(1) NOT NULL DEFAULT 0,
+    totalApartments INT DEFAULT 0,
+    processedApartments INT DEFAULT 0,
+    billsCreated INT DEFAULT 0,
+    lastApartmentID VARCHAR(10) NULL,
+    error TEXT NULL,
+    report TEXT NULL,
+    createdDate DATETIME DEFAULT CURRENT_TIMESTAMP(),
+    startedDate DATETIME NULL,
+    finishedDate DATETIME NULL,
+    heartbeatAt DATETIME NULL,
+    FOREIGN KEY (accountantID) REFERENCES ACCOUNTANT(accountantID)
+);
+CREATE INDEX IDX_BILLINGJOB_STATUS ON BILLING_JOB(status);
+
+-- =============================
+-- CHỈ SỐ ĐIỆN NƯỚC MỚI NHẤT MỖI CĂN HỘ
+-- =============================
+CREATE TABLE IF NOT EXISTS METER_READING_LATEST (
+    apartmentID VARCHAR(10) PRIMARY KEY,
+    month INT NOT NULL,
+    year INT NOT NULL,
+    oldElectricity DECIMAL(10, 2) NOT NULL DEFAULT 0,
+    newElectricity DECIMAL(10, 2) NOT NULL DEFAULT 0,
+    oldWater DECIMAL(10, 2) NOT NULL DEFAULT 0,
+    newWater DECIMAL(10, 2) NOT NULL DEFAULT 0,
+    updatedAt DATETIME DEFAULT CURRENT_TIMESTAMP() ON UPDATE CURRENT_TIMESTAMP(),
+    FOREIGN KEY (apartmentID) REFERENCES APARTMENT(apartmentID)
+);
+
+-- =============================
+-- THÔNG BÁO RIÊNG CỦA CƯ DÂN
+-- =============================
+CREATE TABLE IF NOT EXISTS NOTIFICATION (
+    notificationID INT AUTO_INCREMENT PRIMARY KEY,
+    residentID INT NOT NULL,
+    title VARCHAR(200) NOT NULL,
+    content TEXT NULL,
+    type VARCHAR(50) NOT NULL,
+    relatedID INT NULL,
+    isRead TINYINT(1) DEFAULT 0,
+    createdDate DATETIME DEFAULT CURRENT_TIMESTAMP(),
+    electricity DECIMAL(10, 2) NULL,
+    water DECIMAL(10, 2) NULL,
+    FOREIGN KEY (residentID) REFERENCES RESIDENT(residentID)
+);
+-- Đếm chưa đọc / đối soát bộ đếm theo cư dân
+CREATE INDEX IDX_NOTIFICATION_RESIDENT_READ ON NOTIFICATION(residentID, isRead);
+-- Phân trang keyset danh sách thông báo (createdDate, notificationID) giảm dần
+CREATE INDEX IDX_NOTIFICATION_RESIDENT_CREATED ON NOTIFICATION(residentID, createdDate, notificationID);
+
+-- =============================
+-- THÔNG BÁO CHUNG (LƯU 1 LẦN) + ĐÁNH DẤU ĐÃ ĐỌC
+-- =============================
+CREATE TABLE IF NOT EXISTS NOTIFICATION_BROADCAST (
+    broadcastID INT AUTO_INCREMENT PRIMARY KEY,
+    title VARCHAR(200) NOT NULL,
+    content TEXT NULL,
+    createdDate DATETIME DEFAULT CURRENT_TIMESTAMP()
+);
+CREATE INDEX IDX_BROADCAST_CREATEDDATE ON NOTIFICATION_BROADCAST(createdDate);
+
+CREATE TABLE IF NOT EXISTS NOTIFICATION_BROADCAST_READ (
+    residentID INT NOT NULL,
+    broadcastID INT NOT NULL,
+    readDate DATETIME DEFAULT CURRENT_TIMESTAMP(),
+    PRIMARY KEY (residentID, broadcastID),
+    FOREIGN KEY (residentID) REFERENCES RESIDENT(residentID),
+    FOREIGN KEY (broadcastID) REFERENCES NOTIFICATION_BROADCAST(broadcastID)
+);
+
+-- =============================
+-- BỘ ĐẾM THÔNG BÁO CHƯA ĐỌC
+-- =============================
+CREATE TABLE IF NOT EXISTS NOTIFICATION_COUNTER (
+    residentID INT PRIMARY KEY,
+    unreadCount INT NOT NULL DEFAULT 0,
+    broadcastReadCount INT NOT NULL DEFAULT 0,
+    updatedAt DATETIME DEFAULT CURRENT_TIMESTAMP() ON UPDATE CURRENT_TIMESTAMP(),
+    FOREIGN KEY (residentID) REFERENCES RESIDENT(residentID)
+);
+
+-- =============================
+-- LƯU TRỮ THÔNG BÁO ĐÃ ĐỌC QUÁ HẠN
+-- Không khóa ngoại, createdDate nằm trong khóa chính để có thể chia partition theo tháng
+-- (NOTIFICATION_ARCHIVE_PARTITIONS=1, job lưu trữ tự thêm partition pYYYYMM).
+-- =============================
+CREATE TABLE IF NOT EXISTS NOTIFICATION_ARCHIVE (
+    notificationID INT NOT NULL,
+    createdDate DATETIME NOT NULL,
+    residentID INT NOT NULL,
+    title VARCHAR(200) NOT NULL,
+    content TEXT NULL,
+    type VARCHAR(50) NOT NULL,
+    relatedID INT NULL,
+    electricity DECIMAL(10, 2) NULL,
+    water DECIMAL(10, 2) NULL,
+    archivedDate DATETIME DEFAULT CURRENT_TIMESTAMP(),
+    PRIMARY KEY (notificationID, createdDate)
+) ROW_FORMAT=COMPRESSED;
+CREATE INDEX IDX_NOTIFICATION_ARCHIVE_RESIDENT_CREATED ON NOTIFICATION_ARCHIVE(residentID, createdDate, notificationID);
+CREATE INDEX IDX_NOTIFICATION_ARCHIVE_CREATEDDATE ON NOTIFICATION_ARCHIVE(createdDate);
+
+-- =============================
+-- INBOX WEBHOOK SEPAY (CHỐNG XỬ LÝ TRÙNG, WORKER GẠCH NỢ BẤT ĐỒNG BỘ)
+-- =============================
+CREATE TABLE IF NOT EXISTS SEPAY_WEBHOOK_EVENT (
+    sepayID BIGINT PRIMARY KEY,
+    payload TEXT NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'RECEIVED',
+    transID INT NULL,
+    result VARCHAR(255) NULL,
+    receivedDate DATETIME DEFAULT CURRENT_TIMESTAMP(),
+    claimedAt DATETIME NULL,
+    processedDate DATETIME NULL,
+    attempts INT NOT NULL DEFAULT 0,
+    nextAttemptAt DATETIME NULL
+);
+CREATE INDEX IDX_SEPAYEVENT_STATUS_RECEIVED ON SEPAY_WEBHOOK_EVENT(status, receivedDate);
+CREATE INDEX IDX_SEPAYEVENT_STATUS_NEXTATTEMPT ON SEPAY_WEBHOOK_EVENT(status, nextAttemptAt);
+
+-- =============================
+-- ĐỐI SOÁT SAO KÊ SEPAY
+-- =============================
+CREATE TABLE IF NOT EXISTS SEPAY_RECONCILIATION (
+    runID INT AUTO_INCREMENT PRIMARY KEY,
+    sinceID BIGINT NULL,
+    lastID BIGINT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'RUNNING',
+    fetchedLines INT DEFAULT 0,
+    matchedLines INT DEFAULT 0,
+    enqueuedLines INT DEFAULT 0,
+    discrepancies INT DEFAULT 0,
+    report TEXT NULL,
+    error TEXT NULL,
+    startedDate DATETIME DEFAULT CURRENT_TIMESTAMP(),
+    finishedDate DATETIME NULL
+);
+CREATE INDEX IDX_SEPAYRECON_STATUS ON SEPAY_RECONCILIATION(status);
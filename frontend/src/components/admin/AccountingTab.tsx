@@ -340,8 +340,16 @@ export function AccountingTab({ role }: AccountingTabProps) {
   const handleCalculateBills = async () => {
     setProcessingCalculation(true);
     try {
-      const result = await api.accounting.calculateBills(calculateRequest);
-      toast.success(`${result.message}. Đã tạo ${result.count} hóa đơn`);
+      const { job_id } = await api.accounting.calculateBills(calculateRequest);
+      let job = await api.accounting.getBillingJob(job_id);
+      while (job.status === "QUEUED" || job.status === "RUNNING") {
+        await new Promise((resolve) => setTimeout(resolve, 1000));
+        job = await api.accounting.getBillingJob(job_id);
+      }
+      if (job.status !== "SUCCEEDED") {
+        throw new Error(job.error || "Lượt tính hóa đơn đã bị hủy");
+      }
+      toast.success(`Đã tạo ${job.bills_created} hóa đơn và gửi thông báo`);
       setShowCalculateModal(false);
     } catch (error: any) {
       toast.error(error.message || "Không thể tính toán hóa đơn");
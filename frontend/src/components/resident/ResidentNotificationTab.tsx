@@ -13,8 +13,8 @@ export function ResidentNotificationTab() {
   const [unreadCount, setUnreadCount] = useState(0);
   const [filter, setFilter] = useState<"all" | "unread">("all");
 
-  const fetchNotifications = async () => {
-    setLoading(true);
+  const fetchNotifications = async (silent: boolean = false) => {
+    if (!silent) setLoading(true);
     try {
       const data = await api.notifications.getMyNotifications(0, 100);
       setNotifications(data);
@@ -31,6 +31,16 @@ export function ResidentNotificationTab() {
 
   useEffect(() => {
     fetchNotifications();
+
+    // Nhận thông báo mới qua SSE thay vì poll
+    const unsubscribe = api.notifications.subscribe(
+      (notification) => {
+        if (notification.title) toast.info(notification.title);
+        fetchNotifications(true);
+      },
+      () => fetchNotifications(true),
+    );
+    return unsubscribe;
   }, []);
 
   const handleMarkAsRead = async (id: number) => {
@@ -51,16 +61,12 @@ export function ResidentNotificationTab() {
 
   const handleMarkAllAsRead = async () => {
     try {
-      const unreadNotifications = notifications.filter(n => !n.isRead);
-
-      // Mark all unread notifications as read
-      await Promise.all(
-        unreadNotifications.map(n => api.notifications.markAsRead(n.notificationID))
-      );
+      // One bulk request instead of one request per unread notification
+      const result = await api.notifications.markAllAsRead();
 
       // Update local state
       setNotifications(notifications.map(n => ({ ...n, isRead: true })));
-      setUnreadCount(0);
+      setUnreadCount(result.count);
 
       toast.success("Đã đánh dấu tất cả là đã đọc");
     } catch (error: any) {
@@ -122,7 +128,7 @@ export function ResidentNotificationTab() {
           </p>
         </div>
         <Button
-          onClick={fetchNotifications}
+          onClick={() => fetchNotifications()}
           variant="outline"
           className="gap-2 cursor-pointer"
         >
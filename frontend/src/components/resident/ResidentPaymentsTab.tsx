@@ -59,11 +59,11 @@ export function ResidentPaymentsTab() {
   const loadData = async () => {
     try {
       const [paymentData, billData] = await Promise.all([
-        api.payments.getMyHistory(),
+        api.payments.getMyHistory(10),
         api.bills.getMyBills(),
       ]);
 
-      setPayments(paymentData.slice(0, 10));
+      setPayments(paymentData);
       setUnpaidBills(
         billData.filter((b) => b.status === "Unpaid" || b.status === "Overdue"),
       );
@@ -1,6 +1,15 @@
 // API Configuration - Update this to point to your Python backend
 const API_BASE_URL = "http://localhost:8000/api";
 
+// Backend-served assets (e.g. payment QR images) come back as "/api/..." paths
+const resolveApiUrl = (url: string): string =>
+  url.startsWith("/") ? new URL(url, API_BASE_URL).toString() : url;
+
+const withResolvedQr = (response: QRCodeResponse): QRCodeResponse => ({
+  ...response,
+  qr_url: resolveApiUrl(response.qr_url),
+});
+
 // ==================== TYPE DEFINITIONS ====================
 
 // Auth Types
@@ -237,6 +246,21 @@ export interface CalculateBillsRequest {
   year: number;
   deadline_day?: number;
   overwrite?: boolean;
+  building_ids?: string[];
+  sharded?: boolean;
+}
+
+export interface BillingJob {
+  job_id: number;
+  month: number;
+  year: number;
+  building_ids: string[] | null;
+  status: "QUEUED" | "RUNNING" | "SUCCEEDED" | "FAILED" | "CANCELLED";
+  cancel_requested: boolean;
+  total_apartments: number;
+  processed_apartments: number;
+  bills_created: number;
+  error: string | null;
 }
 
 export interface VerifyTransactionResponse {
@@ -547,14 +571,22 @@ export const api = {
       return fetchApi<QRCodeResponse>("/online-payments/create-qr", {
         method: "POST",
         body: JSON.stringify({ bill_ids: billIds }),
-      });
+      }).then(withResolvedQr);
     },
 
     // Get payment history for current user
-    getMyHistory: async (): Promise<PaymentTransaction[]> => {
-      return fetchApi<PaymentTransaction[]>("/payments/my-history", {
-        method: "GET",
-      });
+    getMyHistory: async (
+      limit: number = 50,
+      cursor?: string,
+    ): Promise<PaymentTransaction[]> => {
+      const params = new URLSearchParams({ limit: String(limit) });
+      if (cursor) params.append("cursor", cursor);
+      return fetchApi<PaymentTransaction[]>(
+        `/payments/my-history?${params.toString()}`,
+        {
+          method: "GET",
+        },
+      );
     },
   },
 
@@ -570,7 +602,7 @@ export const api = {
           method: "POST",
           body: JSON.stringify({ bill_ids: billIds }),
         },
-      );
+      ).then(withResolvedQr);
     },
 
     verifyTransaction: async (
@@ -618,6 +650,39 @@ export const api = {
       });
     },
 
+    // Mark all notifications as read; returns the new unread count
+    markAllAsRead: async (): Promise<{ message: string; count: number }> => {
+      return fetchApi<{ message: string; count: number }>(
+        "/notification/read-all",
+        {
+          method: "PUT",
+        },
+      );
+    },
+
+    // Mark a list of notifications as read (negative ids are broadcasts)
+    markManyAsRead: async (
+      ids: number[],
+    ): Promise<{ message: string; count: number }> => {
+      return fetchApi<{ message: string; count: number }>("/notification/read", {
+        method: "PUT",
+        body: JSON.stringify({ ids }),
+      });
+    },
+
+    // Mark everything up to (and including) a feed cursor as read
+    markReadUpTo: async (
+      cursor: string,
+    ): Promise<{ message: string; count: number }> => {
+      return fetchApi<{ message: string; count: number }>(
+        "/notification/read-up-to",
+        {
+          method: "PUT",
+          body: JSON.stringify({ cursor }),
+        },
+      );
+    },
+
     // Get unread count
     getUnreadCount: async (): Promise<{ count: number }> => {
       return fetchApi<{ count: number }>("/notification/unread-count", {
@@ -625,6 +690,24 @@ export const api = {
       });
     },
 
+    // Subscribe to realtime notifications (Server-Sent Events); returns unsubscribe
+    subscribe: (
+      onNotification: (notification: Partial<Notification>) => void,
+      onResync: () => void,
+    ): (() => void) => {
+      const token = getAuthToken();
+      if (!token) return () => {};
+      const source = new EventSource(
+        `${API_BASE_URL}/notification/stream?token=${encodeURIComponent(token)}`,
+      );
+      source.addEventListener("notification", (event) => {
+        const data = JSON.parse((event as MessageEvent).data);
+        onNotification(data.notification);
+      });
+      source.addEventListener("resync", () => onResync());
+      return () => source.close();
+    },
+
     // Broadcast notification (Manager/Admin only)
     broadcast: async (
       notification: BroadcastNotification,
@@ -671,11 +754,11 @@ export const api = {
       );
     },
 
-    // Calculate monthly bills
+    // Calculate monthly bills (enqueue a billing job)
     calculateBills: async (
       data: CalculateBillsRequest,
-    ): Promise<{ status: string; message: string; count: number }> => {
-      return fetchApi<{ status: string; message: string; count: number }>(
+    ): Promise<{ status: string; message: string; job_id: number }> => {
+      return fetchApi<{ status: string; message: string; job_id: number }>(
         "/accounting/bills/calculate",
         {
           method: "POST",
@@ -684,6 +767,13 @@ export const api = {
       );
     },
 
+    // Get billing job progress
+    getBillingJob: async (jobId: number): Promise<BillingJob> => {
+      return fetchApi<BillingJob>(`/accounting/bills/jobs/${jobId}`, {
+        method: "GET",
+      });
+    },
+
     getManualBill: async (
       billCreateData: BillCreate,
     ): Promise<{ message: string; billID: number }> => {